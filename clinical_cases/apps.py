@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class ClinicalCasesConfig(AppConfig):
     name = 'clinical_cases'
+
+    def ready(self):
+        from django.db.models.signals import post_save, post_delete
+        from .models import ClinicalCase
+        from .catalog_cache import bump_catalog_version
+        # Toute modification d'un cas invalide le cache du catalogue
+        post_save.connect(bump_catalog_version, sender=ClinicalCase, dispatch_uid='catalog_cache_save')
+        post_delete.connect(bump_catalog_version, sender=ClinicalCase, dispatch_uid='catalog_cache_delete')
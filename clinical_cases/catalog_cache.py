@@ -0,0 +1,29 @@
+"""
+Cache des réponses du catalogue (liste et détail des cas), partagé entre workers.
+Les clés portent une version du catalogue, renouvelée à chaque création / modification /
+suppression d'un cas : les anciennes entrées ne sont plus lues et sortent par éviction.
+"""
+import uuid
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = 'catalog:version'
+
+
+def catalog_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_catalog_version(**kwargs):
+    """Receveur post_save / post_delete de ClinicalCase."""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def cached_response_data(name, compute):
+    """Données sérialisées d'une vue du catalogue, calculées une seule fois pour tous les workers."""
+    key = f"catalog:{catalog_version()}:{name}"
+    return cache.get_or_set(key, compute, getattr(settings, 'CATALOG_CACHE_TIMEOUT', 600))
@@ -1,9 +1,12 @@
 from rest_framework import generics
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from config.db_router import ReadReplicaMixin
+from .catalog_cache import cached_response_data
 from .models import ClinicalCase
 from .serializers import ClinicalCaseListSerializer, ClinicalCaseDetailSerializer
 
-class ClinicalCaseListView(generics.ListAPIView):
+class ClinicalCaseListView(ReadReplicaMixin, generics.ListAPIView):
     """
     Retourne la liste des cas disponibles pour le Dashboard.
     Peut être filtré par ?specialty=Cardiologie
@@ -35,11 +38,23 @@ class ClinicalCaseListView(generics.ListAPIView):
             
         return queryset
 
-class ClinicalCaseDetailView(generics.RetrieveAPIView):
+    def list(self, request, *args, **kwargs):
+        # Même réponse pour tous les utilisateurs : servie depuis le cache partagé
+        specialty = request.query_params.get('specialty', '').lower()
+        parent_list = super().list
+        data = cached_response_data(f"list:{specialty}", lambda: list(parent_list(request, *args, **kwargs).data))
+        return Response(data)
+
+class ClinicalCaseDetailView(ReadReplicaMixin, generics.RetrieveAPIView):
     """
     Retourne le détail complet d'un cas via son UUID pour la Simulation.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = ClinicalCaseDetailSerializer
     lookup_field = 'uuid'
-    queryset = ClinicalCase.objects.filter(is_active=True)
\ No newline at end of file
+    queryset = ClinicalCase.objects.filter(is_active=True)
+
+    def retrieve(self, request, *args, **kwargs):
+        parent_retrieve = super().retrieve
+        data = cached_response_data(f"detail:{kwargs['uuid']}", lambda: dict(parent_retrieve(request, *args, **kwargs).data))
+        return Response(data)
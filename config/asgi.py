@@ -3,14 +3,52 @@ ASGI config for config project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Mode de déploiement recommandé (vues async du simulateur : un appel Gemini lent n'occupe plus
+un worker entier) :
+
+    uvicorn config.asgi:application --host 0.0.0.0 --port $PORT --workers 2
+
+Le protocole `lifespan` crée au démarrage de chaque worker les ressources partagées (client LLM,
+caches, cf. simulation/resources.py) et les ferme à l'arrêt.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
+import logging
 
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from simulation.resources import worker_resources  # noqa: E402  (après le chargement des apps)
+
+logger = logging.getLogger(__name__)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await worker_resources.startup()
+            except Exception as e:
+                logger.error(f"Échec du démarrage du worker : {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await worker_resources.shutdown()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    # Django ne gère pas le lifespan : on le traite ici, le reste est délégué
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -0,0 +1,278 @@
+"""
+Cache partagé par tous les workers d'un nœud : backend Django adossé à un fichier SQLite
+(par défaut dans /dev/shm, donc en mémoire partagée), en WAL + mmap.
+
+- Les valeurs sont des pickles : quiconque peut écrire dans le fichier exécute du code dans les
+  workers. Le répertoire est créé en 0700, le fichier en 0600, et le backend refuse de démarrer
+  si l'un des deux appartient à un autre utilisateur ou est modifiable par le groupe / les autres.
+
+- Taille bornée : MAX_SIZE octets (valeurs sérialisées), MAX_ENTRIES entrées ; au-delà,
+  éviction des entrées expirées puis des moins récemment lues (LRU approché : l'horodatage de
+  lecture n'est réécrit qu'une fois par seconde et par clé).
+- Anti-stampede : get_or_set() est single-flight entre threads ET entre workers. Le premier
+  appelant prend un bail (table `leases`) et calcule ; les autres attendent la valeur au lieu
+  de relancer le même calcul (ex. même réponse LLM demandée par N requêtes simultanées).
+- Compatible avec l'API de cache Django (get/set/add/delete/incr/touch/clear/get_or_set...).
+"""
+import os
+import time
+import pickle
+import sqlite3
+import threading
+from pathlib import Path
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+from django.core.exceptions import ImproperlyConfigured
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires REAL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+CREATE INDEX IF NOT EXISTS entries_expires ON entries (expires);
+CREATE TABLE IF NOT EXISTS stats (id INTEGER PRIMARY KEY CHECK (id = 1), total_size INTEGER NOT NULL, nb_entries INTEGER NOT NULL);
+INSERT OR IGNORE INTO stats VALUES (1, 0, 0);
+CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires REAL NOT NULL);
+"""
+
+# Calculs en cours dans ce process, par clé. Au niveau du module : Django crée une instance de
+# backend par thread, le verrou doit être commun à toutes.
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class SharedSQLiteCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.path = Path(location)
+        self.max_size = int(options.get('MAX_SIZE', 64 * 1024 * 1024))
+        self.max_entries = int(options.get('MAX_ENTRIES', 50_000))
+        self.lease_seconds = float(options.get('LEASE_SECONDS', 30))   # Durée max d'un calcul single-flight
+        self.busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._local = threading.local()
+
+    # --- Connexions (une par thread, le fichier est partagé entre process) ---
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            # Nouvelle connexion aussi après un fork (gunicorn --preload) : jamais partagée entre process
+            self._secure_location()
+            conn = sqlite3.connect(str(self.path), timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # Cache : la durabilité n'est pas requise
+            conn.execute("PRAGMA mmap_size=268435456")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _secure_location(self):
+        """Crée le répertoire (0700) et le fichier (0600), puis vérifie propriétaire et droits."""
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        os.close(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600))
+        for target in (self.path.parent, self.path):
+            st = target.stat()
+            if st.st_uid != os.getuid() or st.st_mode & 0o022:
+                raise ImproperlyConfigured(
+                    f"Cache partagé : {target} doit appartenir à l'utilisateur courant et ne pas être "
+                    f"modifiable par le groupe ou les autres (propriétaire {st.st_uid}, droits {oct(st.st_mode & 0o777)})"
+                )
+
+    def _write(self, func):
+        """Exécute func(conn) dans une transaction d'écriture (verrou pris d'emblée)."""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(conn)
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+        return result
+
+    # --- Primitives ---
+
+    def _store(self, conn, key, value, timeout, only_if_missing=False):
+        now = time.time()
+        row = conn.execute("SELECT size, expires FROM entries WHERE key = ?", (key,)).fetchone()
+        if row and only_if_missing and (row[1] is None or row[1] > now):
+            return False
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        expires = self.get_backend_timeout(timeout)
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (key, value, size, expires, accessed) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), expires, now)
+        )
+        old_size, added = (row[0], 0) if row else (0, 1)
+        conn.execute("UPDATE stats SET total_size = total_size + ?, nb_entries = nb_entries + ? WHERE id = 1",
+                     (len(data) - old_size, added))
+        self._cull(conn, now)
+        return True
+
+    def _remove(self, conn, key):
+        row = conn.execute("DELETE FROM entries WHERE key = ? RETURNING size", (key,)).fetchone()
+        if row:
+            conn.execute("UPDATE stats SET total_size = total_size - ?, nb_entries = nb_entries - 1 WHERE id = 1",
+                         (row[0],))
+        return row is not None
+
+    def _cull(self, conn, now):
+        total_size, nb_entries = conn.execute("SELECT total_size, nb_entries FROM stats WHERE id = 1").fetchone()
+        if total_size <= self.max_size and nb_entries <= self.max_entries:
+            return
+        # Expirées d'abord, puis LRU jusqu'à 90 % des limites (évite de purger à chaque écriture)
+        freed = conn.execute("DELETE FROM entries WHERE expires IS NOT NULL AND expires <= ? RETURNING size",
+                             (now,)).fetchall()
+        total_size -= sum(r[0] for r in freed)
+        nb_entries -= len(freed)
+        victims = []
+        for key, size in conn.execute("SELECT key, size FROM entries ORDER BY accessed"):
+            if total_size <= self.max_size * 0.9 and nb_entries <= self.max_entries * 0.9:
+                break
+            victims.append((key,))
+            total_size -= size
+            nb_entries -= 1
+        conn.executemany("DELETE FROM entries WHERE key = ?", victims)
+        conn.execute("UPDATE stats SET total_size = ?, nb_entries = ? WHERE id = 1", (max(total_size, 0), max(nb_entries, 0)))
+
+    # --- API Django ---
+
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        conn = self._connection()
+        now = time.time()
+        row = conn.execute("SELECT value, expires, accessed FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return default
+        if row[1] is not None and row[1] <= now:
+            self._write(lambda c: self._remove(c, key))
+            return default
+        if now - row[2] > 1:
+            # LRU approché : une écriture au plus par seconde et par clé lue
+            conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        self._write(lambda c: self._store(c, key, value, timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(lambda c: self._store(c, key, value, timeout, only_if_missing=True))
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        expires = self.get_backend_timeout(timeout)
+        cursor = self._connection().execute(
+            "UPDATE entries SET expires = ? WHERE key = ? AND (expires IS NULL OR expires > ?)",
+            (expires, key, time.time())
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._write(lambda c: self._remove(c, key))
+
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        row = self._connection().execute(
+            "SELECT 1 FROM entries WHERE key = ? AND (expires IS NULL OR expires > ?)", (key, time.time())
+        ).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        """Atomique entre workers (lecture + écriture dans la même transaction)."""
+        key = self.make_and_validate_key(key, version=version)
+
+        def increment(conn):
+            row = conn.execute("SELECT value, expires, size FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] is not None and row[1] <= time.time()):
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            conn.execute("UPDATE entries SET value = ?, size = ? WHERE key = ?", (data, len(data), key))
+            conn.execute("UPDATE stats SET total_size = total_size + ? WHERE id = 1", (len(data) - row[2],))
+            return value
+
+        return self._write(increment)
+
+    def clear(self):
+        def truncate(conn):
+            conn.execute("DELETE FROM entries")
+            conn.execute("DELETE FROM leases")
+            conn.execute("UPDATE stats SET total_size = 0, nb_entries = 0 WHERE id = 1")
+        self._write(truncate)
+
+    def close(self, **kwargs):
+        # Connexions gardées ouvertes (une par thread) : rien à fermer entre deux requêtes
+        pass
+
+    # --- Single-flight ---
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT, version=None):
+        value = self.get(key, self._missing_key, version=version)
+        if value is not self._missing_key:
+            return value
+        if not callable(default):
+            self.add(key, default, timeout=timeout, version=version)
+            return self.get(key, default, version=version)
+
+        # Un seul thread du process par clé...
+        flight_key = (str(self.path), self.make_key(key, version=version))
+        with _flights_lock:
+            flight = _flights.setdefault(flight_key, threading.Lock())
+        with flight:
+            try:
+                value = self.get(key, self._missing_key, version=version)
+                if value is not self._missing_key:
+                    return value
+                # ... et un seul process du nœud (bail dans le fichier partagé)
+                return self._compute_under_lease(key, default, timeout, version)
+            finally:
+                with _flights_lock:
+                    _flights.pop(flight_key, None)
+
+    def _compute_under_lease(self, key, default, timeout, version):
+        lease_key = self.make_and_validate_key(key, version=version)
+        deadline = time.monotonic() + self.lease_seconds
+        delay = 0.005
+        while True:
+            if self._acquire_lease(lease_key):
+                try:
+                    # Le précédent détenteur du bail a pu publier la valeur juste avant
+                    value = self.get(key, self._missing_key, version=version)
+                    if value is not self._missing_key:
+                        return value
+                    value = default()
+                    self.set(key, value, timeout=timeout, version=version)
+                    return value
+                finally:
+                    self._connection().execute("DELETE FROM leases WHERE key = ?", (lease_key,))
+            # Un autre worker calcule : on attend son résultat
+            value = self.get(key, self._missing_key, version=version)
+            if value is not self._missing_key:
+                return value
+            if time.monotonic() > deadline:
+                # Bail abandonné (worker tué) ou calcul trop long : on calcule nous-mêmes
+                value = default()
+                self.set(key, value, timeout=timeout, version=version)
+                return value
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+
+    def _acquire_lease(self, lease_key):
+        now = time.time()
+
+        def acquire(conn):
+            conn.execute("DELETE FROM leases WHERE key = ? AND expires <= ?", (lease_key, now))
+            cursor = conn.execute("INSERT OR IGNORE INTO leases (key, expires) VALUES (?, ?)",
+                                  (lease_key, now + self.lease_seconds))
+            return cursor.rowcount == 1
+
+        return self._write(acquire)
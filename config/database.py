@@ -0,0 +1,42 @@
+"""
+Profils de connexion à la base de données (utilisés par settings.py et la commande bench_db_writers).
+
+- SQLite (dev, tests) : WAL (les lectures ne bloquent plus les écritures), synchronous=NORMAL
+  (pas de fsync à chaque commit, sûr en WAL), mmap et busy timeout ; transactions IMMEDIATE pour
+  que deux écrivains concurrents attendent le verrou au lieu d'échouer en "database is locked".
+- Postgres : pool de connexions psycopg 3 (OPTIONS['pool'] de Django). Les threads sync_to_async
+  et les vues async ouvrent chacun leur connexion : conn_max_age ne les réutilise pas, le pool oui.
+"""
+
+SQLITE_MMAP_SIZE = 256 * 1024 * 1024
+
+
+def sqlite_options(busy_timeout=20):
+    return {
+        'timeout': busy_timeout,
+        'transaction_mode': 'IMMEDIATE',
+        'init_command': (
+            "PRAGMA journal_mode=WAL;"
+            "PRAGMA synchronous=NORMAL;"
+            f"PRAGMA mmap_size={SQLITE_MMAP_SIZE};"
+            f"PRAGMA busy_timeout={busy_timeout * 1000};"
+            "PRAGMA temp_store=MEMORY"
+        ),
+    }
+
+
+def postgres_pool_options(min_size=2, max_size=10, timeout=10):
+    return {'pool': {'min_size': min_size, 'max_size': max_size, 'timeout': timeout}}
+
+
+def tune_database(db, sqlite_tuned=True, pool=False, pool_min=2, pool_max=10, pool_timeout=10):
+    """Applique le profil adapté au moteur sur un dict de DATABASES (modifié en place)."""
+    engine = db.get('ENGINE', '')
+    options = db.setdefault('OPTIONS', {})
+    if engine.endswith('sqlite3') and sqlite_tuned:
+        options.update(sqlite_options())
+    elif 'postgresql' in engine and pool:
+        options.update(postgres_pool_options(pool_min, pool_max, pool_timeout))
+        # Le pool remplace les connexions persistantes (Django refuse les deux à la fois)
+        db['CONN_MAX_AGE'] = 0
+    return db
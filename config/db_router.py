@@ -0,0 +1,150 @@
+"""
+Routage des lectures vers un réplica (alias 'replica', défini par DATABASE_REPLICA_URL).
+
+Seules les vues qui l'acceptent explicitement (ReadReplicaMixin : tableau de bord, historique,
+catalogue des cas) lisent sur le réplica, et uniquement si :
+- la requête est en lecture (GET/HEAD/OPTIONS) et hors transaction sur le primaire ;
+- l'utilisateur n'a pas écrit récemment (read-your-writes : fenêtre REPLICA_STICKY_SECONDS
+  posée par ReplicaStickinessMiddleware après chaque requête d'écriture réussie) ;
+- le retard de réplication mesuré est sous REPLICA_MAX_LAG (sinon, ou si le réplica ne répond
+  pas, tout repasse sur le primaire).
+Toutes les écritures vont sur le primaire.
+
+En local : DATABASE_REPLICA_URL=sqlite:///db_replica.sqlite3 et `manage.py sync_replica --watch 5`
+simule une réplication asynchrone (copie périodique du primaire). En test, le réplica est un
+miroir du primaire (TEST['MIRROR']).
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+from simulation.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+REPLICA_ALIAS = 'replica'
+
+_scope = contextvars.ContextVar('read_replica_scope', default=False)
+
+
+def sticky_key(user_id):
+    return f"db-sticky:{user_id}"
+
+
+def mark_recent_write(user_id):
+    """L'utilisateur lit sur le primaire pendant REPLICA_STICKY_SECONDS."""
+    cache.set(sticky_key(user_id), True, getattr(settings, 'REPLICA_STICKY_SECONDS', 5))
+
+
+def has_recent_write(user_id):
+    return bool(cache.get(sticky_key(user_id)))
+
+
+def last_modified(path):
+    """Dernière écriture d'un fichier SQLite, journal WAL compris."""
+    return max(os.path.getmtime(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+class ReplicaLagMonitor:
+    """Retard de réplication (s), mesuré au plus une fois par REPLICA_LAG_CHECK_INTERVAL."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = 0.0
+        self._lag = None
+
+    def lag(self):
+        interval = getattr(settings, 'REPLICA_LAG_CHECK_INTERVAL', 2)
+        with self._lock:
+            if time.monotonic() - self._checked_at < interval:
+                return self._lag
+            self._checked_at = time.monotonic()
+        try:
+            lag = self.measure()
+        except Exception as e:
+            # Réplica injoignable : traité comme un retard infini (lectures sur le primaire)
+            logger.warning(f"Réplica indisponible : {e}")
+            lag = None
+        with self._lock:
+            self._lag = lag
+        return lag
+
+    def measure(self):
+        replica = connections[REPLICA_ALIAS]
+        if replica.vendor == 'postgresql':
+            with replica.cursor() as cursor:
+                # Tout le WAL reçu est rejoué : réplica à jour, même si le primaire n'a rien écrit depuis
+                # longtemps (l'âge de la dernière transaction rejouée croît alors sans retard réel)
+                cursor.execute(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                )
+                return float(cursor.fetchone()[0])
+        if replica.vendor == 'sqlite':
+            # Réplica simulé (copie périodique) : s'il manque des écritures, retard = âge de la copie
+            primary = settings.DATABASES['default']['NAME']
+            copy = replica.settings_dict['NAME']
+            if primary == copy:
+                return 0.0
+            written, synced = last_modified(primary), last_modified(copy)
+            return time.time() - synced if written > synced else 0.0
+        return 0.0
+
+    def reset(self):
+        with self._lock:
+            self._checked_at = 0.0
+            self._lag = None
+
+
+lag_monitor = ReplicaLagMonitor()
+
+
+def replica_usable():
+    lag = lag_monitor.lag()
+    return lag is not None and lag <= getattr(settings, 'REPLICA_MAX_LAG', 5)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        if not _scope.get() or REPLICA_ALIAS not in settings.DATABASES:
+            return None
+        if connections['default'].in_atomic_block:
+            return None
+        target = REPLICA_ALIAS if replica_usable() else 'default'
+        metrics.increment('db_read_routing_total', target=target)
+        return target
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Mêmes données des deux côtés
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Le réplica reçoit le schéma par la réplication (ou sync_replica en local)
+        return db != REPLICA_ALIAS
+
+
+class ReadReplicaMixin:
+    """Vue DRF en lecture seule dont les requêtes peuvent être servies par le réplica."""
+
+    def initial(self, request, *args, **kwargs):
+        # Authentification et permissions sur le primaire, puis bascule éventuelle
+        super().initial(request, *args, **kwargs)
+        if (REPLICA_ALIAS in settings.DATABASES and request.method in SAFE_METHODS
+                and not has_recent_write(request.user.pk)):
+            self._replica_scope = _scope.set(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, '_replica_scope', None)
+        if token is not None:
+            _scope.reset(token)
+            self._replica_scope = None
+        return super().finalize_response(request, response, *args, **kwargs)
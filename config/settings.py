@@ -2,6 +2,7 @@ import os
 from datetime import timedelta
 from pathlib import Path
 import dj_database_url
+from config.database import tune_database
 # --- AJOUTER CECI ---
 from dotenv import load_dotenv
 
@@ -54,6 +55,28 @@ DATABASES = {
     )
 }
 
+# Profil de connexion : SQLite en WAL (cf. config/database.py), pool de connexions pour Postgres
+DB_SQLITE_TUNED = os.environ.get('DB_SQLITE_TUNED', 'True') == 'True'
+DB_POOL_ENABLED = os.environ.get('DB_POOL_ENABLED', 'False') == 'True'  # Nécessite psycopg 3 (psycopg[pool])
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 2))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 10))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))  # Attente max d'une connexion libre (s)
+tune_database(DATABASES['default'], sqlite_tuned=DB_SQLITE_TUNED, pool=DB_POOL_ENABLED,
+              pool_min=DB_POOL_MIN_SIZE, pool_max=DB_POOL_MAX_SIZE, pool_timeout=DB_POOL_TIMEOUT)
+
+# Réplica en lecture (tableau de bord, historique, catalogue) : cf. config/db_router.py
+# En local : DATABASE_REPLICA_URL=sqlite:///db_replica.sqlite3 + `manage.py sync_replica --watch 5`
+DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+if DATABASE_REPLICA_URL:
+    DATABASES['replica'] = dj_database_url.parse(DATABASE_REPLICA_URL, conn_max_age=600)
+    tune_database(DATABASES['replica'], sqlite_tuned=DB_SQLITE_TUNED, pool=DB_POOL_ENABLED,
+                  pool_min=DB_POOL_MIN_SIZE, pool_max=DB_POOL_MAX_SIZE, pool_timeout=DB_POOL_TIMEOUT)
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+DATABASE_ROUTERS = ['config.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))  # Lecture sur le primaire après une écriture (>= REPLICA_MAX_LAG)
+REPLICA_MAX_LAG = float(os.environ.get('REPLICA_MAX_LAG', 5))  # Au-delà, toutes les lectures repassent sur le primaire
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get('REPLICA_LAG_CHECK_INTERVAL', 2))
+
 # Validation des mots de passe
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -80,6 +103,9 @@ USE_TZ = True
 STATIC_URL = 'static/'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Tests : cache partagé isolé dans un fichier temporaire (cf. config/test_runner.py)
+TEST_RUNNER = 'config.test_runner.IsolatedCacheRunner'
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -101,13 +127,17 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'simulation.middleware.ServerTimingMiddleware', # Server-Timing (BDD / LLM / rendu) + histogrammes
+    'simulation.middleware.RequestProfilerMiddleware', # Profil à la demande (staff, X-Profile: 1)
+    'simulation.middleware.CompressionMiddleware', # brotli / gzip des réponses volumineuses
     'django.middleware.security.SecurityMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'simulation.middleware.AsyncWhiteNoiseMiddleware', # WhiteNoise, sans casser la chaîne async (ASGI)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware', # Important: avant CommonMiddleware
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'simulation.middleware.ReplicaStickinessMiddleware', # Read-your-writes avec le réplica en lecture
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -121,8 +151,103 @@ CORS_ALLOWED_ORIGINS = [
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+    ),
+    # JSON via orjson (repli stdlib si absent) : cf. config/fast_json.py
+    'DEFAULT_RENDERER_CLASSES': (
+        'config.fast_json.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'config.fast_json.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
+# Compression des réponses (CompressionMiddleware) : brotli si le client l'accepte, sinon gzip
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', 1024))  # octets, en dessous : gain nul
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 4))  # 0-11 : 4 = bon compromis à la volée
+COMPRESSION_GZIP_LEVEL = int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6))
+
+# Configuration du Tuteur (génération du Quiz en mode sharding)
+QUIZ_SHARDS = int(os.environ.get('QUIZ_SHARDS', 3))
+QUIZ_SHARD_DEADLINE = float(os.environ.get('QUIZ_SHARD_DEADLINE', 20))
+
+# Routage des modèles LLM (tours conversationnels courts -> modèle léger)
+LLM_MODEL_TIERS = {
+    'light': os.environ.get('LLM_MODEL_LIGHT', 'gemini-2.5-flash-lite'),
+    'standard': os.environ.get('LLM_MODEL_STANDARD', 'gemini-2.5-flash'),
+}
+
+# Hedging des réponses patient (second appel si le premier dépasse le p95 observé)
+LLM_HEDGING_ENABLED = os.environ.get('LLM_HEDGING_ENABLED', 'False') == 'True'
+LLM_HEDGE_PERCENTILE = float(os.environ.get('LLM_HEDGE_PERCENTILE', 95))
+LLM_HEDGE_MIN_DELAY = float(os.environ.get('LLM_HEDGE_MIN_DELAY', 1.0))
+LLM_HEDGE_INITIAL_DELAY = float(os.environ.get('LLM_HEDGE_INITIAL_DELAY', 4.0))  # Seuil tant que moins de 20 latences mesurées
+LLM_HEDGE_BUDGET = float(os.environ.get('LLM_HEDGE_BUDGET', 0.05)) # Max 5% d'appels supplémentaires
+
+# Répartiteur des appels LLM (par worker) : slots simultanés et attente max en file par classe
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', 8))
+LLM_QUEUE_DEADLINES = {
+    'interactive': float(os.environ.get('LLM_QUEUE_DEADLINE_INTERACTIVE', 15)),
+    'evaluation': float(os.environ.get('LLM_QUEUE_DEADLINE_EVALUATION', 60)),
+    'quiz': float(os.environ.get('LLM_QUEUE_DEADLINE_QUIZ', 60)),
+    'speculative': float(os.environ.get('LLM_QUEUE_DEADLINE_SPECULATIVE', 30)),
+}
+
+# Contrôle d'admission (CoDel) : rejet des requêtes LLM si l'attente en file dépasse la cible
+LLM_ADMISSION_ENABLED = os.environ.get('LLM_ADMISSION_ENABLED', 'True') == 'True'
+LLM_ADMISSION_TARGET = float(os.environ.get('LLM_ADMISSION_TARGET', 2.0))      # secondes
+LLM_ADMISSION_INTERVAL = float(os.environ.get('LLM_ADMISSION_INTERVAL', 5.0))  # secondes
+
+# Batch (pré-génération de Quiz, re-notation) : 'gemini' ou 'local' (service de test)
+LLM_BATCH_BACKEND = os.environ.get('LLM_BATCH_BACKEND', 'gemini')
+LLM_BATCH_DISCOUNT = float(os.environ.get('LLM_BATCH_DISCOUNT', 0.5))  # Remise batch sur le prix public
+
+# 'stub' : faux LLM à latence simulée (tests de charge, commande loadtest)
+LLM_BACKEND = os.environ.get('LLM_BACKEND', 'gemini')
+LLM_STUB_LATENCY = float(os.environ.get('LLM_STUB_LATENCY', 0.2))
+LLM_STUB_JITTER = float(os.environ.get('LLM_STUB_JITTER', 0.1))
+
+# Cassettes LLM (benchmarks reproductibles hors réseau) : off | record | replay
+LLM_CASSETTE_MODE = os.environ.get('LLM_CASSETTE_MODE', 'off')
+LLM_CASSETTE_PATH = os.environ.get('LLM_CASSETTE_PATH', str(BASE_DIR / 'cassettes' / 'llm.jsonl.gz'))
+LLM_CASSETTE_SPEED = float(os.environ.get('LLM_CASSETTE_SPEED', 0))  # 0 = instantané, 1 = vitesse enregistrée
+
+# Réponse d'ouverture du patient générée dès le démarrage d'une session (par cas, partagée via le cache)
+SPECULATIVE_OPENING_ENABLED = os.environ.get('SPECULATIVE_OPENING_ENABLED', 'False') == 'True'  # Appel LLM en tâche de fond à chaque démarrage
+SPECULATIVE_OPENING_TTL = int(os.environ.get('SPECULATIVE_OPENING_TTL', 24 * 3600))  # secondes
+SPECULATIVE_WORKERS = int(os.environ.get('SPECULATIVE_WORKERS', 2))  # Générations simultanées par worker
+
+# Jeton du scraper Prometheus (GET /api/v1/simulation/metrics/prometheus/), endpoint fermé si vide
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+# Profileur à la demande (staff) : échantillonnage de la pile, captures en tampon circulaire sur disque
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'True') == 'True'
+PROFILER_DIR = os.environ.get('PROFILER_DIR', str(BASE_DIR / 'profiles'))
+PROFILER_MAX_CAPTURES = int(os.environ.get('PROFILER_MAX_CAPTURES', 50))
+PROFILER_INTERVAL = float(os.environ.get('PROFILER_INTERVAL', 0.005))  # secondes entre deux échantillons
+PROFILER_MAX_SECONDS = float(os.environ.get('PROFILER_MAX_SECONDS', 60))
+
+# Cache partagé par les workers du nœud (fichier SQLite en mémoire partagée) : cf. config/cache.py
+# Répertoire propre à l'utilisateur (0700) : /dev/shm est ouvert en écriture à tous
+SHARED_CACHE_PATH = os.environ.get('SHARED_CACHE_PATH',
+                                   f'/dev/shm/sti_backend-{os.getuid()}/cache.sqlite3' if os.path.isdir('/dev/shm')
+                                   else str(BASE_DIR / 'cache' / 'cache.sqlite3'))
+CACHES = {
+    'default': {
+        'BACKEND': 'config.cache.SharedSQLiteCache',
+        'LOCATION': SHARED_CACHE_PATH,
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', 300)),
+        'KEY_PREFIX': 'sti',
+        'OPTIONS': {
+            'MAX_SIZE': int(os.environ.get('CACHE_MAX_SIZE', 64 * 1024 * 1024)),  # octets (valeurs sérialisées)
+            'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_ENTRIES', 50_000)),
+            'LEASE_SECONDS': float(os.environ.get('CACHE_LEASE_SECONDS', 30)),  # Calcul single-flight max
+        },
+    }
 }
+CATALOG_CACHE_TIMEOUT = int(os.environ.get('CATALOG_CACHE_TIMEOUT', 600))  # Invalidé à chaque modification d'un cas
 
 # Configuration JWT
 SIMPLE_JWT = {
@@ -0,0 +1,39 @@
+"""
+Lanceur de tests :
+- le cache partagé (config/cache.py) pointe vers un fichier temporaire, pour que les tests ne lisent
+  ni n'écrivent le cache du nœud de développement (et inversement) ;
+- sans DATABASE_REPLICA_URL, un alias 'replica' miroir du primaire est ajouté, pour exercer le
+  routage de config/db_router.py (tests avec databases = {'default', 'replica'}).
+"""
+import shutil
+import tempfile
+from django.conf import settings
+from django.db import connections
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from config.db_router import REPLICA_ALIAS
+
+
+class IsolatedCacheRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.cache_dir = tempfile.mkdtemp(prefix='sti_test_cache_')
+        caches = {alias: dict(config) for alias, config in settings.CACHES.items()}
+        for config in caches.values():
+            if config['BACKEND'] == 'config.cache.SharedSQLiteCache':
+                config['LOCATION'] = f'{self.cache_dir}/cache.sqlite3'
+        self.cache_override = override_settings(CACHES=caches)
+        self.cache_override.enable()
+
+    def setup_databases(self, **kwargs):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            settings.DATABASES[REPLICA_ALIAS] = {**settings.DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+            # Complète les clés par défaut du nouvel alias (même dict que connections.settings)
+            connections.configure_settings(settings.DATABASES)
+        return super().setup_databases(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        self.cache_override.disable()
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
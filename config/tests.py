@@ -0,0 +1,270 @@
+import io
+import os
+import time
+import tempfile
+import threading
+import datetime
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from authentication.models import User
+from clinical_cases.models import ClinicalCase
+from simulation.models import SimulationSession
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from config.cache import SharedSQLiteCache
+from config.fast_json import FastJSONRenderer, FastJSONParser
+from config.database import tune_database, SQLITE_MMAP_SIZE
+from config.db_router import REPLICA_ALIAS, ReplicaRouter, lag_monitor, has_recent_write
+
+
+class SharedSQLiteCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = Path(tmp.name) / 'shared' / 'cache.sqlite3'
+
+    def make_cache(self, **options):
+        return SharedSQLiteCache(str(self.path), {'OPTIONS': options})
+
+    def stats(self, cache):
+        conn = cache._connection()
+        total_size, nb_entries = conn.execute("SELECT total_size, nb_entries FROM stats").fetchone()
+        self.assertEqual(
+            (total_size, nb_entries),
+            conn.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM entries").fetchone()
+        )
+        return total_size, nb_entries
+
+    def test_tests_do_not_use_the_node_cache(self):
+        self.assertNotEqual(settings.CACHES['default']['LOCATION'], settings.SHARED_CACHE_PATH)
+
+    def test_location_is_private(self):
+        self.make_cache().set('k', 1)
+        self.assertEqual(self.path.parent.stat().st_mode & 0o777, 0o700)
+        self.assertEqual(self.path.stat().st_mode & 0o777, 0o600)
+
+    def test_writable_location_is_refused(self):
+        self.path.parent.mkdir()
+        os.chmod(self.path.parent, 0o777)
+        with self.assertRaises(ImproperlyConfigured):
+            self.make_cache().get('k')
+
+    def test_least_recently_read_entries_are_evicted(self):
+        cache = self.make_cache(MAX_ENTRIES=10)
+        for i in range(10):
+            cache.set(f'k{i}', i)
+        # Entrées vieillies : la lecture de k0 rafraîchit son horodatage
+        cache._connection().execute("UPDATE entries SET accessed = accessed - 5")
+        self.assertEqual(cache.get('k0'), 0)
+
+        cache.set('k10', 10)  # 11 > 10 : éviction jusqu'à 9 entrées
+        self.assertEqual([cache.has_key(f'k{i}') for i in range(4)], [True, False, False, True])
+        self.assertTrue(cache.has_key('k10'))
+        self.assertEqual(self.stats(cache)[1], 9)
+
+    def test_expired_entries_are_evicted_first(self):
+        cache = self.make_cache(MAX_ENTRIES=4)
+        cache.set('old', 0)
+        cache.set('short1', 1, timeout=0.01)
+        cache.set('short2', 1, timeout=0.01)
+        cache.set('b', 2)
+        time.sleep(0.02)
+        cache.set('c', 3)
+        self.assertTrue(cache.has_key('old'))
+        self.assertEqual(self.stats(cache)[1], 3)
+
+    def test_get_or_set_computes_once_across_threads(self):
+        cache = self.make_cache()
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'valeur'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_set('k', compute)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['valeur'] * 5)
+
+    def test_get_or_set_waits_for_the_lease_holder(self):
+        cache = self.make_cache(LEASE_SECONDS=5)
+        # Bail pris par un autre worker, qui publie la valeur peu après
+        cache._connection().execute("INSERT INTO leases VALUES (?, ?)", (cache.make_key('k'), time.time() + 5))
+        timer = threading.Timer(0.05, lambda: self.make_cache().set('k', 'autre worker'))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.assertEqual(cache.get_or_set('k', lambda: 'local'), 'autre worker')
+
+    def test_expired_lease_is_taken_over(self):
+        cache = self.make_cache(LEASE_SECONDS=5)
+        cache._connection().execute("INSERT INTO leases VALUES (?, ?)", (cache.make_key('k'), time.time() - 1))
+        start = time.monotonic()
+        self.assertEqual(cache.get_or_set('k', lambda: 'local'), 'local')
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(cache._connection().execute("SELECT COUNT(*) FROM leases").fetchone()[0], 0)
+
+    def test_abandoned_lease_gives_up_after_lease_seconds(self):
+        cache = self.make_cache(LEASE_SECONDS=0.1)
+        cache._connection().execute("INSERT INTO leases VALUES (?, ?)", (cache.make_key('k'), time.time() + 60))
+        self.assertEqual(cache.get_or_set('k', lambda: 'local'), 'local')
+        self.assertEqual(cache.get('k'), 'local')
+
+    def test_incr_keeps_size_accounting(self):
+        cache = self.make_cache()
+        cache.set('n', 1)
+        self.assertEqual(cache.incr('n', 10 ** 30), 10 ** 30 + 1)
+        self.assertEqual(cache.get('n'), 10 ** 30 + 1)
+        self.stats(cache)
+        cache.delete('n')
+        self.assertEqual(self.stats(cache), (0, 0))
+        with self.assertRaises(ValueError):
+            cache.incr('n')
+
+
+class DatabaseProfileTests(SimpleTestCase):
+
+    def test_sqlite_pragmas_are_applied_on_connect(self):
+        from django.db.backends.sqlite3.base import DatabaseWrapper
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        db = tune_database({**connections['default'].settings_dict, 'NAME': f'{tmp.name}/db.sqlite3',
+                            'OPTIONS': {}})
+        wrapper = DatabaseWrapper(db, alias='profile')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            pragmas = {name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+                       for name in ('journal_mode', 'synchronous', 'busy_timeout', 'mmap_size', 'temp_store')}
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 20000,
+                                   'mmap_size': SQLITE_MMAP_SIZE, 'temp_store': 2})
+        self.assertEqual(wrapper.transaction_mode, 'IMMEDIATE')
+
+    def test_sqlite_profile_can_be_disabled(self):
+        db = tune_database({'ENGINE': 'django.db.backends.sqlite3', 'NAME': 'x'}, sqlite_tuned=False)
+        self.assertEqual(db['OPTIONS'], {})
+
+    def test_postgres_pool_replaces_persistent_connections(self):
+        db = tune_database({'ENGINE': 'django.db.backends.postgresql', 'CONN_MAX_AGE': 600},
+                           pool=True, pool_min=1, pool_max=4, pool_timeout=3)
+        self.assertEqual(db['OPTIONS'], {'pool': {'min_size': 1, 'max_size': 4, 'timeout': 3}})
+        self.assertEqual(db['CONN_MAX_AGE'], 0)
+
+    def test_postgres_without_pool_is_untouched(self):
+        db = tune_database({'ENGINE': 'django.db.backends.postgresql', 'CONN_MAX_AGE': 600})
+        self.assertEqual((db['OPTIONS'], db['CONN_MAX_AGE']), ({}, 600))
+
+
+@override_settings(REPLICA_LAG_CHECK_INTERVAL=0)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Réplica miroir du primaire (cf. config/test_runner.py) : on compte les requêtes de chaque alias."""
+    databases = {'default', REPLICA_ALIAS}
+
+    def setUp(self):
+        cache.clear()
+        lag_monitor.reset()
+        self.addCleanup(lag_monitor.reset)
+        self.user = User.objects.create_user(email='replica@example.com', password='secret', nom='Replica')
+        case = ClinicalCase.objects.create(title="Cas", specialty="Cardiologie", case_data={})
+        self.session = SimulationSession.objects.create(user=self.user, clinical_case=case)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def get_history(self):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+            response = self.client.get('/api/v1/simulation/history/')
+        self.assertEqual(response.status_code, 200)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_the_replica_inside_the_mixin_scope(self):
+        primary, replica = self.get_history()
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_reads_outside_the_mixin_scope_stay_on_the_primary(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(SimulationSession))
+        self.assertEqual(SimulationSession.objects.all().db, 'default')
+
+    def test_writes_always_go_to_the_primary(self):
+        self.assertEqual(ReplicaRouter().db_for_write(SimulationSession), 'default')
+        self.assertFalse(ReplicaRouter().allow_migrate(REPLICA_ALIAS, 'simulation'))
+
+    def test_successful_write_makes_reads_sticky(self):
+        response = self.client.post(f'/api/v1/simulation/{self.session.uuid}/action/',
+                                    {'action_type': 'NOTE', 'details': 'Patient anxieux'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(has_recent_write(self.user.pk))
+        primary, replica = self.get_history()
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_stale_replica_falls_back_to_the_primary(self):
+        with mock.patch.object(lag_monitor, 'measure', return_value=settings.REPLICA_MAX_LAG + 1):
+            primary, replica = self.get_history()
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_unreachable_replica_falls_back_to_the_primary(self):
+        with mock.patch.object(lag_monitor, 'measure', side_effect=OSError("connexion refusée")), \
+                self.assertLogs('config.db_router', 'WARNING'):
+            primary, replica = self.get_history()
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+
+class FastJSONTests(SimpleTestCase):
+    """Même sortie et même entrée que les classes JSON de DRF (stdlib)."""
+
+    def assertSameRender(self, data):
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_render_matches_drf(self):
+        self.assertSameRender({
+            "score": Decimal("12.50"),
+            "start": datetime.datetime(2026, 10, 19, 8, 30, 5, 123456, tzinfo=datetime.timezone.utc),
+            "naive": datetime.datetime(2026, 10, 19, 8, 30),
+            "day": datetime.date(2026, 10, 19),
+            "label": gettext_lazy("Patient"),
+            "text": "Séparateur\u2028ligne\u2029paragraphe é",
+            "nested": [{"ok": True, "ratio": 0.1, "none": None}],
+            1: "clé entière",
+        })
+
+    def test_integers_beyond_64_bits_fall_back_to_the_stdlib(self):
+        self.assertSameRender({"big": 2 ** 64, "negative": -(2 ** 70)})
+
+    def test_indented_output_uses_the_stdlib(self):
+        renderer_context = {'indent': 4}
+        self.assertEqual(FastJSONRenderer().render({"a": 1}, renderer_context=renderer_context),
+                         JSONRenderer().render({"a": 1}, renderer_context=renderer_context))
+
+    def test_parse_matches_drf(self):
+        body = '{"message": "Bonjour, j\'ai mal \u00e0 la poitrine", "n": [1, 2.5, null]}'.encode()
+        self.assertEqual(FastJSONParser().parse(io.BytesIO(body)), JSONParser().parse(io.BytesIO(body)))
+
+    def test_parse_errors(self):
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"a": '))
+        # NaN refusé par orjson : même résultat que DRF (STRICT_JSON actif par défaut)
+        with self.assertRaises(ParseError):
+            JSONParser().parse(io.BytesIO(b'{"a": NaN}'))
+        with self.assertRaises(ParseError):
+            FastJSONParser().parse(io.BytesIO(b'{"a": NaN}'))
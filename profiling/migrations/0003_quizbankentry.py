@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiling', '0002_learnerprofile_language_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuizBankEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile_key', models.CharField(db_index=True, max_length=40)),
+                ('profile_data', models.JSONField(default=dict)),
+                ('questions', models.JSONField(default=list)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
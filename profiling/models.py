@@ -29,4 +29,14 @@ class LearnerProfile(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
-        return f"Profil de {self.user.email}"
\ No newline at end of file
+        return f"Profil de {self.user.email}"
+
+class QuizBankEntry(models.Model):
+    """Quiz pré-généré (batch) pour un type de profil, servi sans appel LLM par GenerateTestView."""
+    profile_key = models.CharField(max_length=40, db_index=True)  # sha1 du profil (niveau, spécialité, objectifs)
+    profile_data = models.JSONField(default=dict)
+    questions = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Quiz pré-généré {self.profile_key[:8]} ({len(self.questions)} questions)"
@@ -0,0 +1,37 @@
+"""
+Banque de Quiz pré-générés (remplie hors ligne par les jobs batch, cf. simulation.llm_batch).
+GenerateTestView y pioche un quiz correspondant au profil avant d'appeler le Tuteur.
+"""
+import json
+import hashlib
+from .models import QuizBankEntry
+
+
+def profile_key(profile_data):
+    """Clé stable d'un type de profil (l'ordre des objectifs n'a pas d'importance)."""
+    normalized = {
+        "study_level": profile_data.get('study_level') or "",
+        "specialty": profile_data.get('specialty') or "",
+        "objectives": sorted(profile_data.get('objectives') or []),
+    }
+    return hashlib.sha1(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def store_quiz(profile_data, questions):
+    return QuizBankEntry.objects.create(
+        profile_key=profile_key(profile_data), profile_data=profile_data, questions=questions
+    )
+
+
+def count_quizzes(profile_data):
+    return QuizBankEntry.objects.filter(profile_key=profile_key(profile_data)).count()
+
+
+def take_quiz(profile_data):
+    """Retire et retourne le plus ancien quiz du profil, ou None. Chaque quiz n'est servi qu'une fois."""
+    entries = QuizBankEntry.objects.filter(profile_key=profile_key(profile_data)).order_by('created_at')
+    for entry in entries[:3]:
+        # Suppression conditionnelle : si une autre requête l'a pris entre-temps, on passe au suivant
+        if QuizBankEntry.objects.filter(pk=entry.pk).delete()[0]:
+            return entry.questions
+    return None
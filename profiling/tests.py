@@ -1,3 +1,127 @@
-from django.test import TestCase
+import json
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from authentication.models import User
+from profiling.models import LearnerProfile
+from profiling.views import score_test
+from simulation.llm_stub import STUB_LLM
+from simulation.llm_tutor import IncrementalJSONArrayParser, merge_question_shards, plan_quiz_shards
 
-# Create your tests here.
+
+class IncrementalJSONArrayParserTests(TestCase):
+
+    def feed_all(self, chunks):
+        parser = IncrementalJSONArrayParser()
+        completed = []
+        for chunk in chunks:
+            completed.append(parser.feed(chunk))
+        return completed
+
+    def test_objects_are_returned_as_soon_as_they_close(self):
+        completed = self.feed_all(['```json\n[{"id": "q1", "opt', 'ions": {"a": 1}}', ', {"id"', ': "q2"}]\n```'])
+        self.assertEqual(completed, [[], [{"id": "q1", "options": {"a": 1}}], [], [{"id": "q2"}]])
+
+    def test_brackets_and_quotes_inside_strings(self):
+        text = json.dumps([{"question": 'Signe de "Murphy" {positif} ]['}, {"question": "a\\b"}])
+        completed = self.feed_all(text[i:i + 3] for i in range(0, len(text), 3))
+        self.assertEqual([obj for chunk in completed for obj in chunk],
+                         [{"question": 'Signe de "Murphy" {positif} ]['}, {"question": "a\\b"}])
+
+    def test_invalid_object_is_skipped(self):
+        completed = self.feed_all(['[{"id": q1}, {"id": "q2"}]'])
+        self.assertEqual(completed, [[{"id": "q2"}]])
+
+    def test_input_after_closing_bracket_is_ignored(self):
+        completed = self.feed_all(['[{"id": "q1"}] Voici un autre exemple : [{"id"', ': "q2"}]', '{"id": "q3"}'])
+        self.assertEqual(completed, [[{"id": "q1"}], [], []])
+
+
+class ScoreTestTests(TestCase):
+
+    def test_score_and_calibrated_level(self):
+        correct = {"q1": "a", "q2": "b", "q3": "c", "q4": "d", "q5": "a"}
+        self.assertEqual(score_test(correct, dict(correct)), (100.0, "Expert"))
+        self.assertEqual(score_test(correct, {"q1": "a", "q2": "b", "q3": "c", "q4": "a"}), (60.0, "Intermédiaire"))
+        self.assertEqual(score_test(correct, {"q1": "a", "q2": "b"}), (40.0, "Novice"))
+        self.assertEqual(score_test({}, {"q1": "a"}), (0, "Novice"))
+
+
+def question(text, answer='a'):
+    return {"id": "q1", "question": text, "options": {"a": "A", "b": "B"}, "correct_answer": answer}
+
+
+class QuizShardTests(TestCase):
+
+    def test_merge_drops_near_duplicates_and_renumbers(self):
+        shards = [
+            [question("Quel examen demander devant une douleur thoracique ?"), question("Dose de ramipril ?")],
+            [question("Quel examen demander devant une douleur thoracique ?!"),
+             question("Quel examen demandez-vous devant une douleur thoracique ?"),
+             question("Signe de gravité d'une pneumopathie ?")],
+        ]
+        merged = merge_question_shards(shards)
+        self.assertEqual([q['id'] for q in merged], ["q1", "q2", "q3"])
+        self.assertEqual([q['question'] for q in merged], [
+            "Quel examen demander devant une douleur thoracique ?", "Dose de ramipril ?",
+            "Signe de gravité d'une pneumopathie ?",
+        ])
+
+    def test_merge_skips_malformed_questions(self):
+        merged = merge_question_shards([[{"question": "Sans réponse ?"}, "texte", question("Valide ?")]])
+        self.assertEqual(merged, [{**question("Valide ?"), "id": "q1"}])
+
+    @override_settings(QUIZ_SHARDS=3)
+    def test_plan_spreads_questions_over_objectives(self):
+        self.assertEqual(plan_quiz_shards({"objectives": ["diagnosis", "treatment"]}, total=15),
+                         [("diagnosis", 8), ("treatment", 7)])
+        self.assertEqual(len(plan_quiz_shards({"objectives": []}, total=2)), 2)
+
+
+@override_settings(**STUB_LLM)
+class GenerateTestStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='quiz@example.com', password='secret', nom='Quiz')
+        LearnerProfile.objects.create(user=cls.user, study_level='M1', specialty='Cardiologie',
+                                      objectives=['diagnosis'])
+
+    def test_questions_are_streamed_without_answers(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/v1/profiling/test/generate/?stream=1')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+
+        lines = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        questions, end = lines[:-1], lines[-1]
+        self.assertEqual(end, {"done": True, "count": len(questions)})
+        self.assertTrue(questions)
+        self.assertTrue(all('correct_answer' not in q and 'explanation' not in q for q in questions))
+
+        pending = LearnerProfile.objects.get(user=self.user).pending_test_data
+        self.assertEqual(set(pending), {q['id'] for q in questions})
+
+    def profile_updates(self, queries):
+        return [q for q in queries if q['sql'].startswith('UPDATE') and 'profiling_learnerprofile' in q['sql']]
+
+    def test_answers_are_saved_once(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/v1/profiling/test/generate/?stream=1')
+            lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertGreater(len(lines), 2)
+        self.assertEqual(len(self.profile_updates(queries.captured_queries)), 1)
+
+    def test_interrupted_stream_saves_sent_questions(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/v1/profiling/test/generate/?stream=1')
+        stream = iter(response.streaming_content)
+        first = json.loads(next(stream))
+        with CaptureQueriesContext(connection) as queries:
+            response.close()
+        self.assertEqual(len(self.profile_updates(queries.captured_queries)), 1)
+        self.assertEqual(set(LearnerProfile.objects.get(user=self.user).pending_test_data), {first['id']})
@@ -2,11 +2,17 @@ from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
+from django.http import StreamingHttpResponse
+import json
 from .models import LearnerProfile
 from .serializers import LearnerProfileSerializer
+from .quiz_bank import take_quiz
 from django.db.models import Avg, Count
 from simulation.models import SimulationSession
-from simulation.llm_tutor import generate_adaptive_test
+from simulation.metrics import metrics
+from simulation.admission import admission_controller, AdmissionRejected, rejected_response
+from config.db_router import ReadReplicaMixin
+from simulation.llm_tutor import generate_adaptive_test, generate_adaptive_test_stream, generate_adaptive_test_sharded
 
 class UserProfileView(generics.RetrieveUpdateAPIView):
     """
@@ -24,6 +30,9 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
 class GenerateTestView(APIView):
     """
     Génère un test adaptatif via Gemini (Tuteur) basé sur le profil actuel.
+    Avec ?stream=1, les questions sont envoyées une par une (NDJSON) dès qu'elles sont générées.
+    Avec ?mode=sharded, le quiz est généré en plusieurs appels parallèles (un par objectif).
+    Sinon, un quiz pré-généré en batch (banque de Quiz) est servi en priorité s'il en existe un pour ce profil.
     """
     permission_classes = [IsAuthenticated]
 
@@ -36,9 +45,26 @@ class GenerateTestView(APIView):
             "specialty": profile.specialty,
             "objectives": profile.objectives
         }
-        
-        # Appel au Tuteur IA
-        questions = generate_adaptive_test(profile_data)
+
+        try:
+            if request.query_params.get('stream') in ('1', 'true'):
+                # Le flux démarre l'appel LLM : admission vérifiée avant d'envoyer les en-têtes
+                admission_controller.check('quiz')
+                return self.streaming_response(profile, profile_data, request.user.id)
+
+            # Appel au Tuteur IA
+            if request.query_params.get('mode') == 'sharded':
+                admission_controller.check('quiz')
+                questions = generate_adaptive_test_sharded(profile_data, user_id=request.user.id)
+            else:
+                questions = take_quiz(profile_data)
+                metrics.increment('quiz_bank_requests_total', hit=str(questions is not None).lower())
+                if questions is None:
+                    # Banque vide pour ce profil : seul ce cas appelle le LLM
+                    admission_controller.check('quiz')
+                    questions = generate_adaptive_test(profile_data, user_id=request.user.id)
+        except AdmissionRejected as e:
+            return rejected_response(e)
         
         # 2. Sauvegarde dans la BDD (Au lieu de la session)
         # On extrait les IDs et les bonnes réponses pour la correction future
@@ -47,15 +73,67 @@ class GenerateTestView(APIView):
         profile.save()
         
         # 3. Nettoyage pour le Frontend (On enlève la réponse)
-        questions_for_front = []
-        for q in questions:
-            q_copy = q.copy()
-            q_copy.pop('correct_answer', None)
-            q_copy.pop('explanation', None)
-            questions_for_front.append(q_copy)
+        questions_for_front = [self.strip_answer(q) for q in questions]
             
         return Response(questions_for_front)
 
+    def streaming_response(self, profile, profile_data, user_id):
+        response = StreamingHttpResponse(
+            self.stream_questions(profile, profile_data, user_id),
+            content_type='application/x-ndjson'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no' # Désactive le buffering des proxys (Nginx/Render)
+        return response
+
+    @staticmethod
+    def strip_answer(question):
+        q_copy = question.copy()
+        q_copy.pop('correct_answer', None)
+        q_copy.pop('explanation', None)
+        return q_copy
+
+    def stream_questions(self, profile, profile_data, user_id=None):
+        """
+        Pousse chaque question au client dès qu'elle est parsée. Les réponses sont enregistrées en une
+        écriture avant la ligne de fin, ou à l'interruption du flux pour les questions déjà envoyées.
+        """
+        answers = {}
+        saved = False
+        try:
+            for question in generate_adaptive_test_stream(profile_data, user_id=user_id):
+                answers[question['id']] = question['correct_answer']
+                yield json.dumps(self.strip_answer(question), ensure_ascii=False) + "\n"
+
+            profile.pending_test_data = answers
+            profile.save(update_fields=['pending_test_data'])
+            saved = True
+            # Ligne de fin pour que le Front sache que le test est complet
+            yield json.dumps({"done": True, "count": len(answers)}) + "\n"
+        finally:
+            if not saved:
+                # Client parti ou génération en échec : résultats partiels
+                profile.pending_test_data = answers
+                profile.save(update_fields=['pending_test_data'])
+
+def score_test(correct_answers, user_answers):
+    """Retourne (score en %, niveau calibré) à partir des bonnes réponses et des réponses de l'apprenant."""
+    score = 0
+    total = len(correct_answers)
+
+    for q_id, correct_val in correct_answers.items():
+        # On compare la réponse utilisateur avec la bonne réponse
+        if user_answers.get(q_id) == correct_val:
+            score += 1
+    
+    final_score_percent = (score / total) * 100 if total > 0 else 0
+    
+    calibrated_level = "Novice"
+    if final_score_percent > 80: calibrated_level = "Expert"
+    elif final_score_percent > 40: calibrated_level = "Intermédiaire"
+    return final_score_percent, calibrated_level
+
+
 class SubmitTestView(APIView):
     """
     Corrige le test en comparant avec les réponses stockées en session.
@@ -74,21 +152,8 @@ class SubmitTestView(APIView):
             # On tente une correction via LLM ou on renvoie une erreur
             return Response({"error": "Aucun test actif trouvé. Veuillez recharger la page."}, status=400)
 
-        # 2. Correction
-        score = 0
-        total = len(correct_answers)
-
-        for q_id, correct_val in correct_answers.items():
-            # On compare la réponse utilisateur avec la bonne réponse
-            if user_answers.get(q_id) == correct_val:
-                score += 1
-        
-        final_score_percent = (score / total) * 100 if total > 0 else 0
-        
-        # 3. Calibration
-        calibrated_level = "Novice"
-        if final_score_percent > 80: calibrated_level = "Expert"
-        elif final_score_percent > 40: calibrated_level = "Intermédiaire"
+        # 2. Correction et 3. Calibration
+        final_score_percent, calibrated_level = score_test(correct_answers, user_answers)
 
         # 4. Sauvegarde Finale et Nettoyage
         profile.test_score = final_score_percent
@@ -104,7 +169,7 @@ class SubmitTestView(APIView):
     
 
 
-class DashboardStatsView(APIView):
+class DashboardStatsView(ReadReplicaMixin, APIView):
     """
     Agrégation complète pour le Tableau de Bord (Vue 1).
     Retourne : Profil, Score Global, Stats par patho, Recommandation.
@@ -116,20 +181,26 @@ class DashboardStatsView(APIView):
         sessions = SimulationSession.objects.filter(user=user, status='TERMINEE')
 
         # 1. Calcul du Score Global RIME (Moyenne des sessions)
-        global_score = sessions.aggregate(Avg('score_rime'))['score_rime__avg'] or 0
+        totals = sessions.aggregate(avg=Avg('score_rime'), count=Count('id'))
+        global_score = totals['avg'] or 0
         
         # 2. Stats par Pathologie (Pour le tableau 'PathologyStats')
         # On groupe par spécialité du cas clinique
         stats_by_specialty = []
-        # Note: Pour faire un GROUP BY propre via Django ORM sur une FK, c'est un peu verbeux.
-        # On va faire simple pour l'exemple : itérer sur les spécialités connues.
+        # On itère sur les spécialités connues (ordre d'affichage du Front).
         specialties = ["Cardiologie", "Pneumologie", "Urgence", "Gastro-entérologie"]
+        # Un seul GROUP BY pour toutes les spécialités (au lieu de 2 requêtes par spécialité)
+        per_specialty = {
+            row['clinical_case__specialty']: row
+            for row in sessions.filter(clinical_case__specialty__in=specialties)
+            .values('clinical_case__specialty').annotate(count=Count('id'), avg=Avg('score_rime'))
+        }
         
         for spec in specialties:
-            spec_sessions = sessions.filter(clinical_case__specialty=spec)
-            count = spec_sessions.count()
+            row = per_specialty.get(spec)
+            count = row['count'] if row else 0
             if count > 0:
-                avg_perf = spec_sessions.aggregate(Avg('score_rime'))['score_rime__avg'] or 0
+                avg_perf = row['avg'] or 0
                 stats_by_specialty.append({
                     "specialty": spec,
                     "attempts": count,
@@ -144,7 +215,7 @@ class DashboardStatsView(APIView):
         rime_details = {
             "reporter": 0, "interpreter": 0, "manager": 0, "educator": 0
         }
-        if sessions.exists():
+        if totals['count']:
             # Exemple de calcul simplifié (à améliorer si vous stockez le détail)
             rime_details = {
                 "reporter": int(global_score + 5) if global_score < 95 else 100,
@@ -1,3 +1,39 @@
 from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.urls import path, reverse
+from django.utils.html import format_html
+from .models import ProfileCapture
 
-# Register your models here.
+
+@admin.register(ProfileCapture)
+class ProfileCaptureAdmin(admin.ModelAdmin):
+    """Captures du profileur à la demande (tampon circulaire), téléchargeables pour flamegraph.pl / speedscope."""
+    list_display = ('created_at', 'method', 'path', 'route', 'status_code', 'duration_ms', 'samples', 'user', 'download')
+    list_filter = ('route', 'method')
+    readonly_fields = [f.name for f in ProfileCapture._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def delete_queryset(self, request, queryset):
+        # Suppression une par une : le fichier de chaque capture est retiré du disque
+        for capture in queryset:
+            capture.delete()
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/', self.admin_site.admin_view(self.download_view),
+                 name='simulation_profilecapture_download'),
+        ] + super().get_urls()
+
+    @admin.display(description="Fichier")
+    def download(self, obj):
+        url = reverse('admin:simulation_profilecapture_download', args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.file_name)
+
+    def download_view(self, request, pk):
+        capture = ProfileCapture.objects.filter(pk=pk).first()
+        if capture is None or not self.has_view_permission(request, capture) or not capture.file_path().exists():
+            raise Http404
+        return FileResponse(open(capture.file_path(), 'rb'), as_attachment=True,
+                            filename=capture.file_name, content_type='text/plain; charset=utf-8')
@@ -0,0 +1,124 @@
+"""
+Contrôle d'admission des appels LLM (CoDel).
+
+Le signal est le temps d'attente en file du répartiteur LLM (llm_dispatcher), par classe.
+Si ce délai reste au-dessus de la cible pendant tout un intervalle, la classe passe en mode
+"rejet" : une requête est rejetée (503 + Retry-After) au lieu de s'empiler, puis les rejets se
+rapprochent selon la loi de contrôle de CoDel (n-ième rejet INTERVAL / sqrt(n) après le précédent),
+les autres requêtes passant normalement. Le taux de rejet croît donc tant que la file reste
+lente. On sort du mode rejet dès qu'un délai mesuré repasse sous la cible.
+
+Le contrôle est fait par les vues juste avant l'appel LLM (AdmissionRejected) : les tours servis
+sans LLM (fast-path, ouverture spéculative, banque de Quiz) ne sont jamais rejetés.
+"""
+import math
+import time
+import threading
+from django.conf import settings
+from rest_framework.response import Response
+from .llm_dispatcher import llm_dispatcher, PRIORITY_CLASSES
+from .metrics import metrics
+
+
+class AdmissionRejected(Exception):
+    """File LLM saturée : la requête est rejetée avant l'appel."""
+
+    def __init__(self, workload_class, retry_after):
+        super().__init__(f"{workload_class} : réessayer dans {retry_after} s")
+        self.retry_after = retry_after
+
+
+def rejected_response(exc):
+    response = Response(
+        {"error": "Le simulateur est momentanément saturé. Réessayez dans quelques secondes."}, status=503
+    )
+    response['Retry-After'] = str(exc.retry_after)
+    return response
+
+
+class _CoDelState:
+    __slots__ = ('first_above_time', 'dropping', 'last_delay', 'count', 'drop_next')
+
+    def __init__(self):
+        self.first_above_time = 0.0
+        self.dropping = False
+        self.last_delay = 0.0
+        self.count = 0          # Rejets depuis l'entrée en mode rejet
+        self.drop_next = 0.0    # Prochain rejet (loi de contrôle)
+
+
+class AdmissionController:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.states = {cls: _CoDelState() for cls in PRIORITY_CLASSES}
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'LLM_ADMISSION_ENABLED', True)
+
+    @property
+    def target(self):
+        return getattr(settings, 'LLM_ADMISSION_TARGET', 2.0)
+
+    @property
+    def interval(self):
+        return getattr(settings, 'LLM_ADMISSION_INTERVAL', 5.0)
+
+    def observe(self, workload_class, delay):
+        """Nouveau délai d'attente mesuré (slot accordé, ou plus vieille demande encore en file)."""
+        now = time.monotonic()
+        with self._lock:
+            state = self.states.setdefault(workload_class, _CoDelState())
+            state.last_delay = delay
+            if delay < self.target:
+                state.first_above_time = 0.0
+                state.dropping = False
+            elif state.first_above_time == 0.0:
+                state.first_above_time = now + self.interval
+            elif now >= state.first_above_time and not state.dropping:
+                state.dropping = True
+                # Comme CoDel : retour rapide en mode rejet -> on reprend près du rythme précédent
+                recent = now - state.drop_next < 16 * self.interval
+                state.count = max(0, state.count - 2) if recent else 0
+                state.drop_next = now
+                metrics.increment('llm_admission_dropping_entered_total', workload_class=workload_class)
+
+    def admit(self, workload_class):
+        """Retourne (admis, retry_after_secondes)."""
+        if not self.enabled:
+            return True, 0
+
+        # La file peut être bloquée sans qu'aucun slot ne soit accordé : on mesure aussi l'attente en cours
+        # (file vide = plus d'attente, ce qui fait sortir du mode rejet)
+        oldest = llm_dispatcher.status()['oldest_wait_seconds'].get(workload_class, 0.0)
+        self.observe(workload_class, oldest)
+
+        now = time.monotonic()
+        with self._lock:
+            state = self.states.setdefault(workload_class, _CoDelState())
+            if not state.dropping or now < state.drop_next:
+                return True, 0
+            state.count += 1
+            state.drop_next = now + self.interval / math.sqrt(state.count)
+            retry_after = max(1, math.ceil(max(state.last_delay, self.interval)))
+
+        metrics.increment('llm_admission_rejected_total', workload_class=workload_class)
+        return False, retry_after
+
+    def check(self, workload_class):
+        """À appeler juste avant l'appel LLM : lève AdmissionRejected si la requête est rejetée."""
+        admitted, retry_after = self.admit(workload_class)
+        if not admitted:
+            raise AdmissionRejected(workload_class, retry_after)
+
+    def status(self):
+        with self._lock:
+            return {
+                cls: {"dropping": s.dropping, "drops": s.count, "last_delay_seconds": round(s.last_delay, 3)}
+                for cls, s in self.states.items()
+            }
+
+
+admission_controller = AdmissionController()
+llm_dispatcher.add_wait_observer(admission_controller.observe)
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class SimulationConfig(AppConfig):
     name = 'simulation'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .request_timing import install_db_timing
+        # Temps BDD par requête (Server-Timing) sur toutes les connexions
+        connection_created.connect(install_db_timing)
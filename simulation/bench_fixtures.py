@@ -0,0 +1,143 @@
+"""
+Données réalistes pour les benchmarks (cas clinique volumineux, longues conversations).
+Aucune dépendance à la BDD : tout est construit en mémoire.
+"""
+import json
+import random
+
+DOCTOR_QUESTIONS = [
+    "Bonjour, qu'est-ce qui vous amène aujourd'hui ?",
+    "Depuis quand avez-vous cette douleur ?",
+    "Est-ce que la douleur irradie dans le bras gauche ou la mâchoire ?",
+    "Sur une échelle de 0 à 10, quelle est l'intensité ?",
+    "Avez-vous des antécédents médicaux particuliers ?",
+    "Y a-t-il des maladies cardiaques dans votre famille ?",
+    "Êtes-vous allergique à certains médicaments ?",
+    "Quels médicaments prenez-vous actuellement ?",
+    "Vous fumez ? Vous buvez de l'alcool ?",
+    "Avez-vous de la fièvre ou des frissons ?",
+    "Êtes-vous essoufflé quand vous montez les escaliers ?",
+    "Avez-vous fait un malaise ou perdu connaissance ?",
+]
+
+PATIENT_ANSWERS = [
+    "J'ai mal dans la poitrine, ça serre très fort depuis ce matin.",
+    "Ça a commencé il y a environ deux heures, au repos.",
+    "Oui, ça descend un peu dans le bras gauche.",
+    "Je dirais 8 sur 10, c'est vraiment dur.",
+    "J'ai de la tension, je prends un médicament pour ça.",
+    "Mon père est mort d'une crise cardiaque à 55 ans.",
+    "Oui, la pénicilline, j'avais gonflé.",
+    "Juste le Ramipril le matin.",
+    "Je fume un paquet par jour depuis 20 ans, et un peu d'alcool le week-end.",
+    "Un peu chaud peut-être, je ne sais pas.",
+    "Un peu, oui, plus qu'avant.",
+    "Non, je ne suis pas tombé.",
+]
+
+
+def make_case_data(nb_symptomes=12, nb_examens=25):
+    """Cas clinique volumineux, au format `case_data` de sync_validated_cases."""
+    return {
+        "codeUUID": "bench-case-0001",
+        "ageTranche": "40-50",
+        "sexe": "M",
+        "contexteVrai": "Douleur thoracique constrictive apparue au repos. " * 20,
+        "parametresVitaux": {"FC": "98", "TA": "145/90", "Temp": "38.2", "SpO2": "97"},
+        "symptomes": [
+            {
+                "nomDuSymptome": f"Symptôme {i}",
+                "localisationSymptome": "Rétrosternale",
+                "dureeSymptome": f"{i} heures",
+                "degreDIntensite": f"{i % 10}/10",
+            }
+            for i in range(nb_symptomes)
+        ],
+        "antecedentsFamiliaux": "Père décédé d'un infarctus à 55 ans",
+        "allergies": [{"nom": "Pénicilline", "reaction": "Œdème"}],
+        "maladies": [{"nom": "Hypertension artérielle", "dateDeDebut": "2018", "traitementsSuivis": "Ramipril"}],
+        "chirurgie": [{"nom": "Appendicectomie"}],
+        "traitementsMedicamenteux": [{"nom": "Ramipril 5mg"}],
+        "diagnosticNom": "Syndrome Coronarien Aigu",
+        "specialiteDiagnostic": "Cardiologie",
+        "examens": [
+            {"nom": f"Examen {i}", "resultat": f"Valeur {i} dans les normes"} for i in range(nb_examens - 3)
+        ] + [
+            {"nom": "ECG", "resultat": "Sus-décalage du segment ST en territoire antérieur"},
+            {"nom": "Troponine", "resultat": "450 ng/L (élevée)"},
+            {"nom": "Radiographie thoracique", "resultat": "Pas d'anomalie pleuro-parenchymateuse"},
+        ],
+    }
+
+
+def make_chat_history(nb_turns=200, seed=42):
+    """Historique alterné médecin/patient de `nb_turns` messages."""
+    rnd = random.Random(seed)
+    history = []
+    for i in range(nb_turns):
+        if i % 2 == 0:
+            history.append({"role": "doctor", "content": rnd.choice(DOCTOR_QUESTIONS)})
+        else:
+            history.append({"role": "patient", "content": rnd.choice(PATIENT_ANSWERS)})
+    return history
+
+
+def make_actions_log(nb_actions=10):
+    actions = [{"action_type": "EXAMEN", "details": {"exam_name": f"Examen {i}"}} for i in range(nb_actions - 1)]
+    actions.append({"action_type": "DIAGNOSTIC_FINAL", "details": {"diagnostic": "Syndrome Coronarien Aigu"}})
+    return actions
+
+
+def make_quiz(nb_questions=15):
+    return [
+        {
+            "id": f"q{i + 1}",
+            "category": "Diagnostic",
+            "question": f"Question {i + 1} : quelle est la conduite à tenir devant ce tableau clinique ?",
+            "options": {"a": "Option A", "b": "Option B", "c": "Option C", "d": "Option D"},
+            "correct_answer": "abcd"[i % 4],
+            "explanation": "Explication détaillée de la bonne réponse. " * 3,
+        }
+        for i in range(nb_questions)
+    ]
+
+
+def make_noisy_llm_outputs(nb_questions=15):
+    """Sorties LLM réalistes : JSON brut, bloc Markdown, liste noyée dans du texte."""
+    quiz = json.dumps(make_quiz(nb_questions), ensure_ascii=False, indent=2)
+    return {
+        "raw": quiz,
+        "markdown": f"```json\n{quiz}\n```",
+        "prose": f"Voici le test demandé, adapté à votre profil :\n\n{quiz}\n\nBonne chance pour la suite !",
+    }
+
+
+def make_test_answers(nb_questions=15, seed=42):
+    """(bonnes réponses, réponses de l'apprenant) au format de SubmitTestView."""
+    rnd = random.Random(seed)
+    correct = {q['id']: q['correct_answer'] for q in make_quiz(nb_questions)}
+    answers = {q_id: rnd.choice("abcd") for q_id in correct}
+    return correct, answers
+
+
+def make_remote_case(nb_notes=20):
+    """Cas tel que renvoyé par le Backend Expert (entrée de sync_validated_cases)."""
+    return {
+        "patient_uuid": "bench-remote-0001",
+        "age_tranche": "40-50",
+        "sexe": "M",
+        "specialite_confirmee": "Cardiology (adult)",
+        "patient_info_raw": {
+            "parametresVitaux": [
+                {"frequenceCardiaqueBpm": 98, "tensionArterielle": "145/90", "temperatureCelsius": 38.2},
+                {"frequenceCardiaqueBpm": 90, "tensionArterielle": "140/85", "temperatureCelsius": 37.5},
+            ]
+        },
+        "motif_consultation": [{
+            "motif": "Douleur thoracique",
+            "notes": [{"contenu": f"Note clinique {i}."} for i in range(nb_notes)],
+            "enrichissement_ia": {
+                "symptomes_detectes": {"localisation": "Rétrosternale", "duree": "2h", "degre_intensite": 8}
+            },
+        }],
+    }
@@ -0,0 +1,96 @@
+"""
+Coalescence des appels LLM identiques en cours (single-flight, par process).
+
+Quand une promotion démarre le même cas au même moment, N requêtes envoient le même prompt à
+quelques millisecondes d'intervalle. La première (leader) fait l'appel ; les suivantes
+(followers) attendent son résultat au lieu de relancer un appel identique.
+La clé est l'empreinte de la requête complète (modèle, contenus, config avec l'instruction système),
+la même que celle des cassettes (llm_cassette.request_key).
+
+Compatible sync (threads) et async (une boucle par requête sous WSGI, une par worker sous ASGI) :
+le résultat transite par un concurrent.futures.Future, attendu via asyncio.wrap_future côté async.
+Les compteurs llm_coalesced_requests_total{workload, role=leader|follower} donnent le taux de
+coalescence (followers / total).
+"""
+import asyncio
+import threading
+from concurrent.futures import Future
+from .metrics import metrics
+
+
+class LeaderCancelled(Exception):
+    """L'appel partagé a été abandonné par son leader (requête annulée) : chacun refait le sien."""
+
+
+class RequestCoalescer:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+
+    def _join(self, key, workload):
+        """(future, leader) : crée l'appel en cours pour `key` ou rejoint celui qui existe."""
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                # « En cours » : l'annulation d'un follower (wrap_future) ne peut pas l'annuler pour tous
+                future.set_running_or_notify_cancel()
+        metrics.increment('llm_coalesced_requests_total', workload=workload,
+                          role='leader' if leader else 'follower')
+        return future, leader
+
+    def _finish(self, key, future, result=None, error=None):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def call(self, key, workload, func):
+        """Version sync : func() n'est exécutée qu'une fois pour les appels simultanés de même clé."""
+        future, leader = self._join(key, workload)
+        if not leader:
+            try:
+                return future.result()
+            except LeaderCancelled:
+                return func()
+        try:
+            result = func()
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        except BaseException:
+            self._finish(key, future, error=LeaderCancelled())
+            raise
+        self._finish(key, future, result)
+        return result
+
+    async def acall(self, key, workload, coro_factory):
+        """Version async de call() : coro_factory() n'est attendue qu'une fois."""
+        future, leader = self._join(key, workload)
+        if not leader:
+            try:
+                return await asyncio.wrap_future(future)
+            except LeaderCancelled:
+                # Requête du leader annulée (client parti) : on fait l'appel nous-mêmes
+                return await coro_factory()
+        try:
+            result = await coro_factory()
+        except asyncio.CancelledError:
+            self._finish(key, future, error=LeaderCancelled())
+            raise
+        except Exception as e:
+            self._finish(key, future, error=e)
+            raise
+        self._finish(key, future, result)
+        return result
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._in_flight)
+
+
+coalescer = RequestCoalescer()
@@ -0,0 +1,140 @@
+"""
+État d'évaluation incrémental d'une session de simulation.
+
+Mis à jour à chaque tour de chat / action (simple recherche de mots-clés, pas d'appel LLM),
+il permet au Tuteur d'évaluer la session finale à partir d'un résumé compact
+plutôt que de la conversation complète.
+"""
+import re
+from .text_utils import normalize_text
+
+STATE_VERSION = 1
+
+# Nombre de derniers échanges envoyés au Tuteur en plus de l'état compact
+RECENT_TURNS = 6
+
+# Thèmes d'anamnèse (mots-clés normalisés : minuscules, sans accents). Chaque mot-clé est un mot ou
+# une expression entière ; suffixe "*" : radical ("fum*" -> fumez, fumeur, mais pas parfum)
+ANAMNESIS_TOPICS = {
+    "motif": ["amene*", "pourquoi", "motif", "what brings", "why are you"],
+    "douleur": ["douleur*", "mal", "souffr*", "pain*", "hurt*"],
+    "chronologie": ["depuis", "combien de temps", "debut*", "how long", "since when"],
+    "caracteristiques": ["intensite", "echelle", "irradi*", "type de douleur", "serre*", "brulure*", "scale"],
+    "antecedents_personnels": ["antecedent*", "maladie*", "opere*", "chirurg*", "hospitalis*", "medical history"],
+    "antecedents_familiaux": ["famil*", "pere", "mere", "parents", "frere*", "soeur*"],
+    "allergies": ["allerg*"],
+    "traitements": ["medicament*", "traitement*", "prenez", "medication*", "pill*"],
+    "mode_de_vie": ["fum*", "tabac", "cigarette*", "alcool*", "sport*", "travail*", "metier*", "smok*", "alcohol",
+                    "work*"],
+    "voyage_contexte": ["voyag*", "animaux", "habitat", "travel*"],
+}
+
+# Signes d'alarme explorés par l'étudiant
+RED_FLAGS = {
+    "fievre": ["fievre*", "temperature*", "frisson*", "fever*"],
+    "dyspnee": ["essouffl*", "respir*", "dyspn*", "souffle*", "breath*"],
+    "syncope": ["malaise*", "evanoui*", "perte de connaissance", "faint*"],
+    "irradiation": ["irradi*", "bras gauche", "machoire", "dos", "radiat*"],
+    "saignement": ["sang*", "saign*", "bleed*", "blood*"],
+    "perte_de_poids": ["poids", "maigri*", "weight*"],
+    "deficit_neurologique": ["paralys*", "parole", "vision", "engourd*", "numb*"],
+}
+
+
+def _keyword_regex(keyword):
+    if keyword.endswith("*"):
+        return rf"\b{re.escape(keyword[:-1])}\w*"
+    return rf"\b{re.escape(keyword)}\b"
+
+
+def _compile(table):
+    return {
+        key: re.compile("|".join(_keyword_regex(k) for k in keywords))
+        for key, keywords in table.items()
+    }
+
+
+_TOPIC_PATTERNS = _compile(ANAMNESIS_TOPICS)
+_RED_FLAG_PATTERNS = _compile(RED_FLAGS)
+
+
+def new_evaluation_state():
+    return {
+        "version": STATE_VERSION,
+        "doctor_turns": 0,
+        "topics": {},       # {"douleur": 3, ...} : nombre de questions par thème
+        "red_flags": [],
+        "exams": [],
+        "treatments": [],
+        "diagnostics": [],
+        "notes": 0,
+    }
+
+
+def has_evaluation_state(state):
+    return bool(state) and state.get("version") == STATE_VERSION
+
+
+def update_state_with_turn(state, doctor_message):
+    """Met à jour l'état après une question du médecin (étudiant)."""
+    if not has_evaluation_state(state):
+        return state
+    text = normalize_text(doctor_message)
+    state["doctor_turns"] += 1
+    for topic, pattern in _TOPIC_PATTERNS.items():
+        if pattern.search(text):
+            state["topics"][topic] = state["topics"].get(topic, 0) + 1
+    for flag, pattern in _RED_FLAG_PATTERNS.items():
+        if flag not in state["red_flags"] and pattern.search(text):
+            state["red_flags"].append(flag)
+    return state
+
+
+def format_action_details(details):
+    """Détails d'une action en texte lisible (jamais la repr Python d'un dict)."""
+    if isinstance(details, dict):
+        return "; ".join(f"{key} : {format_action_details(value)}" for key, value in details.items()
+                         if value not in (None, "", [], {}))
+    if isinstance(details, (list, tuple)):
+        return ", ".join(format_action_details(value) for value in details)
+    return "" if details is None else str(details)
+
+
+def _action_label(details):
+    if isinstance(details, dict):
+        for key in ("exam_name", "name", "nom", "diagnostic", "treatment", "label"):
+            if details.get(key):
+                return str(details[key])
+    return format_action_details(details)
+
+
+def update_state_with_action(state, action_type, details):
+    """Met à jour l'état après une action (examen, traitement, diagnostic, note)."""
+    if not has_evaluation_state(state):
+        return state
+    label = _action_label(details)
+    if action_type == "EXAMEN":
+        if label not in state["exams"]:
+            state["exams"].append(label)
+    elif action_type == "TRAITEMENT":
+        state["treatments"].append(label)
+    elif action_type in ("DIAGNOSTIC", "DIAGNOSTIC_FINAL"):
+        state["diagnostics"].append(label)
+    else:
+        state["notes"] += 1
+    return state
+
+
+def format_state_for_prompt(state):
+    """Résumé texte de l'état, injecté dans le prompt du Tuteur."""
+    missing = [t for t in ANAMNESIS_TOPICS if t not in state["topics"]]
+    topics = ", ".join(f"{t} ({n} question(s))" for t, n in state["topics"].items()) or "aucun"
+    return f"""
+    Nombre de questions posées : {state['doctor_turns']}
+    Thèmes d'anamnèse abordés : {topics}
+    Thèmes d'anamnèse NON abordés : {", ".join(missing) or "aucun"}
+    Signes d'alarme explorés : {", ".join(state['red_flags']) or "aucun"}
+    Examens demandés : {", ".join(state['exams']) or "aucun"}
+    Traitements proposés : {", ".join(state['treatments']) or "aucun"}
+    Diagnostic(s) proposé(s) : {", ".join(state['diagnostics']) or "aucun"}
+    """
@@ -0,0 +1,195 @@
+"""
+Moteur de résultats d'examens déterministe.
+
+Les résultats sont lus directement dans `case_data['examens']` et `case_data['parametresVitaux']`
+(index construit une fois par cas), sans appel au LLM : pas de latence Gemini et pas de valeurs inventées.
+"""
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from .text_utils import normalize_text
+
+# Nom canonique -> synonymes / abréviations (normalisés : minuscules, sans accents)
+EXAM_SYNONYMS = {
+    "ecg": ["electrocardiogramme", "ekg", "electro cardiogramme"],
+    "troponine": ["tropo", "troponin", "troponine us", "tnt", "tni"],
+    "nfs": ["numeration formule sanguine", "hemogramme", "cbc", "blood count", "numeration sanguine"],
+    "crp": ["proteine c reactive", "c reactive protein"],
+    "ionogramme": ["iono", "ionogramme sanguin", "electrolytes"],
+    "glycemie": ["glucose", "glycemie capillaire", "dextro"],
+    "creatinine": ["creat", "fonction renale", "clairance"],
+    "d dimeres": ["ddimeres", "d dimer", "d dimers"],
+    "gaz du sang": ["gds", "gazometrie", "gaz du sang arteriel", "abg"],
+    "radiographie thoracique": [
+        "radio thoracique", "radio pulmonaire", "radio du thorax", "rx thorax",
+        "radiographie pulmonaire", "chest x ray",
+    ],
+    "echographie abdominale": ["echo abdominale", "echographie abdomen", "abdominal ultrasound"],
+    "echocardiographie": ["echo cardiaque", "echographie cardiaque", "ett"],
+    "scanner": ["tdm", "tomodensitometrie", "ct scan", "ct"],
+    "bandelette urinaire": ["bu", "urine dipstick", "bandelette"],
+    "bilan hepatique": ["transaminases", "asat alat", "bilan hepatique complet"],
+    "lipase": ["lipasemie"],
+}
+
+# Paramètres vitaux : clé de `parametresVitaux` -> synonymes
+VITAL_SYNONYMS = {
+    "FC": ["fc", "frequence cardiaque", "pouls", "heart rate", "pulse"],
+    "TA": ["ta", "pa", "tension", "tension arterielle", "pression arterielle", "blood pressure"],
+    "Temp": ["temp", "temperature", "thermometre"],
+    "SpO2": ["spo2", "saturation", "oxymetrie", "sat", "saturometre"],
+}
+
+VITAL_LABELS = {
+    "FC": "Fréquence cardiaque",
+    "TA": "Tension artérielle",
+    "Temp": "Température",
+    "SpO2": "Saturation en oxygène",
+}
+
+VITAL_UNITS = {"FC": "bpm", "TA": "mmHg", "Temp": "°C", "SpO2": "%"}
+
+# Champs possibles contenant le résultat dans un examen du dossier
+RESULT_FIELDS = ("resultat", "résultat", "result", "valeur", "interpretation", "conclusion", "observation")
+NAME_FIELDS = ("nom", "name", "exam_name", "libelle")
+
+NORMAL_RESULT_TEMPLATE = "{name} : résultat dans les limites de la normale."
+# Examen prévu par le dossier mais sans résultat : on ne présume pas qu'il est normal
+MISSING_RESULT_TEMPLATE = "{name} : résultat non disponible au dossier."
+
+
+def _build_alias_table(table):
+    aliases = {}
+    for canonical, synonyms in table.items():
+        for alias in [canonical, *synonyms]:
+            aliases[normalize_text(alias)] = canonical
+    return aliases
+
+
+_EXAM_ALIASES = _build_alias_table(EXAM_SYNONYMS)
+_VITAL_ALIASES = _build_alias_table(VITAL_SYNONYMS)
+
+
+def canonical_exam_name(name):
+    """Nom normalisé puis ramené à sa forme canonique si c'est un synonyme connu."""
+    norm = normalize_text(name)
+    return _EXAM_ALIASES.get(norm, norm)
+
+
+def _exam_name(exam):
+    if isinstance(exam, dict):
+        for field in NAME_FIELDS:
+            if exam.get(field):
+                return str(exam[field])
+        return ""
+    return str(exam)
+
+
+def _exam_result_text(exam):
+    if not isinstance(exam, dict):
+        return None
+    for field in RESULT_FIELDS:
+        value = exam.get(field)
+        if value not in (None, "", [], {}):
+            return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+    return None
+
+
+class ExamIndex:
+    """Index des examens et paramètres vitaux d'un cas clinique."""
+
+    def __init__(self, case_data):
+        self.exams = {}
+        for exam in case_data.get('examens') or []:
+            name = _exam_name(exam)
+            if name:
+                self.exams[canonical_exam_name(name)] = (name, exam)
+
+        vitals = case_data.get('parametresVitaux') or {}
+        if isinstance(vitals, list):
+            # Format brut (liste horodatée) : on prend le plus récent comme sync_validated_cases
+            vitals = vitals[0] if vitals else {}
+        self.vitals = {k: v for k, v in vitals.items() if v not in (None, "", "?", "N/A")}
+
+    @staticmethod
+    def _case_result(requested_name, match):
+        name, exam = match
+        result = _exam_result_text(exam)
+        if result is None:
+            return {"exam_name": requested_name, "matched": name,
+                    "result": MISSING_RESULT_TEMPLATE.format(name=name), "source": "case_missing"}
+        return {"exam_name": requested_name, "matched": name, "result": result, "source": "case"}
+
+    def resolve(self, requested_name):
+        """Retourne le résultat d'un examen demandé (nom libre) sous forme de dict."""
+        requested_name = str(requested_name or "").strip()
+        norm = normalize_text(requested_name)
+        canonical = _EXAM_ALIASES.get(norm, norm)
+
+        # 1. Examen présent dans le dossier (nom exact ou synonyme)
+        match = self.exams.get(canonical)
+        if match:
+            return self._case_result(requested_name, match)
+
+        # 2. Paramètre vital
+        vital_key = _VITAL_ALIASES.get(norm)
+        if vital_key and vital_key in self.vitals:
+            label = VITAL_LABELS.get(vital_key, vital_key)
+            unit = VITAL_UNITS.get(vital_key, "")
+            return {
+                "exam_name": requested_name,
+                "matched": vital_key,
+                "result": f"{label} : {self.vitals[vital_key]} {unit}".strip(),
+                "source": "vitals",
+            }
+
+        # 3. Correspondance partielle par mots entiers, demande plus précise que l'examen du dossier
+        # ("ECG 12 dérivations" -> "ECG") ; l'examen le plus spécifique, s'il est unique
+        words = set(canonical.split())
+        candidates = [(len(key.split()), key) for key in self.exams if words and set(key.split()) <= words]
+        if candidates:
+            best = max(n for n, _ in candidates)
+            keys = [key for n, key in candidates if n == best]
+            if len(keys) == 1:
+                return self._case_result(requested_name, self.exams[keys[0]])
+
+        # 4. Examen inconnu du dossier : résultat normal templaté
+        return {
+            "exam_name": requested_name,
+            "matched": None,
+            "result": NORMAL_RESULT_TEMPLATE.format(name=requested_name or "Examen"),
+            "source": "default",
+        }
+
+
+# Cache des index par cas (borné). L'empreinte invalide l'index si le cas est resynchronisé.
+# Verrou : appelé depuis les threads de sync_to_async
+_INDEX_CACHE = OrderedDict()
+_INDEX_LOCK = threading.Lock()
+_INDEX_CACHE_SIZE = 256
+
+
+def _fingerprint(case_data):
+    payload = json.dumps(
+        [case_data.get('examens'), case_data.get('parametresVitaux')], sort_keys=True, default=str
+    )
+    return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def get_exam_index(case_key, case_data):
+    """Index du cas `case_key` (UUID du cas), construit au premier chargement puis réutilisé."""
+    fingerprint = _fingerprint(case_data)
+    with _INDEX_LOCK:
+        cached = _INDEX_CACHE.get(case_key)
+        if cached and cached[0] == fingerprint:
+            _INDEX_CACHE.move_to_end(case_key)
+            return cached[1]
+
+    index = ExamIndex(case_data)  # Construit hors verrou (deux threads peuvent le construire, sans gravité)
+    with _INDEX_LOCK:
+        _INDEX_CACHE[case_key] = (fingerprint, index)
+        _INDEX_CACHE.move_to_end(case_key)
+        if len(_INDEX_CACHE) > _INDEX_CACHE_SIZE:
+            _INDEX_CACHE.popitem(last=False)
+    return index
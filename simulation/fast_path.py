@@ -0,0 +1,178 @@
+"""
+Réponses rapides du patient aux questions factuelles (allergies, traitements, antécédents, constantes).
+
+Un classifieur d'intention léger (tables de regex compilées une fois par langue) reconnaît les
+questions simples dont la réponse est écrite telle quelle dans `case_data`. La réponse est alors
+formulée en langage profane par un template, sans appel à Gemini. Tout le reste passe au LLM.
+"""
+import re
+from .text_utils import normalize_text
+
+# Au-delà, la question contient probablement plusieurs demandes : on laisse le LLM répondre
+MAX_FAST_PATH_LENGTH = 120
+
+# Intention -> motifs (appliqués sur le texte normalisé : minuscules, sans accents)
+INTENT_PATTERNS = {
+    'fr': {
+        'allergies': [r"\ballergi"],
+        'traitements': [r"\bmedicaments?\b", r"\btraitements?\b", r"\bprenez vous\b", r"\bvous prenez\b"],
+        'antecedents_familiaux': [r"\bfamille\b", r"\bfamiliaux\b", r"\bvos parents\b", r"\bvotre (pere|mere)\b"],
+        'maladies': [r"\bmaladies?\b", r"\bantecedents? (medicaux|personnels)\b", r"\bproblemes? de sante\b"],
+        'chirurgie': [r"\bopere", r"\bchirurgi", r"\boperations?\b"],
+        'tension': [r"\btension\b", r"\bpression arterielle\b"],
+        'temperature': [r"\btemperature\b", r"\bfievre\b"],
+        'pouls': [r"\bpouls\b", r"\bfrequence cardiaque\b"],
+    },
+    'en': {
+        'allergies': [r"\ballerg"],
+        'traitements': [r"\bmedications?\b", r"\bmedicines?\b", r"\btreatments?\b", r"\bpills\b"],
+        'antecedents_familiaux': [r"\bfamily\b", r"\byour (father|mother|parents)\b"],
+        'maladies': [r"\bmedical history\b", r"\billness(es)?\b", r"\bconditions?\b"],
+        'chirurgie': [r"\bsurger(y|ies)\b", r"\boperat(ed|ion)\b"],
+        'tension': [r"\bblood pressure\b"],
+        'temperature': [r"\btemperature\b", r"\bfever\b"],
+        'pouls': [r"\bpulse\b", r"\bheart rate\b"],
+    },
+}
+
+# Compilation unique au chargement du module : {langue: [(intention, regex), ...]}
+_COMPILED = {
+    lang: [(intent, re.compile("|".join(patterns))) for intent, patterns in table.items()]
+    for lang, table in INTENT_PATTERNS.items()
+}
+
+# Valeurs du dossier considérées comme "rien à signaler"
+EMPTY_VALUES = {"", "aucun", "aucune", "none", "neant", "n a", "na", "non", "rien", "ras"}
+
+TEMPLATES = {
+    'fr': {
+        'allergies_yes': "Oui, j'ai une allergie connue : {items}.",
+        'allergies_no': "Non, je n'ai pas d'allergie que je connaisse.",
+        'traitements_yes': "En ce moment je prends {items}.",
+        'traitements_no': "Non, je ne prends aucun médicament en ce moment.",
+        'antecedents_familiaux_yes': "Dans ma famille, oui : {items}.",
+        'antecedents_familiaux_no': "Pas que je sache, il n'y a rien de particulier dans ma famille.",
+        'maladies_yes': "Oui, le médecin m'a dit que j'avais : {items}.",
+        'maladies_no': "Non, je n'ai pas de problème de santé particulier.",
+        'chirurgie_yes': "Oui, j'ai déjà été {opere} : {items}.",
+        'chirurgie_no': "Non, je n'ai jamais été {opere}.",
+        'tension': "La dernière fois qu'on me l'a prise, ma tension était à {value}.",
+        'temperature': "On m'a pris la température tout à l'heure, j'avais {value} °C.",
+        'pouls': "On m'a dit que mon cœur battait à {value} par minute.",
+        'reaction': "{name} (ça m'avait fait : {reaction})",
+        'since': "{name} (depuis {date})",
+    },
+    'en': {
+        'allergies_yes': "Yes, I have a known allergy: {items}.",
+        'allergies_no': "No, I don't have any allergies that I know of.",
+        'traitements_yes': "Right now I'm taking {items}.",
+        'traitements_no': "No, I'm not taking any medication at the moment.",
+        'antecedents_familiaux_yes': "In my family, yes: {items}.",
+        'antecedents_familiaux_no': "Not that I know of, nothing special in my family.",
+        'maladies_yes': "Yes, the doctor told me I have: {items}.",
+        'maladies_no': "No, I don't have any particular health problems.",
+        'chirurgie_yes': "Yes, I've had surgery: {items}.",
+        'chirurgie_no': "No, I've never had surgery.",
+        'tension': "Last time they checked, my blood pressure was {value}.",
+        'temperature': "They took my temperature earlier, it was {value} °C.",
+        'pouls': "They told me my heart rate was {value} per minute.",
+        'reaction': "{name} (I had: {reaction})",
+        'since': "{name} (since {date})",
+    },
+}
+
+VITAL_INTENTS = {'tension': 'TA', 'temperature': 'Temp', 'pouls': 'FC'}
+
+# Intentions plus spécifiques qui l'emportent sur d'autres ("maladies dans votre famille")
+INTENT_PRECEDENCE = {
+    'antecedents_familiaux': {'maladies', 'chirurgie'},
+}
+
+
+def classify_intent(message, language='fr'):
+    """Retourne l'intention factuelle reconnue, ou None si la question n'est pas 'simple'."""
+    if not message or len(message) > MAX_FAST_PATH_LENGTH or message.count('?') > 1:
+        return None
+    text = normalize_text(message)
+    matches = [intent for intent, pattern in _COMPILED.get(language, _COMPILED['fr']) if pattern.search(text)]
+    for intent in list(matches):
+        matches = [m for m in matches if m not in INTENT_PRECEDENCE.get(intent, ())]
+    # Une seule intention : sinon la question est ambiguë ou composée
+    return matches[0] if len(matches) == 1 else None
+
+
+def _is_empty(value):
+    return normalize_text(value) in EMPTY_VALUES
+
+
+def _lower_first(text):
+    return text[:1].lower() + text[1:] if text else text
+
+
+def _named_items(entries, templates, extra=None):
+    """Liste de noms lisibles à partir des listes [{'nom': ...}] du dossier."""
+    items = []
+    for entry in entries or []:
+        if isinstance(entry, dict):
+            name = str(entry.get('nom') or '').strip()
+            if _is_empty(name):
+                continue
+            if extra == 'reaction' and entry.get('reaction'):
+                name = templates['reaction'].format(name=name, reaction=_lower_first(str(entry['reaction'])))
+            elif extra == 'since' and entry.get('dateDeDebut'):
+                name = templates['since'].format(name=name, date=entry['dateDeDebut'])
+            items.append(_lower_first(name))
+        elif not _is_empty(entry):
+            items.append(_lower_first(str(entry)))
+    return items
+
+
+def _join(items, language):
+    if len(items) <= 1:
+        return "".join(items)
+    last = " et " if language == 'fr' else " and "
+    return ", ".join(items[:-1]) + last + items[-1]
+
+
+def build_answer(intent, case_data, language='fr'):
+    """Formule la réponse du patient pour une intention factuelle, ou None si l'info manque."""
+    templates = TEMPLATES.get(language, TEMPLATES['fr'])
+
+    if intent in VITAL_INTENTS:
+        vitals = case_data.get('parametresVitaux') or {}
+        value = vitals.get(VITAL_INTENTS[intent]) if isinstance(vitals, dict) else None
+        if value is None or _is_empty(value) or str(value).strip() == '?':
+            return None
+        return templates[intent].format(value=value)
+
+    if intent == 'allergies':
+        items = _named_items(case_data.get('allergies'), templates, extra='reaction')
+    elif intent == 'traitements':
+        items = _named_items(case_data.get('traitementsMedicamenteux'), templates)
+        # Les traitements des maladies chroniques comptent aussi
+        for maladie in case_data.get('maladies') or []:
+            if isinstance(maladie, dict) and not _is_empty(maladie.get('traitementsSuivis') or ''):
+                suivi = _lower_first(str(maladie['traitementsSuivis']))
+                if not any(normalize_text(item).startswith(normalize_text(suivi)) for item in items):
+                    items.append(suivi)
+    elif intent == 'antecedents_familiaux':
+        value = str(case_data.get('antecedentsFamiliaux') or '').strip()
+        items = [] if _is_empty(value) else [_lower_first(value.rstrip('.'))]
+    elif intent == 'maladies':
+        items = _named_items(case_data.get('maladies'), templates, extra='since')
+    elif intent == 'chirurgie':
+        items = _named_items(case_data.get('chirurgie'), templates)
+    else:
+        return None
+
+    opere = "opérée" if str(case_data.get('sexe', '')).upper().startswith('F') else "opéré"
+    key = f"{intent}_yes" if items else f"{intent}_no"
+    return templates[key].format(items=_join(items, language), opere=opere)
+
+
+def answer_factual_question(case_data, message, language='fr'):
+    """Point d'entrée : réponse templatée si la question est factuelle et simple, sinon None."""
+    intent = classify_intent(message, language)
+    if not intent:
+        return None
+    return build_answer(intent, case_data, language)
@@ -0,0 +1,108 @@
+"""
+Requêtes LLM "hedgées" pour couper la latence de queue (p99) des réponses patient.
+
+Si le premier appel n'a pas abouti après un seuil adaptatif (p95 observé), un second appel
+identique est lancé ; le premier qui réussit gagne, l'autre est annulé. Un budget (token bucket)
+plafonne la dépense supplémentaire.
+"""
+import asyncio
+import time
+import threading
+from collections import deque
+from django.conf import settings
+from .metrics import metrics, percentile
+
+MIN_SAMPLES = 20          # En dessous, on utilise le délai initial
+SAMPLE_WINDOW = 500
+BUCKET_CAPACITY = 5.0     # Rafale max de hedges consécutifs
+
+
+class HedgePolicy:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.samples = deque(maxlen=SAMPLE_WINDOW)
+        self.tokens = BUCKET_CAPACITY
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'LLM_HEDGING_ENABLED', False)
+
+    def threshold(self):
+        """Délai avant d'envoyer le second appel : percentile observé, borné par un minimum."""
+        min_delay = getattr(settings, 'LLM_HEDGE_MIN_DELAY', 1.0)
+        with self._lock:
+            samples = list(self.samples)
+        if len(samples) < MIN_SAMPLES:
+            return max(min_delay, getattr(settings, 'LLM_HEDGE_INITIAL_DELAY', 4.0))
+        return max(min_delay, percentile(samples, getattr(settings, 'LLM_HEDGE_PERCENTILE', 95)))
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def on_request(self):
+        # Chaque requête crédite le budget : au plus LLM_HEDGE_BUDGET hedges par requête en moyenne
+        with self._lock:
+            self.tokens = min(BUCKET_CAPACITY, self.tokens + getattr(settings, 'LLM_HEDGE_BUDGET', 0.05))
+
+    def try_acquire(self):
+        with self._lock:
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+hedge_policy = HedgePolicy()
+
+
+async def hedged_call(call_factory, policy=hedge_policy):
+    """
+    Exécute `call_factory()` (coroutine) avec hedging.
+    Retourne le résultat du premier appel réussi ; lève l'erreur si les deux échouent.
+    """
+    policy.on_request()
+    metrics.increment('llm_hedge_requests_total')
+    start = time.perf_counter()
+    hedged = False
+
+    def record_primary(task):
+        # Le seuil ne se nourrit que de l'appel principal : un hedge gagnant n'est pas un échantillon.
+        # Principal annulé par le hedge : sa latence dépasse la durée écoulée (borne basse, au-delà du seuil)
+        if task.cancelled() and not hedged:
+            return
+        if not task.cancelled() and task.exception() is not None:
+            return
+        policy.record_latency(time.perf_counter() - start)
+
+    primary = asyncio.ensure_future(call_factory())
+    primary.add_done_callback(record_primary)
+    secondary = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=policy.threshold())
+        if done or not policy.try_acquire():
+            if not done:
+                metrics.increment('llm_hedge_budget_exhausted_total')
+            return await primary
+
+        # Le premier appel est lent : on lance le second
+        metrics.increment('llm_hedges_total')
+        hedged = True
+        secondary = asyncio.ensure_future(call_factory())
+        pending = {primary, secondary}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is secondary:
+                        metrics.increment('llm_hedge_wins_total')
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        # Le perdant est annulé (libère la connexion HTTP en cours), comme les deux appels si la requête l'est
+        for task in (primary, secondary):
+            if task is not None and not task.done():
+                task.cancel()
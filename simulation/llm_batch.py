@@ -0,0 +1,304 @@
+"""
+Soumission en lot (batch) des appels LLM non interactifs.
+
+La pré-génération de Quiz et la re-notation de sessions n'ont pas besoin d'une latence interactive :
+les prompts sont regroupés dans un seul job batch du fournisseur (moins cher, hors des slots
+du répartiteur). Un poller (commande poll_llm_batches) récupère les résultats et les écrit
+dans les modèles concernés (QuizBankEntry, SimulationSession).
+
+Deux backends :
+- 'gemini' : API Batch de Gemini (requêtes inline)
+- 'local'  : service batch local (fichiers JSONL entrée/sortie, réponses déterministes) pour les tests
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import tempfile
+from django.conf import settings
+from django.utils import timezone
+from .models import LLMBatchJob, LLMBatchItem, SimulationSession
+from .model_router import model_router
+from .evaluation_state import has_evaluation_state, RECENT_TURNS
+from .llm_tutor import (
+    build_test_instruction, build_evaluation_instruction, fallback_questions,
+    parse_questions, parse_evaluation
+)
+from .llm_service import get_client
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Prix publics par million de tokens (USD), avant remise batch
+DEFAULT_LLM_PRICES = {
+    'gemini-2.5-flash': {'input': 0.30, 'output': 2.50},
+    'gemini-2.5-flash-lite': {'input': 0.10, 'output': 0.40},
+}
+
+QUIZ_PROMPT = "Génère le test maintenant."
+EVALUATION_PROMPT = "Procède à l'évaluation maintenant."
+
+GEMINI_FINAL_STATES = {
+    'JOB_STATE_SUCCEEDED': 'SUCCEEDED',
+    'JOB_STATE_PARTIALLY_SUCCEEDED': 'SUCCEEDED',
+    'JOB_STATE_FAILED': 'FAILED',
+    'JOB_STATE_CANCELLED': 'FAILED',
+    'JOB_STATE_EXPIRED': 'FAILED',
+}
+
+
+def build_request(key, kind, system_instruction, prompt, temperature):
+    """Une ligne du lot, au format des requêtes inline Gemini."""
+    return {
+        "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+        "config": {
+            "system_instruction": system_instruction,
+            "response_mime_type": "application/json",
+            "temperature": temperature,
+        },
+        "metadata": {"key": key, "kind": kind},
+    }
+
+
+def estimate_cost(model, input_tokens, output_tokens):
+    prices = getattr(settings, 'LLM_PRICES', None) or DEFAULT_LLM_PRICES
+    price = prices.get(model, {'input': 0.0, 'output': 0.0})
+    discount = getattr(settings, 'LLM_BATCH_DISCOUNT', 0.5)
+    return (input_tokens * price['input'] + output_tokens * price['output']) / 1_000_000 * discount
+
+
+# --- Backends ---
+
+class GeminiBatchBackend:
+    name = 'gemini'
+
+    def __init__(self, client=None):
+        self.client = client
+
+    def get_client(self):
+        if self.client is None:
+            self.client = get_client()
+            if self.client is None:
+                raise RuntimeError("Clé API manquante : impossible de soumettre un batch Gemini")
+        return self.client
+
+    def submit(self, model, requests, display_name):
+        job = self.get_client().batches.create(model=model, src=requests, config={'display_name': display_name})
+        return job.name
+
+    def poll(self, provider_job_id):
+        """Retourne (statut, résultats) ; résultats = None tant que le job tourne."""
+        job = self.get_client().batches.get(name=provider_job_id)
+        state = GEMINI_FINAL_STATES.get(job.state.name if job.state else '')
+        if state is None:
+            return 'SUBMITTED', None
+        if state == 'FAILED' or not job.dest or not job.dest.inlined_responses:
+            return 'FAILED', []
+
+        results = []
+        for index, inlined in enumerate(job.dest.inlined_responses):
+            key = (inlined.metadata or {}).get('key', str(index))
+            if inlined.error or inlined.response is None:
+                results.append({"key": key, "error": str(inlined.error or "Réponse vide")})
+                continue
+            usage = inlined.response.usage_metadata
+            results.append({
+                "key": key,
+                "text": inlined.response.text,
+                "input_tokens": (usage.prompt_token_count or 0) if usage else 0,
+                "output_tokens": (usage.candidates_token_count or 0) if usage else 0,
+            })
+        return 'SUCCEEDED', results
+
+
+def local_responder(request):
+    """Réponse déterministe du service local, selon le type de ligne."""
+    if request['metadata']['kind'] == 'QUIZ_PREFILL':
+        return json.dumps(fallback_questions("batch local"), ensure_ascii=False)
+    return json.dumps({
+        "global_score": 50,
+        "rime_details": {"R": 50, "I": 50, "M": 50, "E": 50},
+        "feedback_text": "Évaluation générée par le service batch local.",
+    }, ensure_ascii=False)
+
+
+class LocalBatchBackend:
+    """
+    Stand-in du service batch : le lot est écrit en JSONL, les résultats sont produits (après
+    `latency` secondes) dans un second fichier JSONL au premier poll qui suit.
+    """
+    name = 'local'
+
+    def __init__(self, directory=None, responder=local_responder, latency=None):
+        self.directory = directory or getattr(settings, 'LLM_BATCH_LOCAL_DIR', None) or \
+            os.path.join(tempfile.gettempdir(), 'sti_llm_batches')
+        self.responder = responder
+        self.latency = latency if latency is not None else getattr(settings, 'LLM_BATCH_LOCAL_LATENCY', 0)
+
+    def path(self, provider_job_id, suffix):
+        return os.path.join(self.directory, f"{provider_job_id}.{suffix}.jsonl")
+
+    def submit(self, model, requests, display_name):
+        os.makedirs(self.directory, exist_ok=True)
+        provider_job_id = f"local-{uuid.uuid4().hex}"
+        with open(self.path(provider_job_id, 'input'), 'w', encoding='utf-8') as f:
+            for request in requests:
+                f.write(json.dumps({"model": model, "request": request}, ensure_ascii=False) + "\n")
+        return provider_job_id
+
+    def poll(self, provider_job_id):
+        input_path = self.path(provider_job_id, 'input')
+        output_path = self.path(provider_job_id, 'output')
+        if not os.path.exists(input_path):
+            return 'FAILED', []
+
+        if not os.path.exists(output_path):
+            if time.time() - os.path.getmtime(input_path) < self.latency:
+                return 'SUBMITTED', None
+            with open(input_path, encoding='utf-8') as src, open(output_path, 'w', encoding='utf-8') as dst:
+                for line in src:
+                    request = json.loads(line)['request']
+                    prompt = request['config']['system_instruction'] + request['contents'][0]['parts'][0]['text']
+                    try:
+                        text = self.responder(request)
+                        result = {"text": text, "input_tokens": len(prompt) // 4, "output_tokens": len(text) // 4}
+                    except Exception as e:
+                        result = {"error": str(e)}
+                    dst.write(json.dumps({"key": request['metadata']['key'], **result}, ensure_ascii=False) + "\n")
+
+        with open(output_path, encoding='utf-8') as f:
+            return 'SUCCEEDED', [json.loads(line) for line in f]
+
+
+BATCH_BACKENDS = {'gemini': GeminiBatchBackend, 'local': LocalBatchBackend}
+
+
+def get_batch_backend(name=None):
+    return BATCH_BACKENDS[name or getattr(settings, 'LLM_BATCH_BACKEND', 'gemini')]()
+
+
+# --- Soumission ---
+
+def session_evaluation_inputs(session):
+    """Mêmes entrées que l'évaluation finale (PerformActionView) : état compact + derniers échanges si présent."""
+    if has_evaluation_state(session.evaluation_state):
+        recent = session.messages.exclude(role='system').order_by('-timestamp')[:RECENT_TURNS]
+        final = session.actions.filter(action_type='DIAGNOSTIC_FINAL').values('action_type', 'details')
+        return list(reversed(recent.values('role', 'content'))), list(final)
+    chat_history = list(session.messages.all().values('role', 'content'))
+    actions_log = list(session.actions.all().values('action_type', 'details'))
+    return chat_history, actions_log
+
+
+def submit_job(kind, items, backend=None):
+    """Crée le job et ses lignes, puis soumet le lot au backend. `items` : LLMBatchItem non sauvegardés."""
+    if not items:
+        raise ValueError("Aucun élément à soumettre")
+    backend = backend or get_batch_backend()
+    model = model_router.model_for('standard')
+
+    job = LLMBatchJob.objects.create(kind=kind, backend=backend.name, model=model, nb_items=len(items))
+    for item in items:
+        item.job = job
+    LLMBatchItem.objects.bulk_create(items)
+
+    try:
+        job.provider_job_id = backend.submit(model, [item.request for item in items], f"sti-{kind.lower()}-{job.id}")
+    except Exception as e:
+        logger.error(f"Erreur soumission batch {job.id} : {e}")
+        job.status = 'FAILED'
+        job.error = str(e)
+        job.completed_at = timezone.now()
+    job.save()
+    metrics.increment('llm_batch_jobs_total', kind=kind, status=job.status)
+    return job
+
+
+def submit_quiz_prefill(profiles_data, per_profile=1, backend=None):
+    """Un quiz par ligne, `per_profile` quiz par type de profil."""
+    items = []
+    for profile_data in profiles_data:
+        system_instruction = build_test_instruction(profile_data)
+        for _ in range(per_profile):
+            key = f"quiz-{len(items)}"
+            items.append(LLMBatchItem(
+                key=key, profile_data=profile_data,
+                request=build_request(key, 'QUIZ_PREFILL', system_instruction, QUIZ_PROMPT, temperature=0.5),
+            ))
+    return submit_job('QUIZ_PREFILL', items, backend)
+
+
+def submit_rescoring(sessions, backend=None):
+    items = []
+    for session in sessions:
+        chat_history, actions_log = session_evaluation_inputs(session)
+        system_instruction = build_evaluation_instruction(
+            session.clinical_case.case_data, chat_history, actions_log, session.evaluation_state
+        )
+        key = f"session-{session.id}"
+        items.append(LLMBatchItem(
+            key=key, session=session,
+            request=build_request(key, 'RESCORING', system_instruction, EVALUATION_PROMPT, temperature=0.3),
+        ))
+    return submit_job('RESCORING', items, backend)
+
+
+# --- Collecte des résultats ---
+
+def apply_result(job, item, text):
+    """Écrit un résultat dans le modèle cible."""
+    if job.kind == 'QUIZ_PREFILL':
+        from profiling.quiz_bank import store_quiz
+        store_quiz(item.profile_data, parse_questions(text))
+    else:
+        evaluation = parse_evaluation(text)
+        details_rime = evaluation.get('rime_details', {})
+        details_rime['feedback_text'] = evaluation.get('feedback_text', "")
+        SimulationSession.objects.filter(pk=item.session_id).update(
+            score_rime=evaluation.get('global_score', 0), details_rime=details_rime
+        )
+
+
+def poll_job(job, backend=None):
+    """Interroge le backend ; si le lot est terminé, écrit les résultats et la comptabilité. Retourne True si terminé."""
+    if job.status != 'SUBMITTED':
+        return True
+    backend = backend or get_batch_backend(job.backend)
+    state, results = backend.poll(job.provider_job_id)
+    if state == 'SUBMITTED':
+        return False
+
+    items = {item.key: item for item in job.items.all()}
+    for result in results or []:
+        item = items.get(result.get('key'))
+        if item is None:
+            continue
+        job.input_tokens += result.get('input_tokens', 0)
+        job.output_tokens += result.get('output_tokens', 0)
+        try:
+            if result.get('error'):
+                raise ValueError(result['error'])
+            apply_result(job, item, result['text'])
+            item.status = 'SUCCEEDED'
+            job.nb_succeeded += 1
+        except Exception as e:
+            logger.error(f"Erreur résultat batch {job.id}/{item.key} : {e}")
+            item.status = 'FAILED'
+            item.error = str(e)
+            job.nb_failed += 1
+        item.save(update_fields=['status', 'error'])
+        metrics.increment('llm_batch_items_total', kind=job.kind, status=item.status)
+
+    # Lignes sans résultat (job échoué ou incomplet)
+    missing = [item.pk for item in items.values() if item.status == 'PENDING']
+    if missing:
+        LLMBatchItem.objects.filter(pk__in=missing).update(status='FAILED', error="Absent des résultats du lot")
+        job.nb_failed += len(missing)
+
+    job.status = 'SUCCEEDED' if state == 'SUCCEEDED' and job.nb_succeeded else 'FAILED'
+    job.completed_at = timezone.now()
+    job.cost_usd = estimate_cost(job.model, job.input_tokens, job.output_tokens)
+    job.save()
+    metrics.observe('llm_batch_duration_seconds', job.duration_seconds(), kind=job.kind)
+    return True
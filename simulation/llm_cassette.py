@@ -0,0 +1,256 @@
+"""
+Enregistrement / rejeu du trafic LLM ("cassettes") pour des benchmarks reproductibles hors réseau.
+
+LLM_CASSETTE_MODE :
+- 'off'    : appels Gemini normaux (défaut)
+- 'record' : appels réels, chaque réponse est ajoutée à la cassette avec sa latence
+- 'replay' : aucune connexion, les réponses sont servies depuis la cassette (pas de clé API nécessaire)
+
+Le point d'accroche est le client : `get_client()` (llm_service, llm_tutor) renvoie un CassetteClient
+qui expose la même interface (`models.generate_content`, `models.generate_content_stream`,
+`aio.models.generate_content`). Toutes les voies passent donc par la cassette : réponses patient
+(call_gemini_async), Quiz (classique, sharding, streaming) et évaluation finale.
+
+Format : JSONL (gzip si le chemin finit par .gz), une ligne par appel, sans les prompts :
+{"key": sha1(modèle, contents, config), "model", "latency", "text", "usage", "chunks"?}
+Plusieurs enregistrements pour une même clé sont rejoués dans l'ordre (puis en boucle). Les appels
+identiques simultanés (ex. appel principal + hedge) rejouent le même enregistrement : le curseur
+n'avance qu'une fois par série d'appels en cours.
+LLM_CASSETTE_SPEED : 0 = rejeu instantané, 1 = vitesse enregistrée, 2 = deux fois plus vite...
+"""
+import os
+import gzip
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+from django.conf import settings
+from .metrics import metrics
+
+
+class CassetteMiss(LookupError):
+    """Aucun enregistrement pour cette requête en mode replay."""
+
+
+def cassette_mode():
+    return getattr(settings, 'LLM_CASSETTE_MODE', 'off')
+
+
+def canonical(value):
+    """Forme JSON stable des objets du SDK (pydantic), listes, dicts et scalaires."""
+    if hasattr(value, 'model_dump'):
+        return canonical(value.model_dump(mode='json', exclude_none=True))
+    if isinstance(value, dict):
+        return {str(k): canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(v) for v in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
+def request_key(model, contents, config=None):
+    """
+    Empreinte stable d'une requête (indépendante des objets SDK / dicts utilisés pour la construire).
+    L'instruction système fait partie de `config`. Clé des cassettes et de la coalescence (coalescing.py).
+    """
+    payload = json.dumps([model, canonical(contents), canonical(config)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def _usage_dict(response):
+    usage = getattr(response, 'usage_metadata', None)
+    if usage is None:
+        return {}
+    return {
+        "input_tokens": usage.prompt_token_count or 0,
+        "output_tokens": usage.candidates_token_count or 0,
+    }
+
+
+def make_response(text, usage=None):
+    from google.genai import types
+
+    usage = usage or {}
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role='model', parts=[types.Part(text=text)]))],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=usage.get('input_tokens'), candidates_token_count=usage.get('output_tokens')
+        ),
+    )
+
+
+class Cassette:
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}   # clé -> liste d'enregistrements
+        self.cursors = {}   # clé -> prochain enregistrement à rejouer
+        self.active = {}    # clé -> [enregistrement en cours de rejeu, nombre d'appels]
+        if os.path.exists(path):
+            self.load()
+
+    def _open(self, mode):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, mode + 't', encoding='utf-8')
+        return open(self.path, mode, encoding='utf-8')
+
+    def load(self):
+        with self._open('r') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.entries.setdefault(entry['key'], []).append(entry)
+
+    def record(self, key, model, latency, text, usage, chunks=None):
+        entry = {"key": key, "model": model, "latency": round(latency, 4), "text": text, "usage": usage}
+        if chunks is not None:
+            entry["chunks"] = chunks  # [[délai depuis le début, texte], ...]
+        with self._lock:
+            self.entries.setdefault(key, []).append(entry)
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # Ajout ligne à ligne (un membre gzip par ligne pour les .gz, relu de façon transparente)
+            with self._open('a') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        metrics.increment('llm_cassette_recorded_total')
+
+    def next_for(self, key):
+        with self._lock:
+            active = self.active.get(key)
+            if active is not None:
+                active[1] += 1
+            else:
+                recorded = self.entries.get(key)
+                if not recorded:
+                    metrics.increment('llm_cassette_misses_total')
+                    raise CassetteMiss(f"Aucun enregistrement pour la requête {key[:12]} dans {self.path}")
+                index = self.cursors.get(key, 0)
+                self.cursors[key] = index + 1
+                active = self.active[key] = [recorded[index % len(recorded)], 1]
+        metrics.increment('llm_cassette_hits_total')
+        return active[0]
+
+    def release(self, key):
+        with self._lock:
+            active = self.active.get(key)
+            if active is not None:
+                active[1] -= 1
+                if active[1] == 0:
+                    del self.active[key]
+
+    @contextmanager
+    def replaying(self, key):
+        """Enregistrement à rejouer pour `key`, partagé avec les appels identiques en cours."""
+        entry = self.next_for(key)
+        try:
+            yield entry
+        finally:
+            self.release(key)
+
+    def rewind(self):
+        with self._lock:
+            self.cursors.clear()
+            self.active.clear()
+
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+def get_cassette(path=None):
+    path = path or getattr(settings, 'LLM_CASSETTE_PATH', 'llm_cassette.jsonl.gz')
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = Cassette(path)
+        return _cassettes[path]
+
+
+def replay_delay(entry, offset=None):
+    speed = getattr(settings, 'LLM_CASSETTE_SPEED', 0)
+    if not speed:
+        return 0.0
+    return (entry['latency'] if offset is None else offset) / speed
+
+
+class _CassetteModels:
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    def generate_content(self, *, model, contents, config=None):
+        cassette, key = self.owner.cassette, request_key(model, contents, config)
+        if self.owner.client is None:
+            with cassette.replaying(key) as entry:
+                time.sleep(replay_delay(entry))
+                return make_response(entry['text'], entry['usage'])
+
+        start = time.perf_counter()
+        response = self.owner.client.models.generate_content(model=model, contents=contents, config=config)
+        cassette.record(key, model, time.perf_counter() - start, response.text, _usage_dict(response))
+        return response
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        cassette, key = self.owner.cassette, request_key(model, contents, config)
+        if self.owner.client is None:
+            with cassette.replaying(key) as entry:
+                elapsed = 0.0
+                for offset, text in entry.get('chunks') or [[entry['latency'], entry['text']]]:
+                    delay = replay_delay(entry, offset) - elapsed
+                    if delay > 0:
+                        time.sleep(delay)
+                        elapsed += delay
+                    yield make_response(text)
+            return
+
+        start = time.perf_counter()
+        chunks, last = [], None
+        for chunk in self.owner.client.models.generate_content_stream(model=model, contents=contents, config=config):
+            chunks.append([round(time.perf_counter() - start, 4), chunk.text or ""])
+            last = chunk
+            yield chunk
+        cassette.record(key, model, time.perf_counter() - start, "".join(c[1] for c in chunks),
+                        _usage_dict(last), chunks=chunks)
+
+
+class _AsyncCassetteModels:
+
+    def __init__(self, owner):
+        self.owner = owner
+
+    async def generate_content(self, *, model, contents, config=None):
+        cassette, key = self.owner.cassette, request_key(model, contents, config)
+        if self.owner.client is None:
+            with cassette.replaying(key) as entry:
+                await asyncio.sleep(replay_delay(entry))
+                return make_response(entry['text'], entry['usage'])
+
+        start = time.perf_counter()
+        response = await self.owner.client.aio.models.generate_content(model=model, contents=contents, config=config)
+        cassette.record(key, model, time.perf_counter() - start, response.text, _usage_dict(response))
+        return response
+
+
+class CassetteClient:
+    """Même interface que genai.Client pour generate_content. `client=None` : rejeu pur."""
+
+    def __init__(self, cassette, client=None):
+        self.cassette = cassette
+        self.client = client
+        self.models = _CassetteModels(self)
+        self.aio = SimpleNamespace(models=_AsyncCassetteModels(self))
+
+
+def wrap_client(client):
+    """Appliqué par get_client() : renvoie le client tel quel, ou branché sur la cassette."""
+    mode = cassette_mode()
+    if mode == 'replay':
+        return CassetteClient(get_cassette())
+    if mode == 'record' and client is not None:
+        return CassetteClient(get_cassette(), client)
+    return client
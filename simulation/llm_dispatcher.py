@@ -0,0 +1,205 @@
+"""
+Répartiteur central des appels LLM (par process).
+
+Tous les appels Gemini passent par un nombre limité de "slots" :
+- classes de priorité : interactive (réponses patient) > evaluation > quiz (pré-génération)
+  > speculative (réponses anticipées, cf. speculation.py)
+- à l'intérieur d'une classe : file équitable pondérée par utilisateur (weighted fair queueing),
+  un utilisateur qui lance beaucoup d'appels ne bloque pas les autres
+- chaque demande a une deadline d'attente en file (QueueTimeout au-delà)
+
+Utilisable en synchrone (`with llm_dispatcher.slot(...)`) comme en async (`async with llm_dispatcher.aslot(...)`),
+depuis n'importe quel thread ou boucle asyncio.
+"""
+import heapq
+import asyncio
+import itertools
+import threading
+import time
+from contextlib import contextmanager, asynccontextmanager
+from django.conf import settings
+from .metrics import metrics
+
+# Plus petit = plus prioritaire
+PRIORITY_CLASSES = {'interactive': 0, 'evaluation': 1, 'quiz': 2, 'speculative': 3}
+
+# Type de tâche (routeur de modèles) -> classe de priorité
+WORKLOAD_CLASSES = {'patient': 'interactive', 'evaluation': 'evaluation', 'quiz': 'quiz'}
+
+DEFAULT_QUEUE_DEADLINES = {'interactive': 15, 'evaluation': 60, 'quiz': 60, 'speculative': 30}
+
+
+class QueueTimeout(Exception):
+    """La demande a attendu un slot LLM plus longtemps que sa deadline."""
+
+
+class _Ticket:
+    __slots__ = ('workload_class', 'user_key', 'finish_tag', 'enqueued_at',
+                 'granted', 'cancelled', 'event', 'loop', 'future')
+
+    def __init__(self, workload_class, user_key, finish_tag):
+        self.workload_class = workload_class
+        self.user_key = user_key
+        self.finish_tag = finish_tag
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.cancelled = False
+        self.event = None
+        self.loop = None
+        self.future = None
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        if self.future is not None:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(True)
+
+
+class LLMDispatcher:
+
+    def __init__(self, max_concurrency=None):
+        self._lock = threading.Lock()
+        self._max_concurrency = max_concurrency
+        self._seq = itertools.count()
+        self.in_flight = 0
+        self.queues = {cls: [] for cls in PRIORITY_CLASSES}
+        self.virtual_time = {cls: 0.0 for cls in PRIORITY_CLASSES}
+        self.user_finish = {cls: {} for cls in PRIORITY_CLASSES}
+        self.wait_observers = []
+
+    @property
+    def max_concurrency(self):
+        return self._max_concurrency or getattr(settings, 'LLM_MAX_CONCURRENCY', 8)
+
+    def deadline_for(self, workload_class):
+        deadlines = getattr(settings, 'LLM_QUEUE_DEADLINES', None) or DEFAULT_QUEUE_DEADLINES
+        return deadlines.get(workload_class, 60)
+
+    # --- File d'attente (toujours appelé sous self._lock) ---
+
+    def _enqueue(self, workload_class, user_key, weight):
+        # WFQ : étiquette de fin = max(temps virtuel, dernière étiquette de l'utilisateur) + 1/poids
+        start_tag = max(self.virtual_time[workload_class], self.user_finish[workload_class].get(user_key, 0.0))
+        finish_tag = start_tag + 1.0 / max(weight, 0.01)
+        self.user_finish[workload_class][user_key] = finish_tag
+        ticket = _Ticket(workload_class, user_key, finish_tag)
+        heapq.heappush(self.queues[workload_class], (finish_tag, next(self._seq), ticket))
+        return ticket
+
+    def _grant_next(self):
+        while self.in_flight < self.max_concurrency:
+            ticket = self._pop_next()
+            if ticket is None:
+                return
+            ticket.granted = True
+            self.in_flight += 1
+            self.virtual_time[ticket.workload_class] = ticket.finish_tag
+            ticket.wake()
+
+    def _pop_next(self):
+        for workload_class in sorted(PRIORITY_CLASSES, key=PRIORITY_CLASSES.get):
+            queue = self.queues[workload_class]
+            while queue:
+                _, _, ticket = heapq.heappop(queue)
+                if not ticket.cancelled:
+                    return ticket
+        return None
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._grant_next()
+
+    def _cancel(self, ticket):
+        """Abandon en file. Retourne True si le slot avait été accordé entre-temps (à libérer)."""
+        with self._lock:
+            if ticket.granted:
+                return True
+            ticket.cancelled = True
+            # Plus d'étiquettes orphelines : l'utilisateur ne paie pas pour un appel non servi
+            if self.user_finish[ticket.workload_class].get(ticket.user_key) == ticket.finish_tag:
+                self.user_finish[ticket.workload_class].pop(ticket.user_key, None)
+            return False
+
+    def add_wait_observer(self, callback):
+        """callback(workload_class, attente_secondes) appelé à chaque slot accordé (contrôle d'admission)."""
+        self.wait_observers.append(callback)
+
+    def _record_wait(self, ticket):
+        wait = time.monotonic() - ticket.enqueued_at
+        metrics.observe('llm_queue_wait_seconds', wait, workload_class=ticket.workload_class)
+        for callback in self.wait_observers:
+            callback(ticket.workload_class, wait)
+
+    def _timeout(self, ticket):
+        metrics.increment('llm_queue_timeouts_total', workload_class=ticket.workload_class)
+        return QueueTimeout(f"Aucun slot LLM disponible ({ticket.workload_class}) "
+                            f"après {self.deadline_for(ticket.workload_class)}s")
+
+    # --- API publique ---
+
+    @contextmanager
+    def slot(self, workload_class, user_key=None, weight=1.0):
+        """Attente synchrone d'un slot (threads de la vue / du Tuteur)."""
+        with self._lock:
+            ticket = self._enqueue(workload_class, user_key, weight)
+            ticket.event = threading.Event()
+            self._grant_next()
+
+        if not ticket.event.wait(self.deadline_for(workload_class)) and not self._cancel(ticket):
+            raise self._timeout(ticket)
+        self._record_wait(ticket)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, workload_class, user_key=None, weight=1.0):
+        """Attente async d'un slot, sans bloquer la boucle."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            ticket = self._enqueue(workload_class, user_key, weight)
+            ticket.loop = loop
+            ticket.future = loop.create_future()
+            self._grant_next()
+
+        try:
+            await asyncio.wait_for(asyncio.shield(ticket.future), self.deadline_for(workload_class))
+        except asyncio.TimeoutError:
+            if not self._cancel(ticket):
+                raise self._timeout(ticket)
+        except BaseException:
+            # Requête annulée (ex : hedging) pendant l'attente
+            if self._cancel(ticket):
+                self._release()
+            raise
+
+        self._record_wait(ticket)
+        try:
+            yield
+        finally:
+            self._release()
+
+    def status(self):
+        with self._lock:
+            now = time.monotonic()
+            queued = {}
+            oldest = {}
+            for workload_class, queue in self.queues.items():
+                waiting = [t for _, _, t in queue if not t.cancelled]
+                queued[workload_class] = len(waiting)
+                oldest[workload_class] = round(max((now - t.enqueued_at for t in waiting), default=0.0), 3)
+            return {
+                "in_flight": self.in_flight,
+                "max_concurrency": self.max_concurrency,
+                "queued": queued,
+                "oldest_wait_seconds": oldest,
+            }
+
+
+llm_dispatcher = LLMDispatcher()
@@ -2,16 +2,42 @@ import os
 import json
 import logging
 import asyncio
+import time
+from functools import lru_cache
 from django.conf import settings
-from tenacity import retry, stop_after_attempt, wait_random_exponential, retry_if_exception_type
 
-# --- NOUVEAUX IMPORTS GOOGLE GEN AI ---
-from google import genai
-from google.genai import types, errors
+# Le SDK google-genai (~0,5 s d'import) et tenacity sont importés au premier appel LLM,
+# pas au démarrage du worker ni à chaque commande manage.py (cf. manage.py import_profile)
+
+from .model_router import model_router
+from .metrics import metrics
+from .hedging import hedge_policy, hedged_call
+from .llm_dispatcher import llm_dispatcher, QueueTimeout
+from .llm_cassette import wrap_client, cassette_mode, request_key
+from .llm_stub import StubClient
+from .request_timing import record_llm
+from .resources import worker_resources
+from .coalescing import coalescer
 
 logger = logging.getLogger(__name__)
 
+
+class PatientReplyUnavailable(Exception):
+    """Aucune réponse du patient (quota saturé, LLM en échec) : le tour n'est ni enregistré ni mémorisé."""
+
+
 def get_client():
+    """Client partagé du worker ASGI (cf. resources.py) s'il existe, sinon un client neuf."""
+    return worker_resources.shared_llm_client() or build_client()
+
+def build_client():
+    if cassette_mode() == 'replay':
+        # Rejeu des réponses enregistrées : ni clé API ni réseau
+        return wrap_client(None)
+    if getattr(settings, 'LLM_BACKEND', 'gemini') == 'stub':
+        # Faux LLM des tests de charge
+        return wrap_client(StubClient())
+
     api_key = getattr(settings, 'GOOGLE_API_KEY', None)
     if not api_key:
         # Fallback pour le dev local si settings échoue (mais .env est mieux)
@@ -20,16 +46,30 @@ def get_client():
     if not api_key:
         print("⚠️ ERREUR CRITIQUE: Clé API Google manquante !")
         return None
-        
-    return genai.Client(api_key=api_key)
+
+    from google import genai
+    return wrap_client(genai.Client(api_key=api_key))
 
 # Configuration de sécurité (Pour éviter les blocages sur des termes médicaux)
-SAFETY_SETTINGS = [
-    types.SafetySetting(category='HARM_CATEGORY_HATE_SPEECH', threshold='BLOCK_NONE'),
-    types.SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT', threshold='BLOCK_NONE'),
-    types.SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold='BLOCK_NONE'),
-    types.SafetySetting(category='HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='BLOCK_NONE'),
-]
+@lru_cache(maxsize=None)
+def safety_settings():
+    from google.genai import types
+    return [
+        types.SafetySetting(category='HARM_CATEGORY_HATE_SPEECH', threshold='BLOCK_NONE'),
+        types.SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT', threshold='BLOCK_NONE'),
+        types.SafetySetting(category='HARM_CATEGORY_HARASSMENT', threshold='BLOCK_NONE'),
+        types.SafetySetting(category='HARM_CATEGORY_SEXUALLY_EXPLICIT', threshold='BLOCK_NONE'),
+    ]
+
+def patient_config(system_instruction):
+    """Paramètres de génération d'un tour patient."""
+    from google.genai import types
+    return types.GenerateContentConfig(
+        system_instruction=system_instruction,
+        temperature=0.7,
+        max_output_tokens=300,
+        safety_settings=safety_settings()
+    )
 
 def build_system_instruction(case_data):
     """Construit le prompt système avec les données JSON injectées."""
@@ -50,54 +90,59 @@ def build_system_instruction(case_data):
 
 # --- GESTION DES RETRIES (TENACITY) ---
 # On cible les erreurs spécifiques du nouveau SDK (errors.APIError)
-@retry(
-    wait=wait_random_exponential(multiplier=1, max=10),
-    stop=stop_after_attempt(5),
-    retry=retry_if_exception_type(errors.APIError) # Catch les erreurs 429/500/503
-)
-async def call_gemini_async(contents, system_instruction):
+async def call_gemini_async(contents, system_instruction, model=None, user_id=None, attempts=5,
+                            workload_class='interactive'):
+    """
+    Appel ASYNC au modèle avec le nouveau SDK google-genai, `attempts` tentatives au plus
+    (retries Tenacity sur les erreurs 429/500/503 de l'API).
+    """
+    from tenacity import AsyncRetrying, stop_after_attempt, wait_random_exponential, retry_if_exception_type
+    from google.genai import errors
+
+    retrying = AsyncRetrying(
+        wait=wait_random_exponential(multiplier=1, max=10),
+        stop=stop_after_attempt(attempts),
+        retry=retry_if_exception_type(errors.APIError)
+    )
+    return await retrying(_call_gemini_once, contents, system_instruction, model=model, user_id=user_id,
+                          workload_class=workload_class)
+
+async def _call_gemini_once(contents, system_instruction, model=None, user_id=None, workload_class='interactive'):
     """
-    Appel ASYNC au modèle avec le nouveau SDK google-genai.
+    Une tentative d'appel.
+    `model` est choisi par le routeur (niveau light / standard), standard par défaut.
+    L'appel attend un slot du répartiteur (classe `workload_class`, file équitable par utilisateur).
     """
     client = get_client() # <-- Ajout
     if not client: raise ValueError("Client Google non initialisé")
-    
-    try:
-        # On utilise le client async (client.aio)
-        response = await client.aio.models.generate_content(
-            model='gemini-2.5-flash', # Version stable et rapide
-            contents=contents,
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                temperature=0.7,
-                max_output_tokens=300,
-                safety_settings=SAFETY_SETTINGS
+
+    model = model or model_router.model_for('standard')
+
+    async with llm_dispatcher.aslot(workload_class, user_id):
+        start = time.perf_counter()
+        try:
+            # On utilise le client async (client.aio)
+            response = await client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=patient_config(system_instruction)
             )
-        )
-        return response.text
-    except Exception as e:
-        logger.error(f"Erreur lors de l'appel Gemini: {e}")
-        raise e # On relève pour que Tenacity déclenche le retry
+            model_router.record(model, time.perf_counter() - start, ok=True)
+            record_llm(time.perf_counter() - start, response)
+            return response.text
+        except Exception as e:
+            model_router.record(model, time.perf_counter() - start, ok=False)
+            record_llm(time.perf_counter() - start, ok=False)
+            logger.error(f"Erreur lors de l'appel Gemini ({model}): {e}")
+            raise e # On relève pour que Tenacity déclenche le retry
 
-async def get_patient_response_async(case_data, messages_history, user_message_content):
+def build_contents(messages_history, user_message_content):
     """
-    Point d'entrée principal.
-    Transforme les données brutes en objets `types.Content` pour le SDK.
+    Convertit l'historique DB en objets types.Content (liste de types.Content(role='...', parts=[...])),
+    en fusionnant les messages consécutifs d'un même rôle, puis ajoute le message courant.
     """
+    from google.genai import types
 
-    # Initialisation du client ICI
-    client = get_client()
-    if not client:
-        return "Erreur technique : Le simulateur n'est pas configuré (Clé API manquante)."
-
-    # 1. Préparer le System Prompt
-    sys_instruction = build_system_instruction(case_data)
-    
-    # 1. Préparer le System Prompt
-    sys_instruction = build_system_instruction(case_data)
-    
-    # 2. Convertir l'historique DB en objets types.Content
-    # Le SDK veut une liste de types.Content(role='...', parts=[...])
     formatted_contents = []
 
     if messages_history:
@@ -128,7 +173,7 @@ async def get_patient_response_async(case_data, messages_history, user_message_c
                 parts=[types.Part.from_text(text="\n".join(current_parts))]
             ))
 
-    # 3. Ajouter le message actuel de l'utilisateur à la fin de la liste 'contents'
+    # Ajouter le message actuel de l'utilisateur à la fin de la liste 'contents'
     # Contrairement à l'ancien SDK où on utilisait chat.send_message, ici generate_content
     # est stateless, on lui donne TOUTE la conversation + le nouveau message d'un coup.
     
@@ -141,10 +186,57 @@ async def get_patient_response_async(case_data, messages_history, user_message_c
         parts=[types.Part.from_text(text=user_message_content)]
     ))
 
+    return formatted_contents
+
+async def get_patient_response_async(case_data, messages_history, user_message_content, user_id=None):
+    """
+    Point d'entrée principal.
+    Transforme les données brutes en objets `types.Content` pour le SDK.
+    """
+
+    # Initialisation du client ICI
+    client = get_client()
+    if not client:
+        raise PatientReplyUnavailable("Erreur technique : Le simulateur n'est pas configuré (Clé API manquante).")
+
+    # 1. Préparer le System Prompt
+    sys_instruction = build_system_instruction(case_data)
+    
+    # 2. Historique + message courant au format du SDK
+    formatted_contents = build_contents(messages_history, user_message_content)
+
+    # 3. Choix du modèle (tour conversationnel court -> modèle léger)
+    tier, model = model_router.select('patient', user_message_content)
+
     # 4. Exécuter l'appel sécurisé
+    # Requêtes identiques simultanées (même cas, même historique) : un seul appel partagé
+    key = request_key(model, formatted_contents, patient_config(sys_instruction))
+
+    async def call():
+        if hedge_policy.enabled:
+            # Hedging : second appel si le premier dépasse le p95 observé
+            return await hedged_call(
+                lambda: call_gemini_async(formatted_contents, sys_instruction, model=model, user_id=user_id)
+            )
+        return await call_gemini_async(formatted_contents, sys_instruction, model=model, user_id=user_id)
+
     try:
-        response_text = await call_gemini_async(formatted_contents, sys_instruction)
+        response_text = await coalescer.acall(key, 'patient', call)
         return response_text
+    except QueueTimeout:
+        # Quota saturé : inutile de basculer de modèle, la file est commune
+        raise PatientReplyUnavailable("Le simulateur est très sollicité, réessayez dans un instant.")
     except Exception:
-        # Fallback ultime si les 5 retries échouent
-        return "(Le patient semble confus et ne répond pas. Vérifiez la connexion.)"
\ No newline at end of file
+        pass
+
+    # Le niveau choisi a échoué malgré les retries : on bascule sur l'autre niveau (retries réduits)
+    fallback_model = model_router.model_for(model_router.other_tier(tier))
+    metrics.increment('llm_tier_fallbacks_total', from_tier=tier, to_tier=model_router.other_tier(tier))
+    fallback_key = request_key(fallback_model, formatted_contents, patient_config(sys_instruction))
+    try:
+        return await coalescer.acall(fallback_key, 'patient', lambda: call_gemini_async(
+            formatted_contents, sys_instruction, model=fallback_model, user_id=user_id, attempts=2
+        ))
+    except Exception as e:
+        # Les deux niveaux ont échoué : la vue renvoie une erreur, le client peut réessayer
+        raise PatientReplyUnavailable("Le patient ne répond pas. Vérifiez la connexion et réessayez.") from e
\ No newline at end of file
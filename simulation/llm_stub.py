@@ -0,0 +1,107 @@
+"""
+Faux client Gemini pour les tests de charge (LLM_BACKEND='stub').
+
+Même interface que genai.Client pour generate_content (sync, async, streaming). Les réponses
+sont plausibles et déterministes selon le type de prompt (patient, QCM, rapport RIME), avec une
+latence simulée configurable (LLM_STUB_LATENCY, LLM_STUB_JITTER en secondes) pour que le
+répartiteur, le hedging et le contrôle d'admission travaillent comme en production.
+"""
+import re
+import json
+import time
+import random
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from django.conf import settings
+from .llm_cassette import make_response
+
+# Réglages des tests : stub sans latence, sans cassette ni hedging (réponses déterministes)
+STUB_LLM = dict(LLM_BACKEND='stub', LLM_STUB_LATENCY=0, LLM_STUB_JITTER=0, LLM_CASSETTE_MODE='off',
+                LLM_HEDGING_ENABLED=False)
+
+PATIENT_REPLIES = [
+    "J'ai très mal à la poitrine depuis ce matin, docteur.",
+    "Ça serre, comme un poids sur le thorax.",
+    "Non, je n'ai jamais eu ça avant.",
+    "Oui, ça m'arrive surtout quand je monte les escaliers.",
+    "Je suis un peu essoufflé, et j'ai transpiré beaucoup.",
+    "Je prends un traitement pour la tension, je crois.",
+]
+
+
+def _instruction(config):
+    if config is None:
+        return ""
+    value = config.get('system_instruction') if isinstance(config, dict) else config.system_instruction
+    return value if isinstance(value, str) else str(value or "")
+
+
+def stub_text(contents, config=None):
+    """Réponse plausible selon le prompt (QCM, rapport RIME ou réponse patient)."""
+    instruction = _instruction(config)
+    digest = hashlib.sha1((instruction + str(contents)).encode('utf-8')).hexdigest()
+
+    if 'global_score' in instruction:
+        score = 40 + int(digest[:2], 16) % 50
+        return json.dumps({
+            "global_score": score,
+            "rime_details": {"R": score, "I": score - 5, "M": score - 10, "E": score - 15},
+            "feedback_text": "Bonne démarche globale, pensez à hiérarchiser les examens.",
+        }, ensure_ascii=False)
+
+    if 'QCM' in instruction:
+        match = re.search(r"(\d+) questions", instruction)
+        nb = int(match.group(1)) if match else 15
+        return json.dumps([
+            {
+                "id": f"q{i + 1}",
+                "category": "Diagnostic",
+                "question": f"Question {digest[:8]}-{i + 1} : quelle est la conduite à tenir ?",
+                "options": {"a": "Option A", "b": "Option B", "c": "Option C", "d": "Option D"},
+                "correct_answer": "abcd"[i % 4],
+                "explanation": "Explication de la bonne réponse.",
+            }
+            for i in range(nb)
+        ], ensure_ascii=False)
+
+    return PATIENT_REPLIES[int(digest[:4], 16) % len(PATIENT_REPLIES)]
+
+
+def _latency():
+    base = getattr(settings, 'LLM_STUB_LATENCY', 0.2)
+    jitter = getattr(settings, 'LLM_STUB_JITTER', 0.1)
+    return max(0.0, base + random.uniform(-jitter, jitter))
+
+
+def _response(contents, config):
+    text = stub_text(contents, config)
+    return make_response(text, {"input_tokens": len(_instruction(config)) // 4, "output_tokens": len(text) // 4})
+
+
+class _StubModels:
+
+    def generate_content(self, *, model, contents, config=None):
+        time.sleep(_latency())
+        return _response(contents, config)
+
+    def generate_content_stream(self, *, model, contents, config=None):
+        text = stub_text(contents, config)
+        delay = _latency() / 10
+        for i in range(0, len(text), max(1, len(text) // 10)):
+            time.sleep(delay)
+            yield make_response(text[i:i + max(1, len(text) // 10)])
+
+
+class _AsyncStubModels:
+
+    async def generate_content(self, *, model, contents, config=None):
+        await asyncio.sleep(_latency())
+        return _response(contents, config)
+
+
+class StubClient:
+
+    def __init__(self, api_key=None):
+        self.models = _StubModels()
+        self.aio = SimpleNamespace(models=_AsyncStubModels())
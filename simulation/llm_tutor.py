@@ -1,27 +1,25 @@
 # backend_apprenant/simulation/llm_tutor.py
 
+import re
 import json
+import time
 import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
+from difflib import SequenceMatcher
 from django.conf import settings
-from google import genai
-from google.genai import types
+from .text_utils import normalize_text
+from .evaluation_state import has_evaluation_state, format_state_for_prompt, format_action_details
+from .model_router import model_router
+from .llm_dispatcher import llm_dispatcher, WORKLOAD_CLASSES
+from .request_timing import record_llm
+from .llm_service import get_client  # Même client que le patient (partagé ASGI, cassette, stub)
+from .coalescing import coalescer
+from .llm_cassette import request_key
 
-logger = logging.getLogger(__name__)
+# google-genai est importé au premier appel (coût d'import ~0,5 s, cf. llm_service)
 
-# On utilise une configuration JSON stricte pour le Tuteur
-# Initialisation du client
-try:
-    client = genai.Client(api_key=settings.GOOGLE_API_KEY)
-except Exception as e:
-    logger.error(f"Erreur init Client Gemini: {e}")
-
-def get_client():
-    """Récupère le client de manière sécurisée"""
-    api_key = getattr(settings, 'GOOGLE_API_KEY', None)
-    if not api_key:
-        print("⚠️ CLÉ API MANQUANTE")
-        return None
-    return genai.Client(api_key=api_key)
+logger = logging.getLogger(__name__)
 
 def extract_json_from_text(text):
     """
@@ -54,15 +52,11 @@ def extract_json_from_text(text):
     raise ValueError("Aucun JSON valide trouvé dans la réponse LLM")
 
 
-def generate_adaptive_test(profile_data):
+def build_test_instruction(profile_data, nb_questions=15, focus=None):
     """
-    Génère un QCM adaptatif basé sur le profil de l'étudiant.
-    Retourne un JSON strict.
+    Construit le prompt système du Quiz de positionnement à partir du profil.
+    `focus` restreint les questions à un sous-thème (utilisé par le mode sharding).
     """
-    client = get_client()
-    if not client:
-        return fallback_questions("Clé API manquante")
-    
     # Gestion de la langue
     raw_lang = profile_data.get('language', 'fr')
     langue_instruction = "FRANÇAIS (French)" if raw_lang == 'fr' else "ANGLAIS (English)"
@@ -81,11 +75,11 @@ def generate_adaptive_test(profile_data):
     # On prend le mapping ou la valeur brute si non trouvée, en s'assurant que c'est une string
     specialite_humaine = specialty_map.get(str(raw_spec).lower(), str(raw_spec))
 
-    objs = profile_data.get('objectives', [])
     objectifs = ", ".join(profile_data.get('objectives', []))
+    consigne_focus = f"5. SOUS-THÈME IMPOSÉ : Toutes les questions portent sur : {focus}." if focus else ""
     
     # 2. Prompt Engineering pour le Tuteur
-    system_instruction = f"""
+    return f"""
     RÔLE : Tu es un Professeur de Médecine Expert spécialisé en {specialite_humaine}. Tu es chargé d'évaluer un étudiant.
     
     RÈGLES CRITIQUES (NON NÉGOCIABLES) :
@@ -95,11 +89,12 @@ def generate_adaptive_test(profile_data):
        - Si le domaine est 'Pneumologie', reste sur les poumons/respiration.
     3. NIVEAU : Adapte la difficulté pour un niveau : {niveau}.
     4. Objectifs de l'étudiant : {objectifs}
+    {consigne_focus}
     
     IMPORTANT : TOUT LE CONTENU GÉNÉRÉ DOIT ÊTRE EN : {langue_instruction.upper()}
 
     TÂCHE :
-    Génère un Quiz de positionnement de 15 questions à choix multiples (QCM).
+    Génère un Quiz de positionnement de {nb_questions} questions à choix multiples (QCM).
     Les questions doivent être adaptées au niveau et à la spécialité choisié (une spécialité).
     Chaque question doit avoir 4 options (a, b, c, d) avec une seule bonne réponse.
     Fournis également une explication brève pour chaque bonne réponse.
@@ -122,41 +117,276 @@ def generate_adaptive_test(profile_data):
     Ne mets PAS de texte avant ou après le JSON. Fournis uniquement le JSON.
     """
 
+
+def fallback_questions(reason):
+    """Questions statiques de secours quand le Tuteur ne peut pas générer le test."""
+    logger.error(f"Fallback Quiz : {reason}")
+    return [
+        {
+            "id": "q1", 
+            "category": "Général", 
+            "question": "Erreur de Tuteur pour vous proposer le test. Quelle est la conduite à tenir ?", 
+            "options": {"a": "Réessayer", "b": "Attendre"}, 
+            "correct_answer": "a"
+        }
+    ]
+
+
+def generate_adaptive_test(profile_data, user_id=None):
+    """
+    Génère un QCM adaptatif basé sur le profil de l'étudiant.
+    Retourne un JSON strict.
+    """
+    client = get_client()
+    if not client:
+        return fallback_questions("Clé API manquante")
+
+    system_instruction = build_test_instruction(profile_data)
+
     try:
-        response = client.models.generate_content(
-            model='gemini-2.5-flash', # Plus intelligent pour suivre des instructions JSON
-            contents="Génère le test maintenant.",
-            config=types.GenerateContentConfig(
-                system_instruction=system_instruction,
-                response_mime_type="application/json", # Force le JSON
-                temperature=0.5, # Créatif mais précis
-            )
+        return request_questions(client, system_instruction, user_id=user_id)
+    except Exception as e:
+        logger.error(f"Erreur Tuteur Génération Test : {e}")
+        # Fallback en cas d'erreur (Questions statiques de secours)
+        return fallback_questions(e)
+
+
+def generate_with_router(client, workload, user_id=None, **kwargs):
+    """
+    generate_content sur le modèle choisi par le routeur, en remontant latence et erreurs.
+    L'appel attend un slot du répartiteur (priorité selon `workload`, file équitable par utilisateur).
+    Les appels identiques simultanés (ex. même profil au Quiz) partagent un seul appel amont.
+    """
+    _, model = model_router.select(workload)
+    config = kwargs.get('config')
+    key = request_key(model, kwargs.get('contents'), config)
+
+    def call():
+        with llm_dispatcher.slot(WORKLOAD_CLASSES[workload], user_id):
+            start = time.perf_counter()
+            try:
+                response = client.models.generate_content(model=model, **kwargs)
+            except Exception:
+                model_router.record(model, time.perf_counter() - start, ok=False)
+                record_llm(time.perf_counter() - start, ok=False)
+                raise
+            model_router.record(model, time.perf_counter() - start, ok=True)
+            record_llm(time.perf_counter() - start, response)
+        return response
+
+    return coalescer.call(key, workload, call)
+
+
+def request_questions(client, system_instruction, user_id=None):
+    """Un appel de génération de QCM. Lève une exception si la sortie est inexploitable."""
+    from google.genai import types
+
+    response = generate_with_router(
+        client, 'quiz', user_id=user_id,
+        contents="Génère le test maintenant.",
+        config=types.GenerateContentConfig(
+            system_instruction=system_instruction,
+            response_mime_type="application/json", # Force le JSON
+            temperature=0.5, # Créatif mais précis
         )
-        
-        # Log pour le debug (visible dans Render logs)
-        print(f"DEBUG LLM RAW OUTPUT: {response.text}")
+    )
+    
+    # Log pour le debug (visible dans Render logs)
+    print(f"DEBUG LLM RAW OUTPUT: {response.text}")
+
+    return parse_questions(response.text)
 
-        # Nettoyage et parsing
-        content = extract_json_from_text(response.text)
+
+def parse_questions(text):
+    """Nettoyage, parsing et validation minimale d'une sortie QCM (appel direct ou batch)."""
+    content = extract_json_from_text(text)
+    
+    # Validation minimale
+    if not isinstance(content, list) or len(content) == 0:
+        raise ValueError("Le LLM a renvoyé un format inattendu (pas une liste)")
         
-        # Validation minimale
-        if not isinstance(content, list) or len(content) == 0:
-            raise ValueError("Le LLM a renvoyé un format inattendu (pas une liste)")
-            
-        return content
+    return content
+
+
+# --- MODE SHARDING : plusieurs petites générations en parallèle ---
+# Sous-thèmes utilisés quand le profil n'a pas d'objectifs
+DEFAULT_QUIZ_TOPICS = ["Diagnostic", "Examens complémentaires", "Traitement"]
+
+
+def plan_quiz_shards(profile_data, total=15, max_shards=None):
+    """Découpe le quiz en sous-thèmes (objectifs du profil) et répartit le nombre de questions."""
+    if max_shards is None:
+        max_shards = getattr(settings, 'QUIZ_SHARDS', 3)
+
+    objectives = [str(o).replace('_', ' ') for o in profile_data.get('objectives') or [] if o]
+    topics = (objectives or DEFAULT_QUIZ_TOPICS)[:max(1, max_shards)]
+
+    base, reste = divmod(total, len(topics))
+    return [(topic, base + (1 if i < reste else 0)) for i, topic in enumerate(topics) if base or i < reste]
+
+
+def merge_question_shards(shards, similarity=0.85):
+    """Fusionne les listes de questions, retire les (quasi-)doublons et renumérote les ids."""
+    merged = []
+    seen = []
+    for questions in shards:
+        for q in questions:
+            if not isinstance(q, dict) or 'question' not in q or 'correct_answer' not in q:
+                continue
+            norm = normalize_text(q['question'])
+            if any(norm == s or SequenceMatcher(None, norm, s).ratio() >= similarity for s in seen):
+                continue
+            seen.append(norm)
+            merged.append({**q, "id": f"q{len(merged) + 1}"})
+    return merged
+
+
+def generate_adaptive_test_sharded(profile_data, total=15, deadline=None, user_id=None):
+    """
+    Génère le quiz en plusieurs appels concurrents (un par sous-thème) avec une deadline commune.
+    Un shard en échec ou en retard réduit simplement la taille du quiz.
+    """
+    client = get_client()
+    if not client:
+        return fallback_questions("Clé API manquante")
+
+    if deadline is None:
+        deadline = getattr(settings, 'QUIZ_SHARD_DEADLINE', 20)
+
+    shards = plan_quiz_shards(profile_data, total)
+    executor = ThreadPoolExecutor(max_workers=len(shards))
+    # copy_context : les shards alimentent la mesure Server-Timing de la requête
+    futures = {
+        executor.submit(contextvars.copy_context().run, request_questions, client,
+                        build_test_instruction(profile_data, nb, focus=topic), user_id): topic
+        for topic, nb in shards
+    }
+    done, not_done = wait(futures, timeout=deadline)
+    # On n'attend pas les shards en retard
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    results = []
+    for future in futures:
+        if future in not_done:
+            logger.error(f"Shard Quiz '{futures[future]}' hors délai ({deadline}s)")
+            continue
+        try:
+            results.append(future.result())
+        except Exception as e:
+            logger.error(f"Shard Quiz '{futures[future]}' en échec : {e}")
+
+    questions = merge_question_shards(results)
+    if not questions:
+        return fallback_questions("Tous les shards ont échoué")
+    return questions
+
+
+class IncrementalJSONArrayParser:
+    """
+    Parseur incrémental d'une liste JSON d'objets reçue morceau par morceau.
+    Chaque objet de premier niveau est renvoyé dès que son accolade fermante arrive,
+    sans attendre la fin de la liste (tolère le Markdown ```json autour). Tout ce qui suit
+    le ']' final est ignoré.
+    """
+
+    def __init__(self):
+        self.started = False   # '[' de premier niveau rencontré
+        self.finished = False  # ']' de premier niveau rencontré
+        self.depth = 0         # Profondeur dans l'objet courant
+        self.in_string = False
+        self.escape = False
+        self.buffer = []       # Caractères de l'objet en cours
+
+    def feed(self, chunk):
+        """Ajoute un morceau de texte et retourne la liste des objets complétés."""
+        completed = []
+        if self.finished:
+            return completed
+        for char in chunk:
+            if not self.started:
+                if char == '[':
+                    self.started = True
+                continue
+
+            if self.depth == 0:
+                # Entre deux objets : on ignore virgules et espaces, jusqu'au ']' final
+                if char == '{':
+                    self.depth = 1
+                    self.buffer = [char]
+                elif char == ']':
+                    self.finished = True
+                    break
+                continue
+
+            self.buffer.append(char)
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif char == '\\':
+                    self.escape = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                self.depth += 1
+            elif char in '}]':
+                self.depth -= 1
+                if self.depth == 0:
+                    raw = "".join(self.buffer)
+                    self.buffer = []
+                    try:
+                        completed.append(json.loads(raw))
+                    except json.JSONDecodeError:
+                        logger.error(f"Objet JSON invalide ignoré dans le flux : {raw[:80]}")
+        return completed
+
+
+def generate_adaptive_test_stream(profile_data, user_id=None):
+    """
+    Version streaming de generate_adaptive_test.
+    Générateur qui produit chaque question dès qu'elle est complètement parsée dans le flux de tokens.
+    """
+    from google.genai import types
+
+    client = get_client()
+    if not client:
+        yield from fallback_questions("Clé API manquante")
+        return
+
+    system_instruction = build_test_instruction(profile_data)
+    parser = IncrementalJSONArrayParser()
+    produced = 0
+
+    try:
+        _, model = model_router.select('quiz')
+        # Le slot est gardé pendant toute la durée du flux
+        with llm_dispatcher.slot(WORKLOAD_CLASSES['quiz'], user_id):
+            start = time.perf_counter()
+            chunk = None
+            stream = client.models.generate_content_stream(
+                model=model,
+                contents="Génère le test maintenant.",
+                config=types.GenerateContentConfig(
+                    system_instruction=system_instruction,
+                    response_mime_type="application/json",
+                    temperature=0.5,
+                )
+            )
+            for chunk in stream:
+                for question in parser.feed(chunk.text or ""):
+                    if isinstance(question, dict) and 'id' in question and 'correct_answer' in question:
+                        produced += 1
+                        yield question
+            # Le dernier morceau porte l'usage (tokens) de tout le flux
+            record_llm(time.perf_counter() - start, chunk)
 
     except Exception as e:
-        logger.error(f"Erreur Tuteur Génération Test : {e}")
-        # Fallback en cas d'erreur (Questions statiques de secours)
-        return [
-            {
-                "id": "q1", 
-                "category": "Général", 
-                "question": "Erreur de Tuteur pour vous proposer le test. Quelle est la conduite à tenir ?", 
-                "options": {"a": "Réessayer", "b": "Attendre"}, 
-                "correct_answer": "a"
-            }
-        ]
+        logger.error(f"Erreur Tuteur Génération Test (stream) : {e}")
+
+    if produced == 0:
+        # Rien n'a pu être extrait : mêmes questions de secours que le mode classique
+        yield from fallback_questions("Flux vide ou invalide")
 
 def evaluate_test_results(learner_answers, test_questions, profile_data):
     """
@@ -174,33 +404,51 @@ def evaluate_test_results(learner_answers, test_questions, profile_data):
     
     pass # On implémentera ça dans la vue, c'est plus simple de compter les points en Python direct.
 
-MODEL_NAME = 'gemini-2.5-flash' 
+# Modèle par défaut du Tuteur (niveau 'standard' du routeur, cf. model_router)
+MODEL_NAME = model_router.model_for('standard')
 
-def evaluate_session(case_data, chat_history, actions_log):
+def build_evaluation_instruction(case_data, chat_history, actions_log, evaluation_state=None):
     """
-    Analyse une session complète et génère un rapport RIME structuré.
+    Construit le prompt du Tuteur.
+    Avec un état d'évaluation incrémental, `chat_history` ne contient que les derniers échanges,
+    le résumé compact remplace la trace complète et `actions_log` ne contient que le diagnostic final.
     """
-    
-    # 1. Préparation du contexte pour le Tuteur
-    actions_text = "\n".join([f"- {a['type']} : {a['details']}" for a in actions_log])
-    
     chat_text = ""
     for msg in chat_history:
         role = "Médecin (Étudiant)" if msg['role'] == 'doctor' else "Patient"
         chat_text += f"{role}: {msg['content']}\n"
+    actions_text = "\n".join(f"- {a.get('type') or a.get('action_type')} : {format_action_details(a['details'])}"
+                             for a in actions_log)
 
-    system_instruction = f"""
-    RÔLE : Tu es un Professeur de Médecine Expert évaluant un étudiant sur un cas clinique simulé.
+    if has_evaluation_state(evaluation_state):
+        trace = f"""
+    --- RÉSUMÉ DE LA SESSION (suivi au fil de l'eau) ---
+    {format_state_for_prompt(evaluation_state)}
     
-    CAS CLINIQUE (VÉRITÉ TERRAIN) :
-    {json.dumps(case_data, ensure_ascii=False)}
+    --- DERNIERS ÉCHANGES ---
+    {chat_text}
     
-    TRACE DE LA SESSION ÉTUDIANT :
+    --- DIAGNOSTIC FINAL ---
+    {actions_text or "aucun"}
+    """
+    else:
+        # 1. Préparation du contexte pour le Tuteur
+        trace = f"""
     --- CONVERSATION ---
     {chat_text}
     
     --- ACTIONS / EXAMENS / DIAGNOSTIC ---
     {actions_text}
+    """
+
+    return f"""
+    RÔLE : Tu es un Professeur de Médecine Expert évaluant un étudiant sur un cas clinique simulé.
+    
+    CAS CLINIQUE (VÉRITÉ TERRAIN) :
+    {json.dumps(case_data, ensure_ascii=False)}
+    
+    TRACE DE LA SESSION ÉTUDIANT :
+    {trace}
     
     TA MISSION :
     Évalue la performance de l'étudiant selon le modèle R.I.M.E.
@@ -224,9 +472,22 @@ def evaluate_session(case_data, chat_history, actions_log):
     }}
     """
 
+
+def evaluate_session(case_data, chat_history, actions_log, evaluation_state=None, user_id=None):
+    """
+    Analyse une session complète et génère un rapport RIME structuré.
+    Si `evaluation_state` est fourni, l'évaluation ne porte que sur l'état compact + derniers échanges.
+    """
+    from google.genai import types
+
+    system_instruction = build_evaluation_instruction(case_data, chat_history, actions_log, evaluation_state)
+
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
+        client = get_client()
+        if not client:
+            raise ValueError("Client Gemini non initialisé (clé API manquante)")
+        response = generate_with_router(
+            client, 'evaluation', user_id=user_id,
             contents="Procède à l'évaluation maintenant.",
             config=types.GenerateContentConfig(
                 system_instruction=system_instruction,
@@ -235,14 +496,7 @@ def evaluate_session(case_data, chat_history, actions_log):
             )
         )
         
-        # Parsing du JSON
-        content = response.text.strip()
-        if content.startswith("```json"):
-            content = content.split("```json")[1].split("```")[0]
-        elif content.startswith("```"):
-            content = content.split("```")[1].split("```")[0]
-            
-        return json.loads(content)
+        return parse_evaluation(response.text)
 
     except Exception as e:
         logger.error(f"Erreur Tuteur Évaluation : {e}")
@@ -251,4 +505,15 @@ def evaluate_session(case_data, chat_history, actions_log):
             "global_score": 0,
             "rime_details": {"R": 0, "I": 0, "M": 0, "E": 0},
             "feedback_text": "Erreur lors de la génération du rapport par le Tuteur. Veuillez contacter l'administrateur."
-        }
\ No newline at end of file
+        }
+
+
+def parse_evaluation(text):
+    """Parsing du rapport RIME (appel direct ou batch)."""
+    content = text.strip()
+    if content.startswith("```json"):
+        content = content.split("```json")[1].split("```")[0]
+    elif content.startswith("```"):
+        content = content.split("```")[1].split("```")[0]
+        
+    return json.loads(content)
@@ -0,0 +1,185 @@
+import time
+import socket
+import asyncio
+import threading
+import statistics
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from authentication.models import User
+from clinical_cases.models import ClinicalCase
+from simulation.bench_fixtures import make_case_data, DOCTOR_QUESTIONS
+from simulation.llm_dispatcher import llm_dispatcher
+from simulation.metrics import percentile
+from simulation.models import SimulationSession
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class InFlightMonitor:
+    """Échantillonne le nombre d'appels LLM en cours dans le worker (llm_dispatcher.in_flight)."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.samples = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.samples.append(llm_dispatcher.in_flight)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class Command(BaseCommand):
+    help = ("Chats simultanés servis par UN worker : WSGI (worker sync type gunicorn, une requête à la fois) "
+            "contre ASGI (uvicorn + lifespan), avec un LLM simulé à latence fixe.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chats', type=int, default=20, help="Chats menés en parallèle")
+        parser.add_argument('--turns', type=int, default=3, help="Messages par chat")
+        parser.add_argument('--llm-latency', type=float, default=1.0, help="Latence du LLM simulé (s)")
+        parser.add_argument('--mode', choices=['wsgi', 'asgi', 'both'], default='both')
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            if options['mode'] != 'wsgi':
+                raise CommandError("uvicorn n'est pas installé (pip install -r requirements.txt)")
+
+        # BDD de test sur fichier (partagée entre le serveur et ses threads), jamais la BDD de dev
+        bench_dir = Path(settings.BASE_DIR) / 'benchmarks'
+        bench_dir.mkdir(exist_ok=True)
+        db_settings = connection.settings_dict
+        db_settings.setdefault('TEST', {})
+        if db_settings['ENGINE'].endswith('sqlite3'):
+            db_settings['TEST']['NAME'] = str(bench_dir / '.bench_concurrency.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        modes = ['wsgi', 'asgi'] if options['mode'] == 'both' else [options['mode']]
+        results = {}
+        try:
+            # Cap du répartiteur et admission désactivés : on mesure le serveur, pas la file LLM
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['127.0.0.1'], LLM_BACKEND='stub',
+                                   LLM_CASSETTE_MODE='off', LLM_STUB_LATENCY=options['llm_latency'],
+                                   LLM_STUB_JITTER=0, LLM_MAX_CONCURRENCY=10_000, LLM_ADMISSION_ENABLED=False,
+                                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+                chats = self.seed(options['chats'])
+                connection.close()
+                for mode in modes:
+                    results[mode] = self.run_mode(mode, chats, options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.print_results(results, options)
+
+    def seed(self, nb_chats):
+        """Un apprenant, une session et un jeton par chat (créés hors mesure)."""
+        case = ClinicalCase.objects.create(title="Cas bench", specialty="Cardiologie", case_data=make_case_data())
+        chats = []
+        for i in range(nb_chats):
+            user = User.objects.create_user(email=f"bench-{i}@example.com", password="bench", nom=f"Bench {i}")
+            session = SimulationSession.objects.create(user=user, clinical_case=case)
+            chats.append((str(RefreshToken.for_user(user).access_token), str(session.uuid)))
+        return chats
+
+    def run_mode(self, mode, chats, options):
+        port = free_port()
+        server, thread = self.start_wsgi(port) if mode == 'wsgi' else self.start_asgi(port)
+        try:
+            with InFlightMonitor() as monitor:
+                latencies, errors, wall = asyncio.run(self.drive(port, chats, options['turns']))
+        finally:
+            if mode == 'wsgi':
+                server.shutdown()
+                server.server_close()
+            else:
+                server.should_exit = True
+            thread.join(timeout=10)
+
+        return {
+            "requests": len(latencies), "errors": errors, "wall": wall,
+            "throughput": len(latencies) / wall if wall else 0,
+            "p50": percentile(latencies, 50), "p95": percentile(latencies, 95),
+            "peak_llm_in_flight": max(monitor.samples, default=0),
+            "mean_llm_in_flight": statistics.mean(monitor.samples) if monitor.samples else 0,
+        }
+
+    def start_wsgi(self, port):
+        # Équivalent d'un worker gunicorn sync : une requête à la fois, une boucle async jetable par vue async
+        from wsgiref.simple_server import make_server, WSGIRequestHandler
+        from config.wsgi import application
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        server = make_server('127.0.0.1', port, application, handler_class=QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server, thread
+
+    def start_asgi(self, port):
+        import uvicorn
+        from config.asgi import application
+
+        server = uvicorn.Server(uvicorn.Config(application, host='127.0.0.1', port=port, lifespan='on',
+                                               log_level='warning', access_log=False))
+        thread = threading.Thread(target=server.run, daemon=True)
+        thread.start()
+        while not server.started:
+            if not thread.is_alive():
+                raise CommandError("Le serveur uvicorn n'a pas démarré")
+            time.sleep(0.05)
+        return server, thread
+
+    async def drive(self, port, chats, nb_turns):
+        import httpx
+
+        latencies = []
+        errors = 0
+
+        async def chat(http, token, session_uuid):
+            nonlocal errors
+            for turn in range(nb_turns):
+                start = time.perf_counter()
+                response = await http.post(f"/api/v1/simulation/{session_uuid}/message/",
+                                           json={"content": DOCTOR_QUESTIONS[turn % len(DOCTOR_QUESTIONS)]},
+                                           headers={"Authorization": f"Bearer {token}"})
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code >= 400:
+                    errors += 1
+
+        limits = httpx.Limits(max_connections=len(chats), max_keepalive_connections=len(chats))
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600, limits=limits) as http:
+            start = time.perf_counter()
+            await asyncio.gather(*(chat(http, token, session_uuid) for token, session_uuid in chats))
+            wall = time.perf_counter() - start
+        return latencies, errors, wall
+
+    def print_results(self, results, options):
+        self.stdout.write(self.style.WARNING(
+            f"📊 {options['chats']} chats x {options['turns']} messages, LLM simulé à {options['llm_latency']}s, 1 worker"
+        ))
+        self.stdout.write(f"{'mode':<5} | {'req':>5} | {'err':>4} | {'durée s':>8} | {'req/s':>7} | "
+                          f"{'p50 ms':>9} | {'p95 ms':>9} | {'LLM en vol (max / moy)':>22}")
+        for mode, r in results.items():
+            self.stdout.write(
+                f"{mode:<5} | {r['requests']:>5} | {r['errors']:>4} | {r['wall']:>8.2f} | {r['throughput']:>7.2f} | "
+                f"{r['p50']:>9.1f} | {r['p95']:>9.1f} | {r['peak_llm_in_flight']:>10} / {r['mean_llm_in_flight']:>9.1f}"
+            )
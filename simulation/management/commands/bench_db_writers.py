@@ -0,0 +1,142 @@
+import time
+import threading
+import statistics
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction, OperationalError
+from authentication.models import User
+from clinical_cases.models import ClinicalCase
+from config.database import sqlite_options, postgres_pool_options
+from simulation.bench_fixtures import make_case_data, DOCTOR_QUESTIONS
+from simulation.metrics import percentile
+from simulation.models import SimulationSession, ChatMessage
+
+
+def profiles_for(engine):
+    """Nom -> (OPTIONS, CONN_MAX_AGE) : réglages d'origine contre profil de config/database.py."""
+    if engine.endswith('sqlite3'):
+        return {'journal (défaut)': ({}, 0), 'wal (optimisé)': (sqlite_options(), 0)}
+    if 'postgresql' in engine:
+        return {'sans pool': ({}, 0), 'pool': (postgres_pool_options(max_size=20), 0)}
+    raise CommandError(f"Moteur non pris en charge : {engine}")
+
+
+class Command(BaseCommand):
+    help = ("Écrivains concurrents de ChatMessage (un tour de chat = 2 messages dans une transaction), "
+            "avec lecteurs d'historique en parallèle : profil de connexion d'origine contre profil optimisé.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8, help="Threads écrivains (une session chacun)")
+        parser.add_argument('--turns', type=int, default=100, help="Tours de chat écrits par écrivain")
+        parser.add_argument('--readers', type=int, default=2, help="Threads lisant l'historique en boucle")
+
+    def handle(self, *args, **options):
+        bench_dir = Path(settings.BASE_DIR) / 'benchmarks'
+        bench_dir.mkdir(exist_ok=True)
+        db_settings = connection.settings_dict
+        original = (dict(db_settings.get('OPTIONS', {})), db_settings.get('CONN_MAX_AGE', 0))
+        db_settings.setdefault('TEST', {})
+        if db_settings['ENGINE'].endswith('sqlite3'):
+            # Fichier obligatoire (la BDD de test en mémoire n'a ni journal ni concurrence réelle)
+            db_settings['TEST']['NAME'] = str(bench_dir / '.bench_db_writers.sqlite3')
+
+        results = {}
+        try:
+            for name, (db_options, conn_max_age) in profiles_for(db_settings['ENGINE']).items():
+                db_settings['OPTIONS'] = db_options
+                db_settings['CONN_MAX_AGE'] = conn_max_age
+                old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                try:
+                    results[name] = self.run_profile(options)
+                finally:
+                    connection.close()
+                    connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            db_settings['OPTIONS'], db_settings['CONN_MAX_AGE'] = original
+
+        self.print_results(results, options)
+
+    def run_profile(self, options):
+        case = ClinicalCase.objects.create(title="Cas bench", specialty="Cardiologie", case_data=make_case_data())
+        user = User.objects.create(email="bench-writers@example.com", nom="Bench")
+        sessions = [SimulationSession.objects.create(user=user, clinical_case=case) for _ in range(options['writers'])]
+        connection.close()
+
+        latencies = []
+        errors = []
+        reads = [0]
+        lock = threading.Lock()
+        stop_readers = threading.Event()
+
+        def writer(session):
+            from django.db import connection as thread_connection
+            local = []
+            try:
+                for turn in range(options['turns']):
+                    start = time.perf_counter()
+                    try:
+                        with transaction.atomic():
+                            ChatMessage.objects.create(session=session, role='doctor',
+                                                       content=DOCTOR_QUESTIONS[turn % len(DOCTOR_QUESTIONS)])
+                            ChatMessage.objects.create(session=session, role='patient', content="J'ai mal depuis hier.")
+                        local.append((time.perf_counter() - start) * 1000)
+                    except OperationalError as e:
+                        with lock:
+                            errors.append(str(e))
+            finally:
+                thread_connection.close()
+                with lock:
+                    latencies.extend(local)
+
+        def reader(session):
+            from django.db import connection as thread_connection
+            count = 0
+            try:
+                while not stop_readers.is_set():
+                    try:
+                        list(ChatMessage.objects.filter(session=session).order_by('-timestamp')[:50])
+                        count += 1
+                    except OperationalError as e:
+                        with lock:
+                            errors.append(str(e))
+            finally:
+                thread_connection.close()
+                with lock:
+                    reads[0] += count
+
+        readers = [threading.Thread(target=reader, args=(sessions[i % len(sessions)],))
+                   for i in range(options['readers'])]
+        writers = [threading.Thread(target=writer, args=(s,)) for s in sessions]
+        for t in readers:
+            t.start()
+        start = time.perf_counter()
+        for t in writers:
+            t.start()
+        for t in writers:
+            t.join()
+        wall = time.perf_counter() - start
+        stop_readers.set()
+        for t in readers:
+            t.join()
+
+        return {
+            "turns": len(latencies), "errors": len(errors), "first_error": errors[0] if errors else None,
+            "wall": wall, "throughput": len(latencies) / wall if wall else 0,
+            "reads_per_s": reads[0] / wall if wall else 0,
+            "mean": statistics.mean(latencies) if latencies else 0,
+            "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+        }
+
+    def print_results(self, results, options):
+        self.stdout.write(self.style.WARNING(
+            f"📊 {options['writers']} écrivains x {options['turns']} tours, {options['readers']} lecteurs "
+            f"({connection.vendor})"
+        ))
+        self.stdout.write(f"{'profil':<18} | {'tours/s':>8} | {'lectures/s':>10} | {'p50 ms':>8} | "
+                          f"{'p95 ms':>8} | {'p99 ms':>8} | {'erreurs':>7}")
+        for name, r in results.items():
+            self.stdout.write(f"{name:<18} | {r['throughput']:>8.1f} | {r['reads_per_s']:>10.1f} | {r['p50']:>8.2f} | "
+                              f"{r['p95']:>8.2f} | {r['p99']:>8.2f} | {r['errors']:>7}")
+            if r['first_error']:
+                self.stdout.write(self.style.ERROR(f"  ex. : {r['first_error']}"))
@@ -0,0 +1,64 @@
+import time
+from django.core.management.base import BaseCommand
+from simulation.bench_fixtures import make_case_data, make_chat_history, make_actions_log
+from simulation.evaluation_state import (
+    RECENT_TURNS, new_evaluation_state, update_state_with_turn, update_state_with_action
+)
+from simulation.llm_tutor import build_evaluation_instruction, evaluate_session
+
+
+class Command(BaseCommand):
+    help = "Compare l'évaluation finale complète et l'évaluation incrémentale (état compact) selon la longueur de session."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--turns', type=int, nargs='+', default=[20, 50, 100, 200, 400])
+        parser.add_argument('--prefill-tps', type=float, default=3000.0,
+                            help="Débit de lecture du prompt (tokens/s) pour l'estimation de latence")
+        parser.add_argument('--live', action='store_true',
+                            help="Appelle réellement le Tuteur (Gemini) pour mesurer la latence de bout en bout")
+
+    def handle(self, *args, **options):
+        case_data = make_case_data()
+        actions = make_actions_log()
+
+        self.stdout.write(self.style.WARNING("📊 Évaluation finale : trace complète vs état incrémental"))
+        self.stdout.write(f"{'tours':>6} | {'tokens complet':>14} | {'tokens compact':>14} | "
+                          f"{'latence est. complet':>20} | {'latence est. compact':>20} | {'MAJ/tour':>9}")
+
+        for nb_turns in options['turns']:
+            history = make_chat_history(nb_turns)
+
+            # État incrémental : coût payé au fil de l'eau, un tour à la fois
+            state = new_evaluation_state()
+            t0 = time.perf_counter()
+            for msg in history:
+                if msg['role'] == 'doctor':
+                    update_state_with_turn(state, msg['content'])
+            for a in actions:
+                update_state_with_action(state, a['action_type'], a['details'])
+            per_turn_us = (time.perf_counter() - t0) / max(1, nb_turns // 2) * 1e6
+
+            full_prompt = build_evaluation_instruction(case_data, history, actions)
+            compact_prompt = build_evaluation_instruction(case_data, history[-RECENT_TURNS:], [], state)
+
+            # Estimation grossière : ~4 caractères par token
+            full_tokens = len(full_prompt) // 4
+            compact_tokens = len(compact_prompt) // 4
+            tps = options['prefill_tps']
+
+            self.stdout.write(
+                f"{nb_turns:>6} | {full_tokens:>14} | {compact_tokens:>14} | "
+                f"{full_tokens / tps * 1000:>17.0f} ms | {compact_tokens / tps * 1000:>17.0f} ms | "
+                f"{per_turn_us:>6.1f} µs"
+            )
+
+            if options['live']:
+                t0 = time.perf_counter()
+                evaluate_session(case_data, history, actions)
+                full_latency = time.perf_counter() - t0
+                t0 = time.perf_counter()
+                evaluate_session(case_data, history[-RECENT_TURNS:], [], state)
+                compact_latency = time.perf_counter() - t0
+                self.stdout.write(self.style.SUCCESS(
+                    f"       ↳ Gemini réel : complet {full_latency:.2f}s / compact {compact_latency:.2f}s"
+                ))
@@ -0,0 +1,99 @@
+import io
+import gzip
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from authentication.models import User
+from clinical_cases.models import ClinicalCase
+from clinical_cases.serializers import ClinicalCaseDetailSerializer
+from config.fast_json import FastJSONRenderer, FastJSONParser, orjson
+from simulation.bench_fixtures import make_case_data, make_chat_history, make_actions_log
+from simulation.management.commands.microbench import measure
+from simulation.middleware import brotli
+from simulation.models import SimulationSession, ChatMessage, ActionLog
+from simulation.serializers import SimulationDetailSerializer
+
+
+class Command(BaseCommand):
+    help = ("Rendu JSON (DRF stdlib vs orjson), parsing, et octets transférés (brut / gzip / brotli) "
+            "pour le détail d'une session de N messages et le dossier complet d'un cas. BDD de test en mémoire.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=200)
+        parser.add_argument('--repeat', type=int, default=7)
+        parser.add_argument('--min-time', type=float, default=0.1, help="Durée min d'une série (s)")
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver'],
+                                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+                user, session, case = self.seed(options['messages'])
+                session = (SimulationSession.objects.select_related('clinical_case')
+                           .prefetch_related('messages', 'actions').get(pk=session.pk))
+                payloads = {
+                    f"session [{options['messages']} messages]": SimulationDetailSerializer(session).data,
+                    "cas [case_data complet]": ClinicalCaseDetailSerializer(case).data,
+                }
+                self.report_rendering(payloads, options)
+                self.report_wire(user, session, case)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def seed(self, nb_messages):
+        case = ClinicalCase.objects.create(title="Cas bench", specialty="Cardiologie",
+                                           case_data=make_case_data(nb_symptomes=40, nb_examens=80))
+        user = User.objects.create_user(email="bench-render@example.com", password="bench", nom="Bench")
+        session = SimulationSession.objects.create(user=user, clinical_case=case)
+        ChatMessage.objects.bulk_create(ChatMessage(session=session, **m) for m in make_chat_history(nb_messages))
+        ActionLog.objects.bulk_create(ActionLog(session=session, **a) for a in make_actions_log())
+        return user, session, case
+
+    def report_rendering(self, payloads, options):
+        stdlib_renderer, fast_renderer = JSONRenderer(), FastJSONRenderer()
+        stdlib_parser, fast_parser = JSONParser(), FastJSONParser()
+        if orjson is None:
+            self.stdout.write(self.style.ERROR("orjson absent : FastJSONRenderer retombe sur la stdlib"))
+
+        self.stdout.write(self.style.WARNING("⏱️ Rendu / parsing JSON (médiane par appel)"))
+        self.stdout.write(f"{'payload':<28} | {'octets':>8} | {'rendu stdlib µs':>15} | {'rendu orjson µs':>15} | "
+                          f"{'gain':>6} | {'parse stdlib µs':>15} | {'parse orjson µs':>15} | {'gain':>6}")
+        for name, data in payloads.items():
+            body = stdlib_renderer.render(data, 'application/json')
+            assert fast_renderer.render(data, 'application/json') == body, "sorties différentes"
+            timings = [
+                measure(lambda: stdlib_renderer.render(data, 'application/json'), options['repeat'], options['min_time']),
+                measure(lambda: fast_renderer.render(data, 'application/json'), options['repeat'], options['min_time']),
+                measure(lambda: stdlib_parser.parse(io.BytesIO(body)), options['repeat'], options['min_time']),
+                measure(lambda: fast_parser.parse(io.BytesIO(body)), options['repeat'], options['min_time']),
+            ]
+            render_old, render_new, parse_old, parse_new = (t['median_us'] for t in timings)
+            self.stdout.write(
+                f"{name:<28} | {len(body):>8} | {render_old:>15.1f} | {render_new:>15.1f} | {render_old / render_new:>5.1f}x | "
+                f"{parse_old:>15.1f} | {parse_new:>15.1f} | {parse_old / parse_new:>5.1f}x"
+            )
+
+            sizes = [f"gzip-{settings.COMPRESSION_GZIP_LEVEL} {len(gzip.compress(body, settings.COMPRESSION_GZIP_LEVEL, mtime=0))}"]
+            if brotli is not None:
+                sizes.append(f"brotli-{settings.COMPRESSION_BROTLI_QUALITY} "
+                             f"{len(brotli.compress(body, quality=settings.COMPRESSION_BROTLI_QUALITY))}")
+            self.stdout.write(f"{'':<28}   compressé : {', '.join(sizes)} octets")
+
+    def report_wire(self, user, session, case):
+        """Octets réellement envoyés par l'API (CompressionMiddleware) selon Accept-Encoding."""
+        client = APIClient()
+        client.force_authenticate(user)
+        self.stdout.write(self.style.WARNING("\n📦 Octets sur le fil (réponse HTTP complète)"))
+        self.stdout.write(f"{'route':<34} | {'identity':>9} | {'gzip':>9} | {'br':>9}")
+        for label, path in (("GET /api/v1/simulation/<uuid>/", f"/api/v1/simulation/{session.uuid}/"),
+                            ("GET /api/v1/cases/<uuid>/", f"/api/v1/cases/{case.uuid}/")):
+            sizes = []
+            for encoding in ('identity', 'gzip', 'br'):
+                response = client.get(path, HTTP_ACCEPT_ENCODING=encoding)
+                served = response.get('Content-Encoding', 'identity')
+                sizes.append(f"{len(response.content)}" + ("" if served == encoding else f" ({served})"))
+            self.stdout.write(f"{label:<34} | {sizes[0]:>9} | {sizes[1]:>9} | {sizes[2]:>9}")
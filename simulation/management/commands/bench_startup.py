@@ -0,0 +1,87 @@
+import os
+import sys
+import time
+import shutil
+import socket
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+import urllib.error
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ("Temps de démarrage : `manage.py check` et démarrage d'un worker ASGI (uvicorn, lifespan) "
+            "jusqu'à la réponse à sa première requête. Chaque mesure dans un process neuf.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5)
+        parser.add_argument('--path', default='/api/v1/auth/me/',
+                            help="Première requête (défaut : 401 sans jeton, charge l'URLconf sans toucher à la BDD)")
+        parser.add_argument('--timeout', type=float, default=60)
+
+    def handle(self, *args, **options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings')}
+        tmp_dir = Path(tempfile.mkdtemp(prefix='bench_startup_'))
+        try:
+            db = settings.DATABASES['default']
+            if db['ENGINE'].endswith('sqlite3') and Path(db['NAME']).exists():
+                # Copie : le worker (lifespan, WAL) ne doit pas modifier la BDD de dev
+                shutil.copy(db['NAME'], tmp_dir / 'db.sqlite3')
+                env['DATABASE_URL'] = f"sqlite:///{tmp_dir / 'db.sqlite3'}"
+
+            check = [self.time_check(env) for _ in range(options['runs'])]
+            first_request = [self.time_first_request(env, options) for _ in range(options['runs'])]
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.stdout.write(self.style.WARNING(f"⏱️ Démarrage ({options['runs']} process neufs par mesure)"))
+        self.stdout.write(f"{'mesure':<42} | {'médiane ms':>10} | {'min ms':>8} | {'max ms':>8}")
+        for label, values in (("manage.py check", check),
+                              (f"worker ASGI -> 1re réponse ({options['path']})", first_request)):
+            self.stdout.write(f"{label:<42} | {statistics.median(values):>10.0f} | {min(values):>8.0f} | {max(values):>8.0f}")
+
+    def time_check(self, env):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, 'manage.py', 'check'], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True)
+        elapsed = (time.perf_counter() - start) * 1000
+        if result.returncode != 0:
+            raise CommandError(f"manage.py check a échoué :\n{result.stderr[-2000:]}")
+        return elapsed
+
+    def time_first_request(self, env, options):
+        port = free_port()
+        url = f"http://127.0.0.1:{port}{options['path']}"
+        start = time.perf_counter()
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'uvicorn', 'config.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+             '--lifespan', 'on', '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        try:
+            while True:
+                if process.poll() is not None:
+                    raise CommandError(f"Le worker s'est arrêté :\n{process.stderr.read()[-2000:]}")
+                if time.perf_counter() - start > options['timeout']:
+                    raise CommandError("Le worker n'a pas répondu à temps")
+                try:
+                    urllib.request.urlopen(url, timeout=options['timeout'])
+                    break
+                except urllib.error.HTTPError:
+                    break  # Toute réponse HTTP compte (401 attendu)
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.01)
+            return (time.perf_counter() - start) * 1000
+        finally:
+            process.terminate()
+            process.wait(timeout=10)
@@ -0,0 +1,81 @@
+import os
+import sys
+import subprocess
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+PROJECT_APPS = ('config', 'authentication', 'profiling', 'clinical_cases', 'simulation')
+
+
+def parse_importtime(stderr):
+    """Lignes de `python -X importtime` -> [(module, profondeur, self µs, cumulé µs)] (ordre post-fixe)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        name = name.rstrip()
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), depth, int(self_us), int(cumulative_us)))
+    return rows
+
+
+def attribute(rows):
+    """
+    Chaque module est attribué à l'app du projet qui a déclenché son import (ancêtre le plus proche),
+    ou à '(Django, hors apps)' : imports faits via importlib (django.setup(), include() des URLconf),
+    dont -X importtime ne trace pas l'appelant.
+    Retourne {app: {paquet de premier niveau: µs}}.
+    """
+    breakdown = defaultdict(lambda: defaultdict(int))
+    stack = []
+    # Parcours inversé de l'ordre post-fixe : chaque parent est vu avant ses enfants
+    for name, depth, self_us, _ in reversed(rows):
+        del stack[depth:]
+        stack.append(name)
+        owner = next((m.split('.')[0] for m in reversed(stack) if m.split('.')[0] in PROJECT_APPS),
+                     '(Django, hors apps)')
+        breakdown[owner][name.split('.')[0]] += self_us
+    return breakdown
+
+
+class Command(BaseCommand):
+    help = ("Temps d'import au démarrage d'un worker (django.setup() + URLconf), ventilé par app du projet "
+            "et par dépendance tierce importée (python -X importtime dans un process neuf).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', default='config.urls',
+                            help="Module importé après django.setup() (défaut : l'URLconf, chargé à la 1re requête)")
+        parser.add_argument('--top', type=int, default=15, help="Nombre de modules les plus lourds affichés")
+
+    def handle(self, *args, **options):
+        script = (
+            "import django; django.setup(); "
+            f"import importlib; importlib.import_module({options['target']!r})"
+        )
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings')}
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', script], capture_output=True, text=True,
+                                cwd=settings.BASE_DIR, env=env)
+        rows = parse_importtime(result.stderr)
+        if result.returncode != 0 or not rows:
+            raise CommandError(f"Échec de l'import :\n{result.stderr[-2000:]}")
+
+        total = sum(r[2] for r in rows)
+        self.stdout.write(self.style.WARNING(
+            f"📦 {len(rows)} modules importés en {total / 1000:.0f} ms (django.setup() + {options['target']})"
+        ))
+
+        self.stdout.write(f"\n{'app':<20} | {'total ms':>9} | {'code app ms':>11} | dépendances les plus lourdes")
+        breakdown = attribute(rows)
+        for app, packages in sorted(breakdown.items(), key=lambda item: -sum(item[1].values())):
+            own = packages.get(app, 0)
+            deps = sorted(((p, us) for p, us in packages.items() if p != app), key=lambda item: -item[1])[:4]
+            deps_text = ", ".join(f"{p} {us / 1000:.0f} ms" for p, us in deps if us >= 1000)
+            self.stdout.write(f"{app:<20} | {sum(packages.values()) / 1000:>9.1f} | {own / 1000:>11.1f} | {deps_text}")
+
+        self.stdout.write(f"\n{'module (sous-arbre le plus lourd)':<45} | {'cumulé ms':>9} | {'self ms':>8}")
+        # Racines et leurs imports directs (les niveaux plus profonds sont inclus dans ces cumuls)
+        shallow = [r for r in rows if r[1] <= 1]
+        for name, _, self_us, cumulative_us in sorted(shallow, key=lambda r: -r[3])[:options['top']]:
+            self.stdout.write(f"{name:<45} | {cumulative_us / 1000:>9.1f} | {self_us / 1000:>8.1f}")
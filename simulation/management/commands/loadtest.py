@@ -0,0 +1,214 @@
+import json
+import time
+import random
+import asyncio
+import subprocess
+from pathlib import Path
+from collections import defaultdict
+from urllib.parse import urlparse
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+from django.urls import resolve
+from django.utils import timezone
+from clinical_cases.models import ClinicalCase
+from simulation.bench_fixtures import make_case_data, DOCTOR_QUESTIONS
+from simulation.metrics import percentile
+
+EXAMS = ["ECG", "Troponine", "Radiographie thoracique"]
+PROFILE = {"study_level": "M1", "specialty": "Cardiologie", "objectives": ["clinical_reasoning", "diagnosis"]}
+
+
+class Journey:
+    """Parcours complet d'un apprenant, chaque requête est chronométrée par endpoint (nom de route)."""
+
+    def __init__(self, http, samples, index, nb_turns):
+        self.http = http
+        self.samples = samples
+        self.index = index
+        self.nb_turns = nb_turns
+        self.headers = {}
+
+    async def call(self, method, path, **kwargs):
+        start = time.perf_counter()
+        response = await self.http.request(method, path, headers=self.headers, **kwargs)
+        await response.aread()
+        elapsed = time.perf_counter() - start
+        route = resolve(urlparse(path).path).url_name
+        self.samples[route].append((elapsed, response.status_code))
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} -> {response.status_code} {response.text[:120]}")
+        return response
+
+    async def run(self, run_id):
+        email = f"loadtest-{run_id}-{self.index}@example.com"
+        await self.call('POST', '/api/v1/auth/register/', json={"email": email, "nom": f"Apprenant {self.index}",
+                                                                 "password": "Loadtest-2024!"})
+        tokens = (await self.call('POST', '/api/v1/auth/login/', json={"email": email, "password": "Loadtest-2024!"})).json()
+        self.headers = {"Authorization": f"Bearer {tokens['access']}"}
+
+        await self.call('PATCH', '/api/v1/profiling/me/', json=PROFILE)
+        questions = (await self.call('GET', '/api/v1/profiling/test/generate/')).json()
+        answers = {q['id']: random.choice(list(q.get('options') or {"a": ""})) for q in questions}
+        await self.call('POST', '/api/v1/profiling/test/submit/', json={"answers": answers})
+
+        cases = (await self.call('GET', '/api/v1/cases/')).json()
+        cases = cases.get('results', cases) if isinstance(cases, dict) else cases
+        session = (await self.call('POST', '/api/v1/simulation/start/',
+                                   json={"case_uuid": random.choice(cases)['uuid']})).json()
+        base = f"/api/v1/simulation/{session['uuid']}"
+
+        for turn in range(self.nb_turns):
+            await self.call('POST', f"{base}/message/", json={"content": DOCTOR_QUESTIONS[turn % len(DOCTOR_QUESTIONS)]})
+            if turn % 7 == 6:
+                exam = EXAMS[(turn // 7) % len(EXAMS)]
+                await self.call('POST', f"{base}/action/", json={"action_type": "EXAMEN", "details": {"exam_name": exam}})
+
+        await self.call('POST', f"{base}/action/", json={"action_type": "DIAGNOSTIC_FINAL",
+                                                         "details": {"diagnostic": "Syndrome Coronarien Aigu"}})
+        await self.call('GET', '/api/v1/profiling/dashboard/')
+        await self.call('GET', '/api/v1/simulation/history/')
+
+
+class Command(BaseCommand):
+    help = ("Test de charge de bout en bout (app ASGI, LLM simulé) : parcours complets d'apprenants, "
+            "débit et p50/p95/p99 par endpoint, comparaison avec une baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10, help="Apprenants simulés en parallèle")
+        parser.add_argument('--turns', type=int, default=20, help="Tours de chat par session")
+        parser.add_argument('--cases', type=int, default=20, help="Cas cliniques créés dans la BDD de test")
+        parser.add_argument('--llm-latency', type=float, default=0.2, help="Latence du LLM simulé (s)")
+        parser.add_argument('--llm-jitter', type=float, default=0.1)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', default=None,
+                            help="Fichier JSON des résultats (défaut : benchmarks/loadtest-<commit>.json)")
+        parser.add_argument('--baseline', default=None,
+                            help="Résultats de référence à comparer (ex : benchmarks/loadtest_baseline.json)")
+        parser.add_argument('--tolerance', type=float, default=20.0,
+                            help="Régression tolérée sur le p95 (en %%) avant signalement")
+        parser.add_argument('--fail-on-regression', action='store_true')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        bench_dir = Path(settings.BASE_DIR) / 'benchmarks'
+
+        # BDD de test sur fichier (écritures concurrentes entre threads), jamais la BDD de dev
+        db_settings = connection.settings_dict
+        db_settings.setdefault('TEST', {})
+        if db_settings['ENGINE'].endswith('sqlite3'):
+            db_settings['TEST']['NAME'] = str(bench_dir / '.loadtest.sqlite3')
+        bench_dir.mkdir(exist_ok=True)
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+
+        try:
+            with override_settings(DEBUG=False, ALLOWED_HOSTS=['localhost'], LLM_BACKEND='stub',
+                                   LLM_CASSETTE_MODE='off', LLM_STUB_LATENCY=options['llm_latency'],
+                                   LLM_STUB_JITTER=options['llm_jitter']):
+                for i in range(options['cases']):
+                    ClinicalCase.objects.create(title=f"Cas {i}", specialty="Cardiologie", case_data=make_case_data())
+                samples, errors, wall = asyncio.run(self.run_journeys(options))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        results = self.summarize(samples, errors, wall, options)
+        self.print_results(results)
+
+        output = Path(options['output']) if options['output'] else bench_dir / f"loadtest-{results['meta']['commit']}.json"
+        output.write_text(json.dumps(results, indent=2, ensure_ascii=False) + "\n")
+        self.stdout.write(f"Résultats enregistrés dans {output}")
+
+        if options['baseline']:
+            regressions = self.compare(results, json.loads(Path(options['baseline']).read_text()), options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f"Régression de latence sur : {', '.join(regressions)}")
+
+    async def run_journeys(self, options):
+        import httpx
+        from config.asgi import application
+
+        samples = defaultdict(list)
+        run_id = int(time.time())
+        transport = httpx.ASGITransport(app=application)
+        async with httpx.AsyncClient(transport=transport, base_url='http://localhost', timeout=120) as http:
+            journeys = [Journey(http, samples, i, options['turns']) for i in range(options['users'])]
+            start = time.perf_counter()
+            outcomes = await asyncio.gather(*(j.run(run_id) for j in journeys), return_exceptions=True)
+            wall = time.perf_counter() - start
+
+        errors = [str(o) for o in outcomes if isinstance(o, Exception)]
+        return samples, errors, wall
+
+    def summarize(self, samples, errors, wall, options):
+        try:
+            commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                    cwd=settings.BASE_DIR).stdout.strip() or 'unknown'
+        except OSError:
+            commit = 'unknown'
+
+        endpoints = {}
+        total = 0
+        for route, values in sorted(samples.items()):
+            latencies = [v[0] * 1000 for v in values]
+            total += len(values)
+            endpoints[route] = {
+                "count": len(values),
+                "errors": sum(1 for v in values if v[1] >= 400),
+                "p50_ms": round(percentile(latencies, 50), 2),
+                "p95_ms": round(percentile(latencies, 95), 2),
+                "p99_ms": round(percentile(latencies, 99), 2),
+            }
+        return {
+            "meta": {
+                "commit": commit,
+                "date": timezone.now().isoformat(timespec='seconds'),
+                "users": options['users'], "turns": options['turns'],
+                "llm_latency": options['llm_latency'], "llm_jitter": options['llm_jitter'],
+            },
+            "wall_seconds": round(wall, 2),
+            "requests": total,
+            "throughput_rps": round(total / wall, 2) if wall else 0,
+            "failed_journeys": len(errors),
+            "errors": errors[:10],
+            "endpoints": endpoints,
+        }
+
+    def print_results(self, results):
+        self.stdout.write(self.style.WARNING(
+            f"📊 {results['requests']} requêtes en {results['wall_seconds']}s — "
+            f"{results['throughput_rps']} req/s, {results['failed_journeys']} parcours en échec"
+        ))
+        self.stdout.write(f"{'endpoint':<24} | {'n':>5} | {'err':>4} | {'p50 ms':>9} | {'p95 ms':>9} | {'p99 ms':>9}")
+        for route, s in results['endpoints'].items():
+            self.stdout.write(f"{route:<24} | {s['count']:>5} | {s['errors']:>4} | "
+                              f"{s['p50_ms']:>9.1f} | {s['p95_ms']:>9.1f} | {s['p99_ms']:>9.1f}")
+        for error in results['errors']:
+            self.stdout.write(self.style.ERROR(f"  {error}"))
+
+    def compare(self, results, baseline, tolerance):
+        """Écart par endpoint avec la baseline ; retourne les endpoints dont le p95 régresse au-delà de la tolérance."""
+        self.stdout.write(self.style.WARNING(
+            f"\nComparaison avec {baseline['meta']['commit']} ({baseline['throughput_rps']} req/s "
+            f"-> {results['throughput_rps']} req/s)"
+        ))
+        params = ('users', 'turns', 'llm_latency')
+        if any(baseline['meta'].get(p) != results['meta'][p] for p in params):
+            self.stdout.write(self.style.NOTICE("Paramètres différents de la baseline : comparaison indicative"))
+        regressions = []
+        for route, current in results['endpoints'].items():
+            previous = baseline['endpoints'].get(route)
+            if not previous:
+                self.stdout.write(f"{route:<24} | nouvel endpoint")
+                continue
+            deltas = {
+                q: (current[q] - previous[q]) / previous[q] * 100 if previous[q] else 0.0
+                for q in ('p50_ms', 'p95_ms', 'p99_ms')
+            }
+            line = f"{route:<24} | " + " | ".join(f"{q[:3]} {d:+6.1f}%" for q, d in deltas.items())
+            if deltas['p95_ms'] > tolerance:
+                regressions.append(route)
+                self.stdout.write(self.style.ERROR(line + "  ⚠️ régression"))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,110 @@
+import json
+import time
+import statistics
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from clinical_cases.management.commands.sync_validated_cases import Command as SyncCommand
+from profiling.views import score_test
+from simulation.bench_fixtures import (
+    make_case_data, make_chat_history, make_noisy_llm_outputs, make_remote_case, make_test_answers
+)
+from simulation.llm_service import build_system_instruction, build_contents
+from simulation.llm_tutor import extract_json_from_text
+
+DEFAULT_BASELINE = 'benchmarks/microbench_baseline.json'
+
+
+def build_benchmarks():
+    """Nom -> fonction sans argument. Les fixtures sont construites une seule fois, hors mesure."""
+    case_data = make_case_data(nb_symptomes=40, nb_examens=80)
+    history = make_chat_history(200)
+    outputs = make_noisy_llm_outputs(15)
+    remote = make_remote_case()
+    correct, answers = make_test_answers(15)
+    correct_100, answers_100 = make_test_answers(100)
+    sync = SyncCommand()
+
+    return {
+        "build_system_instruction": lambda: build_system_instruction(case_data),
+        "build_contents[200 tours]": lambda: build_contents(history, "Avez-vous mal ailleurs ?"),
+        "extract_json[brut]": lambda: extract_json_from_text(outputs['raw']),
+        "extract_json[markdown]": lambda: extract_json_from_text(outputs['markdown']),
+        "extract_json[texte autour]": lambda: extract_json_from_text(outputs['prose']),
+        "map_specialty[exact]": lambda: sync._map_specialty("cardiology"),
+        "map_specialty[partiel]": lambda: sync._map_specialty(remote['specialite_confirmee']),
+        "extract_vitals": lambda: sync._extract_vitals(remote['patient_info_raw']),
+        "extract_symptomes": lambda: sync._extract_symptomes(remote['motif_consultation']),
+        "score_test[15 questions]": lambda: score_test(correct, answers),
+        "score_test[100 questions]": lambda: score_test(correct_100, answers_100),
+    }
+
+
+def measure(func, repeat=7, min_time=0.1):
+    """Temps par appel (µs) : nombre de boucles calibré pour ~min_time s, médiane et min sur `repeat` séries."""
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        loops *= 2 if elapsed == 0 else max(2, min(10, int(min_time / elapsed) + 1))
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        timings.append((time.perf_counter() - start) / loops * 1e6)
+    return {"median_us": round(statistics.median(timings), 3), "min_us": round(min(timings), 3), "loops": loops}
+
+
+class Command(BaseCommand):
+    help = ("Microbenchmarks des fonctions CPU du chemin de requête (prompt, historique, parsing JSON, "
+            "sync des cas, correction du test) avec comparaison à une baseline enregistrée.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', default=None, help="Ne lance que les benchmarks dont le nom contient ce texte")
+        parser.add_argument('--repeat', type=int, default=7)
+        parser.add_argument('--min-time', type=float, default=0.1, help="Durée min d'une série (s)")
+        parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+        parser.add_argument('--save-baseline', action='store_true', help="Enregistre les résultats comme baseline")
+        parser.add_argument('--fail-above', type=float, default=None,
+                            help="Échoue si une médiane régresse de plus de ce pourcentage")
+
+    def handle(self, *args, **options):
+        baseline_path = Path(options['baseline'])
+        if not baseline_path.is_absolute():
+            baseline_path = Path(settings.BASE_DIR) / baseline_path
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+
+        results = {}
+        regressions = []
+        self.stdout.write(f"{'benchmark':<30} | {'médiane µs':>11} | {'min µs':>10} | {'baseline µs':>11} | {'écart':>8}")
+        for name, func in build_benchmarks().items():
+            if options['filter'] and options['filter'] not in name:
+                continue
+            results[name] = measure(func, options['repeat'], options['min_time'])
+            current = results[name]['median_us']
+            previous = baseline.get('benchmarks', {}).get(name, {}).get('median_us')
+
+            delta = f"{(current - previous) / previous * 100:+7.1f}%" if previous else "       -"
+            line = (f"{name:<30} | {current:>11.2f} | {results[name]['min_us']:>10.2f} | "
+                    f"{previous if previous else '-':>11} | {delta:>8}")
+            if previous and options['fail_above'] is not None and (current - previous) / previous * 100 > options['fail_above']:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        if options['save_baseline']:
+            # Les benchmarks non relancés (--filter) gardent leur valeur précédente
+            merged = {**baseline.get('benchmarks', {}), **results}
+            baseline_path.parent.mkdir(exist_ok=True)
+            baseline_path.write_text(json.dumps({"benchmarks": merged}, indent=2, ensure_ascii=False) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline enregistrée dans {baseline_path}"))
+
+        if regressions:
+            raise CommandError(f"Régression au-delà de {options['fail_above']}% : {', '.join(regressions)}")
@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand
+from simulation.models import LLMBatchJob
+from simulation.llm_batch import poll_job
+
+
+class Command(BaseCommand):
+    help = "Récupère les résultats des lots batch en cours, les écrit en base et affiche coût et débit par lot."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wait', action='store_true', help="Boucle jusqu'à ce que tous les lots soient terminés")
+        parser.add_argument('--interval', type=float, default=30.0, help="Secondes entre deux interrogations")
+
+    def handle(self, *args, **options):
+        while True:
+            pending = list(LLMBatchJob.objects.filter(status='SUBMITTED'))
+            for job in pending:
+                if poll_job(job):
+                    self.report(job)
+            remaining = LLMBatchJob.objects.filter(status='SUBMITTED').count()
+            if not options['wait'] or not remaining:
+                break
+            self.stdout.write(f"{remaining} lot(s) en cours, nouvel essai dans {options['interval']}s")
+            time.sleep(options['interval'])
+
+        if remaining:
+            self.stdout.write(f"{remaining} lot(s) toujours en cours.")
+
+    def report(self, job):
+        style = self.style.SUCCESS if job.status == 'SUCCEEDED' else self.style.ERROR
+        self.stdout.write(style(
+            f"Lot {job.id} {job.kind} : {job.status} | {job.nb_succeeded}/{job.nb_items} OK, {job.nb_failed} échecs | "
+            f"tokens {job.input_tokens} in / {job.output_tokens} out | coût ${job.cost_usd:.4f} | "
+            f"{job.duration_seconds():.0f}s, {job.items_per_minute() or 0} lignes/min"
+        ))
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+from profiling.models import LearnerProfile
+from collections import Counter
+from profiling.quiz_bank import count_quizzes, profile_key
+from simulation.models import SimulationSession, LLMBatchItem
+from simulation.llm_batch import submit_quiz_prefill, submit_rescoring, get_batch_backend
+
+
+class Command(BaseCommand):
+    help = "Soumet un lot batch : pré-génération de Quiz (par type de profil) ou re-notation de sessions terminées."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['quiz', 'rescoring'])
+        parser.add_argument('--backend', choices=['gemini', 'local'], default=None,
+                            help="Par défaut : settings.LLM_BATCH_BACKEND")
+        parser.add_argument('--target', type=int, default=3,
+                            help="Quiz : nombre de quiz en banque visé par type de profil")
+        parser.add_argument('--limit', type=int, default=500, help="Nombre max de lignes dans le lot")
+
+    def handle(self, *args, **options):
+        backend = get_batch_backend(options['backend'])
+
+        if options['kind'] == 'quiz':
+            # Types de profil distincts (niveau, spécialité, objectifs)
+            profiles = {}
+            for p in LearnerProfile.objects.values('study_level', 'specialty', 'objectives'):
+                profile_data = {**p, "objectives": sorted(p['objectives'] or [])}
+                profiles[repr(sorted(profile_data.items()))] = profile_data
+
+            # Les quiz déjà en cours de génération (lots non terminés) comptent dans la cible
+            in_flight = Counter(
+                profile_key(item.profile_data) for item in
+                LLMBatchItem.objects.filter(job__kind='QUIZ_PREFILL', job__status='SUBMITTED').only('profile_data')
+            )
+            plan = []
+            for profile_data in profiles.values():
+                missing = max(0, options['target'] - count_quizzes(profile_data) - in_flight[profile_key(profile_data)])
+                plan.extend([profile_data] * missing)
+            plan = plan[:options['limit']]
+            if not plan:
+                self.stdout.write("Banque de Quiz déjà remplie, rien à soumettre.")
+                return
+            job = submit_quiz_prefill(plan, backend=backend)
+        else:
+            sessions = (SimulationSession.objects.filter(status='TERMINEE')
+                        .select_related('clinical_case').order_by('-end_time')[:options['limit']])
+            if not sessions:
+                raise CommandError("Aucune session terminée à re-noter.")
+            job = submit_rescoring(sessions, backend=backend)
+
+        if job.status == 'FAILED':
+            raise CommandError(f"Échec de la soumission du lot {job.id} : {job.error}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Lot {job.id} soumis ({job.nb_items} lignes, backend {job.backend}, job {job.provider_job_id})"
+        ))
@@ -0,0 +1,38 @@
+import time
+import sqlite3
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from config.db_router import REPLICA_ALIAS
+
+
+class Command(BaseCommand):
+    help = ("Réplica local (deux BDD SQLite) : copie le primaire vers DATABASE_REPLICA_URL via l'API backup. "
+            "Avec --watch, recopie périodiquement pour simuler une réplication asynchrone (avec retard).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', type=float, default=None, help="Intervalle de recopie (s)")
+
+    def handle(self, *args, **options):
+        if REPLICA_ALIAS not in settings.DATABASES:
+            raise CommandError("Aucun réplica configuré (DATABASE_REPLICA_URL)")
+        primary = settings.DATABASES['default']
+        replica = settings.DATABASES[REPLICA_ALIAS]
+        if not (primary['ENGINE'].endswith('sqlite3') and replica['ENGINE'].endswith('sqlite3')):
+            raise CommandError("sync_replica ne sert qu'au réplica SQLite local (en production : réplication du SGBD)")
+
+        while True:
+            start = time.perf_counter()
+            self.copy(str(primary['NAME']), str(replica['NAME']))
+            self.stdout.write(f"Réplica à jour ({(time.perf_counter() - start) * 1000:.0f} ms)")
+            if not options['watch']:
+                return
+            time.sleep(options['watch'])
+
+    def copy(self, source_path, target_path):
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target)
+        finally:
+            target.close()
+            source.close()
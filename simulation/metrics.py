@@ -0,0 +1,145 @@
+"""
+Métriques en mémoire (par process) : compteurs et latences.
+Consultables via la vue MetricsView (réservée au staff), ou au format texte Prometheus
+(compteurs + histogrammes cumulés) via PrometheusMetricsView.
+"""
+import time
+import threading
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+
+def _label_value(value):
+    """Valeur de label échappée comme l'exige le format texte Prometheus."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metric_key(name, labels):
+    """Clé au format Prometheus : nom{label="valeur",...}"""
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{_label_value(v)}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{inner}}}"
+
+
+# Bornes des histogrammes (secondes)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def percentile(samples, q):
+    """Percentile (0-100) d'une liste d'échantillons, None si vide."""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class MetricsRegistry:
+    """Compteurs + fenêtres glissantes de latences, thread-safe."""
+
+    def __init__(self, window=1000):
+        self._lock = threading.Lock()
+        self.window = window
+        self.counters = defaultdict(float)
+        self.timings = defaultdict(lambda: deque(maxlen=self.window))
+        self.timing_totals = defaultdict(lambda: [0, 0.0])  # [count, sum] depuis le démarrage
+        self.buckets = defaultdict(lambda: [0] * len(DEFAULT_BUCKETS))
+        self.series = {}  # clé -> (nom, labels) pour l'export Prometheus
+
+    def increment(self, name, value=1, **labels):
+        key = metric_key(name, labels)
+        with self._lock:
+            self.counters[key] += value
+            self.series.setdefault(key, (name, labels))
+
+    def observe(self, name, seconds, **labels):
+        key = metric_key(name, labels)
+        with self._lock:
+            self.timings[key].append(seconds)
+            totals = self.timing_totals[key]
+            totals[0] += 1
+            totals[1] += seconds
+            buckets = self.buckets[key]
+            for i, bound in enumerate(DEFAULT_BUCKETS):
+                if seconds <= bound:
+                    buckets[i] += 1
+                    break
+            self.series.setdefault(key, (name, labels))
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter(self, name, **labels):
+        with self._lock:
+            return self.counters.get(metric_key(name, labels), 0)
+
+    def samples(self, name, **labels):
+        with self._lock:
+            return list(self.timings.get(metric_key(name, labels), ()))
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+            timings = {key: (list(values), list(self.timing_totals[key])) for key, values in self.timings.items()}
+
+        return {
+            "counters": counters,
+            "timings": {
+                key: {
+                    "count": totals[0],
+                    "avg_ms": round(totals[1] / totals[0] * 1000, 2) if totals[0] else None,
+                    "p50_ms": round(percentile(values, 50) * 1000, 2) if values else None,
+                    "p95_ms": round(percentile(values, 95) * 1000, 2) if values else None,
+                    "p99_ms": round(percentile(values, 99) * 1000, 2) if values else None,
+                }
+                for key, (values, totals) in timings.items()
+            },
+        }
+
+    def render_prometheus(self):
+        """Export au format texte Prometheus (compteurs, histogrammes cumulés depuis le démarrage)."""
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (list(self.buckets[key]), list(self.timing_totals[key])) for key in self.timing_totals}
+            series = dict(self.series)
+
+        lines = []
+        declared = set()
+        # Tri par nom puis par clé : toutes les séries d'une métrique sont contiguës, après son # TYPE
+        for key, value in sorted(counters.items(), key=lambda item: (series[item[0]][0], item[0])):
+            name, labels = series[key]
+            if name not in declared:
+                lines.append(f"# TYPE {name} counter")
+                declared.add(name)
+            lines.append(f"{key} {value:g}")
+
+        for key, (buckets, (count, total)) in sorted(histograms.items(), key=lambda item: (series[item[0]][0], item[0])):
+            name, labels = series[key]
+            if name not in declared:
+                lines.append(f"# TYPE {name} histogram")
+                declared.add(name)
+            cumulative = 0
+            for bound, n in zip(DEFAULT_BUCKETS, buckets):
+                cumulative += n
+                lines.append(f"{metric_key(name + '_bucket', {**labels, 'le': f'{bound:g}'})} {cumulative}")
+            lines.append(f"{metric_key(name + '_bucket', {**labels, 'le': '+Inf'})} {count}")
+            lines.append(f"{metric_key(name + '_sum', labels)} {total:.6f}")
+            lines.append(f"{metric_key(name + '_count', labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+            self.timing_totals.clear()
+            self.buckets.clear()
+            self.series.clear()
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,290 @@
+import re
+import gzip
+import time
+from importlib import import_module
+from types import SimpleNamespace
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.urls import resolve, Resolver404
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from whitenoise.middleware import WhiteNoiseMiddleware
+from .metrics import metrics
+from config.db_router import REPLICA_ALIAS, mark_recent_write
+from . import profiler
+from .request_timing import start_request, end_request, timed_render
+
+try:
+    import brotli
+except ImportError:  # Dépendance optionnelle : gzip seul
+    brotli = None
+
+
+class ServerTimingMiddleware:
+    """
+    Mesure chaque requête (BDD, LLM, rendu DRF) : en-tête Server-Timing + histogrammes par route
+    (http_request_*_seconds, exportés par PrometheusMetricsView). À placer en tête de MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        timing, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        timing, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        return self.finish(request, response, timing)
+
+    def process_template_response(self, request, response):
+        # Réponses DRF : le rendu (sérialisation JSON) est chronométré à part
+        render = response.render
+
+        def timed():
+            with timed_render():
+                return render()
+
+        response.render = timed
+        return response
+
+    def finish(self, request, response, timing):
+        response['Server-Timing'] = timing.server_timing()
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else 'unmatched'
+        metrics.observe('http_request_duration_seconds', time.perf_counter() - timing.start, route=route)
+        metrics.observe('http_request_db_seconds', timing.db_seconds, route=route)
+        metrics.observe('http_request_llm_seconds', timing.llm_seconds, route=route)
+        metrics.observe('http_request_render_seconds', timing.render_seconds, route=route)
+        return response
+
+
+class CompressionMiddleware:
+    """
+    Compression des réponses volumineuses (historique d'une session, dossier du cas) selon
+    Accept-Encoding : brotli si disponible et accepté, sinon gzip. Les réponses en flux (Quiz NDJSON,
+    fichiers statiques servis par WhiteNoise, déjà précompressés) ne sont pas touchées.
+    """
+    sync_capable = True
+    async_capable = True
+
+    COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'application/xml')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.compress(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.compress(request, await self.get_response(request))
+
+    def compress(self, request, response):
+        if (response.streaming or response.has_header('Content-Encoding')
+                or not response.get('Content-Type', '').startswith(self.COMPRESSIBLE_TYPES)):
+            return response
+        # La représentation dépend de l'en-tête, même pour les petites réponses
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 1024):
+            return response
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+        start = time.perf_counter()
+        if encoding == 'br':
+            compressed = brotli.compress(response.content, quality=getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 4))
+        else:
+            compressed = gzip.compress(response.content, compresslevel=getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6),
+                                       mtime=0)
+        metrics.observe('http_compression_seconds', time.perf_counter() - start, encoding=encoding)
+        metrics.increment('http_response_bytes_total', len(response.content), stage='raw')
+        metrics.increment('http_response_bytes_total', len(compressed), stage='wire')
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        if response.has_header('ETag'):
+            # Comme GZipMiddleware : l'ETag fort ne désigne plus les mêmes octets
+            response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+        return response
+
+
+def negotiate_encoding(accept_encoding):
+    """'br', 'gzip' ou None, d'après les q-values d'Accept-Encoding (à q égal, brotli d'abord)."""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if name:
+            accepted[name.strip().lower()] = q
+    candidates = [('br', 2), ('gzip', 1)] if brotli is not None else [('gzip', 1)]
+    scored = [(accepted.get(name, accepted.get('*', 0.0)), rank, name) for name, rank in candidates]
+    q, _, name = max(scored)
+    return name if q > 0 else None
+
+
+class RequestProfilerMiddleware:
+    """
+    Profilage à la demande (cf. simulation/profiler.py) : `X-Profile: 1` ou `?_profile=1` sur une vue DRF,
+    réservé au staff (JWT ou session admin). L'identifiant de la capture est renvoyé dans `X-Profile-Capture`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.wants_profile(request):
+            return self.get_response(request)
+        capture, token = profiler.begin()
+        profiler.register_worker_thread()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.end(capture, token)
+        return self.finish(request, response, capture)
+
+    async def __acall__(self, request):
+        # Test sans E/S d'abord : aucune bascule de thread pour les requêtes non profilées
+        if not self.requested(request) or not await sync_to_async(self.wants_profile)(request):
+            return await self.get_response(request)
+        capture, token = profiler.begin()
+        # Thread où tourneront les sync_to_async de la vue (même ThreadSensitiveContext)
+        await sync_to_async(profiler.register_worker_thread)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            profiler.end(capture, token)
+        return await sync_to_async(self.finish)(request, response, capture)
+
+    @staticmethod
+    def requested(request):
+        return getattr(settings, 'PROFILER_ENABLED', True) and (
+            request.headers.get('X-Profile') == '1' or request.GET.get('_profile') == '1'
+        )
+
+    def wants_profile(self, request):
+        if not self.requested(request):
+            return False
+        try:
+            view = resolve(request.path_info).func
+        except Resolver404:
+            return False
+        if not hasattr(view, 'cls'):  # Vues DRF uniquement (APIView.as_view)
+            return False
+
+        user = self.staff_user(request)
+        if user is None:
+            return False
+        request.profiler_user = user
+        return True
+
+    def staff_user(self, request):
+        """
+        Utilisateur staff de la requête. Ce middleware passe avant SessionMiddleware / AuthenticationMiddleware
+        (toute la chaîne est profilée) et avant l'authentification DRF : JWT et session admin sont résolus ici.
+        """
+        from rest_framework.exceptions import AuthenticationFailed
+        from rest_framework_simplejwt.authentication import JWTAuthentication
+        from rest_framework_simplejwt.exceptions import InvalidToken
+
+        try:
+            result = JWTAuthentication().authenticate(request)
+        except (InvalidToken, AuthenticationFailed):
+            result = None
+        user = result[0] if result else self.session_user(request)
+        return user if user is not None and user.is_staff else None
+
+    @staticmethod
+    def session_user(request):
+        from django.contrib.auth import get_user
+
+        session_key = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if not session_key:
+            return None
+        store = import_module(settings.SESSION_ENGINE).SessionStore(session_key)
+        # get_user ne lit que request.session : la requête elle-même n'est pas modifiée
+        user = get_user(SimpleNamespace(session=store))
+        return user if user.is_authenticated else None
+
+    def finish(self, request, response, capture):
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else ''
+        stored = profiler.store_capture(capture, request, route, response.status_code)
+        response['X-Profile-Capture'] = str(stored.id)
+        return response
+
+
+class AsyncWhiteNoiseMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise compatible async. L'original est sync uniquement : sous ASGI, il rend synchrone toute
+    la chaîne de middlewares au-dessus de lui, et chaque vue async est alors exécutée via
+    AsyncToSync depuis un thread bloqué pendant tout l'appel LLM.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, *args, **kwargs):
+        super().__init__(get_response, *args, **kwargs)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is not None:
+            return await sync_to_async(self.serve)(static_file, request)
+        return await self.get_response(request)
+
+
+class ReplicaStickinessMiddleware(MiddlewareMixin):
+    """
+    Read-your-writes : après une requête d'écriture réussie, l'utilisateur lit sur le primaire
+    pendant REPLICA_STICKY_SECONDS (cf. config/db_router.py). Inactif sans réplica configuré.
+    """
+
+    def process_response(self, request, response):
+        if (REPLICA_ALIAS in settings.DATABASES and request.method not in ('GET', 'HEAD', 'OPTIONS')
+                and response.status_code < 400):
+            # request.user est renseigné par l'authentification DRF (JWT) pendant la vue
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                mark_recent_write(user.pk)
+        return response
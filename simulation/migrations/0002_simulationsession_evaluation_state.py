@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationsession',
+            name='evaluation_state',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
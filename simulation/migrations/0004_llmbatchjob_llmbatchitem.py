@@ -0,0 +1,50 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulation', '0003_idempotentrequest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMBatchJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('QUIZ_PREFILL', 'Pré-génération de Quiz'), ('RESCORING', 'Re-notation de sessions')], max_length=20)),
+                ('backend', models.CharField(max_length=20)),
+                ('model', models.CharField(max_length=100)),
+                ('provider_job_id', models.CharField(blank=True, max_length=255)),
+                ('status', models.CharField(choices=[('SUBMITTED', 'Soumis'), ('SUCCEEDED', 'Terminé'), ('FAILED', 'Échec')], default='SUBMITTED', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('nb_items', models.PositiveIntegerField(default=0)),
+                ('nb_succeeded', models.PositiveIntegerField(default=0)),
+                ('nb_failed', models.PositiveIntegerField(default=0)),
+                ('input_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('cost_usd', models.FloatField(default=0.0)),
+                ('submitted_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LLMBatchItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('profile_data', models.JSONField(blank=True, default=dict)),
+                ('request', models.JSONField()),
+                ('status', models.CharField(default='PENDING', max_length=20)),
+                ('error', models.TextField(blank=True)),
+                ('session', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='batch_items', to='simulation.simulationsession')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='simulation.llmbatchjob')),
+            ],
+            options={
+                'unique_together': {('job', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 15:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simulation', '0005_profilecapture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='simulationsession',
+            name='turn_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
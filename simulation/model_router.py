@@ -0,0 +1,145 @@
+"""
+Routage des appels LLM entre deux niveaux de modèles.
+
+- 'light'    : modèle plus rapide pour les tours conversationnels courts (salutations, oui/non...)
+- 'standard' : modèle par défaut (réponses cliniques, Quiz, évaluation)
+
+Le routage repose sur des caractéristiques peu coûteuses (type de tâche, longueur du message,
+intention). Chaque niveau suit sa latence et son taux d'erreur ; un niveau dégradé est
+temporairement remplacé par l'autre.
+"""
+import re
+import time
+import threading
+from collections import deque
+from django.conf import settings
+from .fast_path import classify_intent
+from .metrics import metrics
+from .text_utils import normalize_text
+
+DEFAULT_MODEL_TIERS = {
+    'light': 'gemini-2.5-flash-lite',
+    'standard': 'gemini-2.5-flash',
+}
+
+# Latence moyenne (EWMA) au-delà de laquelle un niveau est considéré dégradé (secondes)
+DEFAULT_LATENCY_BUDGETS = {'light': 4.0, 'standard': 12.0}
+
+# Messages plus longs : on garde le modèle standard
+LIGHT_MAX_CHARS = 80
+
+# Message entièrement conversationnel ("Oui, merci !", "D'accord madame") : texte normalisé, donc la
+# ponctuation est déjà retirée. "Non, j'ai surtout mal la nuit" doit rester sur le modèle standard
+_CONVERSATIONAL_WORDS = (r"(bonjour|bonsoir|salut|hello|hi|merci|thanks?( you)?|d accord|ok(ay)?|oui|non|yes|no|"
+                         r"tres bien|parfait|je vois|entendu|au revoir|goodbye|bye)")
+CONVERSATIONAL_PATTERN = re.compile(
+    rf"^{_CONVERSATIONAL_WORDS}( {_CONVERSATIONAL_WORDS})*( (madame|monsieur|sir|madam))?$"
+)
+
+ERROR_WINDOW = 20           # Derniers appels pris en compte pour le taux d'erreur
+ERROR_RATE_THRESHOLD = 0.5
+MIN_SAMPLES = 4
+DEGRADED_COOLDOWN = 30      # Secondes avant de retenter un niveau dégradé
+EWMA_ALPHA = 0.2
+
+
+class TierHealth:
+
+    def __init__(self):
+        self.latency_ewma = None
+        self.outcomes = deque(maxlen=ERROR_WINDOW)
+        self.degraded_until = 0.0
+
+    def error_rate(self):
+        if len(self.outcomes) < MIN_SAMPLES:
+            return 0.0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+
+class ModelRouter:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.health = {tier: TierHealth() for tier in DEFAULT_MODEL_TIERS}
+
+    @property
+    def tiers(self):
+        return getattr(settings, 'LLM_MODEL_TIERS', None) or DEFAULT_MODEL_TIERS
+
+    def model_for(self, tier):
+        return self.tiers[tier]
+
+    def tier_of(self, model):
+        for tier, name in self.tiers.items():
+            if name == model:
+                return tier
+        return 'standard'
+
+    def other_tier(self, tier):
+        return 'standard' if tier == 'light' else 'light'
+
+    def choose_tier(self, workload, message=None):
+        """Niveau souhaité, d'après la tâche et le message (sans tenir compte de la santé)."""
+        if workload != 'patient' or not message:
+            # Quiz et évaluation : toujours le modèle standard
+            return 'standard'
+        if len(message) > LIGHT_MAX_CHARS:
+            return 'standard'
+        text = normalize_text(message)
+        if CONVERSATIONAL_PATTERN.match(text) or classify_intent(message):
+            return 'light'
+        return 'standard'
+
+    def is_degraded(self, tier):
+        with self._lock:
+            return self.health[tier].degraded_until > time.monotonic()
+
+    def select(self, workload, message=None):
+        """Retourne (niveau, modèle), en basculant sur l'autre niveau si celui choisi est dégradé."""
+        tier = self.choose_tier(workload, message)
+        if self.is_degraded(tier) and not self.is_degraded(self.other_tier(tier)):
+            fallback = self.other_tier(tier)
+            metrics.increment('llm_tier_fallbacks_total', from_tier=tier, to_tier=fallback)
+            tier = fallback
+        metrics.increment('llm_tier_requests_total', tier=tier, workload=workload)
+        return tier, self.model_for(tier)
+
+    def record(self, model, latency, ok):
+        """Enregistre le résultat d'un appel (une tentative) et met à jour l'état de santé du niveau."""
+        tier = self.tier_of(model)
+        budgets = getattr(settings, 'LLM_TIER_LATENCY_BUDGETS', None) or DEFAULT_LATENCY_BUDGETS
+        metrics.observe('llm_tier_latency_seconds', latency, tier=tier)
+        if not ok:
+            metrics.increment('llm_tier_errors_total', tier=tier)
+
+        with self._lock:
+            health = self.health.setdefault(tier, TierHealth())
+            health.outcomes.append(ok)
+            if ok:
+                health.latency_ewma = latency if health.latency_ewma is None else (
+                    EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * health.latency_ewma
+                )
+            too_slow = health.latency_ewma is not None and health.latency_ewma > budgets.get(tier, 12.0)
+            if health.error_rate() >= ERROR_RATE_THRESHOLD or too_slow:
+                if health.degraded_until <= time.monotonic():
+                    metrics.increment('llm_tier_degraded_total', tier=tier)
+                health.degraded_until = time.monotonic() + DEGRADED_COOLDOWN
+                # On repart d'une fenêtre vierge à la fin du cooldown
+                health.outcomes.clear()
+                health.latency_ewma = None
+
+    def status(self):
+        with self._lock:
+            now = time.monotonic()
+            return {
+                tier: {
+                    "model": self.tiers.get(tier),
+                    "latency_ewma_ms": round(h.latency_ewma * 1000, 1) if h.latency_ewma is not None else None,
+                    "error_rate": round(h.error_rate(), 3),
+                    "degraded": h.degraded_until > now,
+                }
+                for tier, h in self.health.items()
+            }
+
+
+model_router = ModelRouter()
@@ -14,6 +14,10 @@ class SimulationSession(models.Model):
     # Scores finaux (Calculés à la fin)
     score_rime = models.FloatField(default=0.0) # Global 0-100
     details_rime = models.JSONField(default=dict, blank=True) # {"R": 80, "I": 60, "M": 40, "E": 20}
+    # Résumé incrémental (thèmes abordés, examens, signes d'alarme) mis à jour à chaque tour
+    evaluation_state = models.JSONField(default=dict, blank=True)
+    # Tours de chat enregistrés : comparé à l'enregistrement d'un tour (ordre garanti entre workers)
+    turn_count = models.PositiveIntegerField(default=0)
     
     status = models.CharField(
         max_length=20, 
@@ -40,4 +44,91 @@ class ActionLog(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     
     # Pour le calcul RIME instantané (optionnel)
-    impact_score = models.FloatField(default=0.0)
\ No newline at end of file
+    impact_score = models.FloatField(default=0.0)
+
+class IdempotentRequest(models.Model):
+    """Réponse mémorisée d'un tour de chat, rejouée si le client renvoie la même Idempotency-Key."""
+    session = models.ForeignKey(SimulationSession, on_delete=models.CASCADE, related_name='idempotent_requests')
+    key = models.CharField(max_length=128)
+    response = models.JSONField(null=True, blank=True) # None tant que le tour est en cours
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('session', 'key')
+
+class LLMBatchJob(models.Model):
+    """Lot de prompts non interactifs (pré-génération de Quiz, re-notation) soumis en un seul job au fournisseur."""
+    KIND_CHOICES = [('QUIZ_PREFILL', 'Pré-génération de Quiz'), ('RESCORING', 'Re-notation de sessions')]
+    STATUS_CHOICES = [
+        ('SUBMITTED', 'Soumis'), ('SUCCEEDED', 'Terminé'), ('FAILED', 'Échec'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    backend = models.CharField(max_length=20)  # gemini, local
+    model = models.CharField(max_length=100)
+    provider_job_id = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='SUBMITTED')
+    error = models.TextField(blank=True)
+
+    # Comptabilité (coût et débit par lot)
+    nb_items = models.PositiveIntegerField(default=0)
+    nb_succeeded = models.PositiveIntegerField(default=0)
+    nb_failed = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    cost_usd = models.FloatField(default=0.0)
+
+    submitted_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    def duration_seconds(self):
+        if not self.completed_at:
+            return None
+        return (self.completed_at - self.submitted_at).total_seconds()
+
+    def items_per_minute(self):
+        duration = self.duration_seconds()
+        return round(self.nb_succeeded / duration * 60, 2) if duration else None
+
+    def __str__(self):
+        return f"Batch {self.id} {self.kind} ({self.status})"
+
+class LLMBatchItem(models.Model):
+    """Un prompt du lot et sa cible (profil pour le Quiz, session pour la re-notation)."""
+    job = models.ForeignKey(LLMBatchJob, on_delete=models.CASCADE, related_name='items')
+    key = models.CharField(max_length=64)  # Identifiant de la ligne dans le lot (custom_id)
+    session = models.ForeignKey(SimulationSession, on_delete=models.CASCADE, null=True, blank=True, related_name='batch_items')
+    profile_data = models.JSONField(default=dict, blank=True)  # Profil cible (Quiz)
+    request = models.JSONField()
+    status = models.CharField(max_length=20, default='PENDING')  # PENDING, SUCCEEDED, FAILED
+    error = models.TextField(blank=True)
+
+    class Meta:
+        unique_together = ('job', 'key')
+
+class ProfileCapture(models.Model):
+    """Profil échantillonné d'une requête (staff, à la demande) ; le contenu est un fichier "collapsed stacks"."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    route = models.CharField(max_length=100, blank=True)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    duration_ms = models.FloatField()
+    samples = models.PositiveIntegerField(default=0)
+    file_name = models.CharField(max_length=100)  # Dans settings.PROFILER_DIR
+    size = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def file_path(self):
+        from .profiler import capture_dir
+        return capture_dir() / self.file_name
+
+    def delete(self, *args, **kwargs):
+        self.file_path().unlink(missing_ok=True)
+        return super().delete(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.method} {self.path} ({self.duration_ms} ms)"
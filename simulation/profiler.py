@@ -0,0 +1,187 @@
+"""
+Profilage à la demande d'une requête (staff uniquement) : échantillonnage de la pile à intervalle fixe.
+
+Déclenché par l'en-tête `X-Profile: 1` ou `?_profile=1` sur une vue DRF (cf. RequestProfilerMiddleware).
+- Vue synchrone : pile du thread qui exécute la requête (sys._current_frames)
+- Vue async (AsyncAPIView : SendMessageView, PerformActionView) : la vue s'exécute dans la boucle
+  d'événements, pas dans le thread du middleware. dispatch() rattache sa tâche (attach_task) et on
+  échantillonne la pile logique de la tâche : pile du thread de la boucle quand elle tourne, sinon
+  chaîne des `await` complétée par le travail en cours du thread sync_to_async de la requête (ORM),
+  ou par la feuille `<attente E/S>` (appel LLM, sleep...).
+
+Sortie au format "collapsed stacks" (une ligne `f1;f2;f3 N`), lisible par flamegraph.pl ou
+speedscope. Les captures sont conservées dans un tampon circulaire sur disque (PROFILER_MAX_CAPTURES).
+"""
+import os
+import sys
+import time
+import uuid
+import threading
+import contextvars
+from collections import Counter
+from pathlib import Path
+from django.conf import settings
+
+_active = contextvars.ContextVar('profiler_capture', default=None)
+
+
+def frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def thread_stack(frame):
+    """Pile racine -> feuille à partir du cadre courant d'un thread."""
+    stack = []
+    while frame is not None:
+        stack.append(frame_label(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def executor_work(frame):
+    """
+    Cadres exécutés par un thread sync_to_async (après le _WorkItem.run le plus interne, de
+    concurrent.futures ou de l'exécuteur asgiref), [] si le thread attend du travail.
+    """
+    frames = []
+    while frame is not None:
+        name = frame.f_code.co_qualname
+        if name == '_WorkItem.run':
+            return [frame_label(f) for f in reversed(frames)]
+        if name in ('CurrentThreadExecutor.run_until_future', '_worker'):
+            return []
+        frames.append(frame)
+        frame = frame.f_back
+    return []
+
+
+class SamplingProfiler:
+    """Échantillonneur en thread séparé, ciblant un thread (vue sync) ou une tâche asyncio (vue async)."""
+
+    def __init__(self, interval=None, max_seconds=None):
+        self.interval = interval or getattr(settings, 'PROFILER_INTERVAL', 0.005)
+        self.max_seconds = max_seconds or getattr(settings, 'PROFILER_MAX_SECONDS', 60)
+        self.stacks = Counter()
+        self.samples = 0
+        self.thread_id = None      # Thread du middleware, puis de la boucle d'événements (vue async)
+        self.worker_id = None      # Thread où s'exécute le code synchrone de la requête (vue sync, ORM)
+        self.task = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self.duration = 0.0
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self._start = time.perf_counter()
+        self._sampler = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+        self._sampler.start()
+        return self
+
+    def attach_task(self, task):
+        """Bascule sur la tâche asyncio de la vue (appelé depuis la boucle d'événements)."""
+        if self.worker_id is None:
+            self.worker_id = self.thread_id
+        self.thread_id = threading.get_ident()
+        self.task = task
+
+    def stop(self):
+        self._stop.set()
+        if self._sampler:
+            self._sampler.join()
+        self.duration = time.perf_counter() - self._start
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if time.perf_counter() - self._start > self.max_seconds:
+                return
+            frames = sys._current_frames()
+            stack = self._task_stack(frames) if self.task is not None else self._thread_stack(frames)
+            if stack:
+                self.stacks[";".join(stack)] += 1
+                self.samples += 1
+            del frames  # Évite de garder les cadres (et leurs variables locales) en vie
+
+    def _thread_stack(self, frames, thread_id=None):
+        frame = frames.get(thread_id or self.worker_id or self.thread_id)
+        return thread_stack(frame) if frame is not None else None
+
+    def _task_stack(self, frames):
+        if self.task.done():
+            return None
+        coro = self.task.get_coro()
+        if getattr(coro, 'cr_running', False):
+            return self._thread_stack(frames, self.thread_id)
+
+        # Tâche suspendue : chaîne des await (coroutine -> coroutine -> ... -> Future)
+        stack = []
+        awaitable = coro
+        while awaitable is not None:
+            frame = getattr(awaitable, 'cr_frame', None) or getattr(awaitable, 'gi_frame', None)
+            if frame is None:
+                break
+            stack.append(frame_label(frame))
+            awaitable = getattr(awaitable, 'cr_await', None) or getattr(awaitable, 'gi_yieldfrom', None)
+        if not stack:
+            return None
+
+        worker = frames.get(self.worker_id) if self.worker_id else None
+        work = executor_work(worker) if worker is not None else []
+        return stack + (["<sync_to_async>"] + work if work else ["<attente E/S>"])
+
+
+def begin():
+    profiler = SamplingProfiler().start()
+    return profiler, _active.set(profiler)
+
+
+def end(profiler, token):
+    profiler.stop()
+    _active.reset(token)
+
+
+def register_worker_thread():
+    """Appelé depuis le thread où s'exécute le code synchrone de la requête (cf. RequestProfilerMiddleware)."""
+    profiler = _active.get()
+    if profiler is not None:
+        profiler.worker_id = threading.get_ident()
+
+
+def attach_task(task):
+    """Appelé par AsyncAPIView.dispatch : no-op hors profilage."""
+    profiler = _active.get()
+    if profiler is not None:
+        profiler.attach_task(task)
+
+
+def collapsed(profiler):
+    return "".join(f"{stack} {count}\n" for stack, count in profiler.stacks.most_common())
+
+
+def capture_dir():
+    return Path(getattr(settings, 'PROFILER_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+def store_capture(profiler, request, route, status_code):
+    """Écrit la capture sur disque et purge les plus anciennes au-delà de PROFILER_MAX_CAPTURES."""
+    from .models import ProfileCapture
+
+    directory = capture_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    file_name = f"{uuid.uuid4().hex}.collapsed"
+    content = collapsed(profiler)
+    (directory / file_name).write_text(content, encoding='utf-8')
+
+    user = getattr(request, 'profiler_user', None)
+    capture = ProfileCapture.objects.create(
+        user=user, method=request.method, path=request.get_full_path()[:500], route=route,
+        status_code=status_code, duration_ms=round(profiler.duration * 1000, 1),
+        samples=profiler.samples, file_name=file_name, size=len(content.encode('utf-8')),
+    )
+
+    # Tampon circulaire : seules les N captures les plus récentes sont gardées
+    max_captures = getattr(settings, 'PROFILER_MAX_CAPTURES', 50)
+    for old in ProfileCapture.objects.order_by('-created_at', '-id')[max_captures:]:
+        old.delete()
+    return capture
@@ -0,0 +1,109 @@
+"""
+Décomposition du temps d'une requête : BDD, LLM (appels, échecs/retries, tokens) et sérialisation.
+
+Le middleware ServerTimingMiddleware ouvre une mesure par requête (contextvar, propagée par
+sync_to_async aux threads de la vue) ; les hooks ci-dessous l'alimentent :
+- BDD : execute_wrapper installé sur chaque connexion (signal connection_created)
+- LLM : record_llm() dans llm_service / llm_tutor, à chaque tentative
+- Sérialisation : rendu DRF (response.render) chronométré par le middleware
+"""
+import time
+import contextvars
+from contextlib import contextmanager
+from .metrics import metrics
+
+_current = contextvars.ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    __slots__ = ('start', 'db_count', 'db_seconds', 'llm_calls', 'llm_errors', 'llm_seconds',
+                 'input_tokens', 'output_tokens', 'render_seconds')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.db_count = 0
+        self.db_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_errors = 0
+        self.llm_seconds = 0.0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.render_seconds = 0.0
+
+    def server_timing(self):
+        """Valeur de l'en-tête Server-Timing (durées en ms)."""
+        total = time.perf_counter() - self.start
+        app = max(0.0, total - self.db_seconds - self.llm_seconds - self.render_seconds)
+        parts = [
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.db_count} requêtes"',
+            f'llm;dur={self.llm_seconds * 1000:.1f};desc="{self.llm_calls} appels, {self.llm_errors} échecs, '
+            f'{self.input_tokens} in/{self.output_tokens} out tokens"',
+            f'render;dur={self.render_seconds * 1000:.1f}',
+            f'app;dur={app * 1000:.1f}',
+            f'total;dur={total * 1000:.1f}',
+        ]
+        return ", ".join(parts)
+
+
+def start_request():
+    """Retourne (mesure, jeton) ; le jeton sert à restaurer le contexte en fin de requête."""
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current():
+    return _current.get()
+
+
+def db_timing_wrapper(execute, sql, params, many, context):
+    """execute_wrapper Django : chronomètre chaque requête SQL de la requête HTTP en cours."""
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timing.db_count += 1
+        timing.db_seconds += time.perf_counter() - start
+
+
+def install_db_timing(sender, connection, **kwargs):
+    """Handler du signal connection_created."""
+    if db_timing_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_timing_wrapper)
+
+
+def record_llm(seconds, response=None, ok=True, model=None):
+    """Une tentative d'appel LLM (les retries comptent comme des tentatives en échec)."""
+    usage = getattr(response, 'usage_metadata', None)
+    input_tokens = (usage.prompt_token_count or 0) if usage else 0
+    output_tokens = (usage.candidates_token_count or 0) if usage else 0
+    if input_tokens or output_tokens:
+        metrics.increment('llm_tokens_total', input_tokens, direction='input')
+        metrics.increment('llm_tokens_total', output_tokens, direction='output')
+
+    timing = _current.get()
+    if timing is None:
+        return
+    timing.llm_calls += 1
+    timing.llm_seconds += seconds
+    timing.input_tokens += input_tokens
+    timing.output_tokens += output_tokens
+    if not ok:
+        timing.llm_errors += 1
+
+
+@contextmanager
+def timed_render():
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = _current.get()
+        if timing is not None:
+            timing.render_seconds += time.perf_counter() - start
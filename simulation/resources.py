@@ -0,0 +1,82 @@
+"""
+Ressources partagées d'un worker ASGI : créées une fois au `lifespan.startup` (config/asgi.py),
+fermées au `lifespan.shutdown`.
+
+- Client LLM (google-genai) : un seul client, donc un seul pool HTTP (et ses connexions TLS)
+  réutilisé par toutes les requêtes du worker.
+- Caches chauds : index d'examens des cas les plus récents (exam_engine).
+
+Sous WSGI ou sans lifespan, get_client() crée un client par appel comme avant : le pool async
+d'un client est lié à sa boucle d'événements, et une vue async servie en WSGI tourne dans une
+boucle jetable par requête.
+"""
+import time
+import asyncio
+import logging
+from asgiref.sync import sync_to_async
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerResources:
+
+    def __init__(self):
+        self.loop = None
+        self.llm_client = None
+        self.started_at = None
+
+    @property
+    def started(self):
+        return self.started_at is not None
+
+    async def startup(self):
+        from .llm_service import build_client
+
+        self.loop = asyncio.get_running_loop()
+        self.llm_client = build_client()
+        nb_indexes = await sync_to_async(self.warm_caches)()
+        self.started_at = time.time()
+        logger.info("Worker ASGI prêt : client LLM partagé, %s index d'examens préchargés", nb_indexes)
+
+    async def shutdown(self):
+        client, self.llm_client = self.llm_client, None
+        self.started_at = None
+        self.loop = None
+        aio = getattr(client, 'aio', None)
+        if hasattr(aio, 'aclose'):
+            await aio.aclose()
+        if hasattr(client, 'close'):
+            client.close()
+
+    def warm_caches(self):
+        from django.db import connection
+        from clinical_cases.models import ClinicalCase
+        from .exam_engine import get_exam_index, _INDEX_CACHE_SIZE
+
+        try:
+            cases = ClinicalCase.objects.order_by('-id').only('uuid', 'case_data')[:_INDEX_CACHE_SIZE]
+            for case in cases:
+                get_exam_index(case.uuid, case.case_data or {})
+            return len(cases)
+        except Exception as e:
+            # BDD pas encore migrée (premier déploiement) : le worker démarre quand même
+            logger.error(f"Préchargement des index d'examens impossible : {e}")
+            return 0
+        finally:
+            connection.close()
+
+    def shared_llm_client(self):
+        """
+        Client partagé si utilisable ici : hors boucle (thread sync_to_async, API synchrone)
+        ou dans la boucle du worker. None sinon (WSGI, boucle jetable).
+        """
+        if self.llm_client is None:
+            return None
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return self.llm_client
+        return self.llm_client if loop is self.loop else None
+
+
+worker_resources = WorkerResources()
@@ -0,0 +1,86 @@
+"""
+Sérialisation des tours de chat par session.
+
+Verrou FIFO (tickets) par UUID de session, utilisable depuis n'importe quelle boucle asyncio :
+sous WSGI chaque requête async a sa propre boucle, un asyncio.Lock partagé ne suffirait pas.
+L'attente se fait par petites pauses asyncio, sans bloquer de thread.
+
+Le verrou ne vaut que pour le process : entre workers, l'ordre est garanti en base par
+SimulationSession.turn_count (le tour n'est enregistré que si le compteur n'a pas bougé depuis la
+lecture de l'historique, sinon TurnConflict).
+"""
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+
+POLL_INTERVAL = 0.01
+
+
+class TurnConflict(Exception):
+    """Un autre tour de la session a été enregistré (autre worker) pendant le calcul de celui-ci."""
+
+
+class _Queue:
+    def __init__(self):
+        self.next_ticket = 0
+        self.serving = 0
+        self.abandoned = set()
+        self.users = 0
+
+
+class SessionTurnLocks:
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._queues = {}
+
+    def _advance(self, queue):
+        # Appelé sous self._guard : passe au ticket suivant non abandonné
+        queue.serving += 1
+        while queue.serving in queue.abandoned:
+            queue.abandoned.discard(queue.serving)
+            queue.serving += 1
+
+    @asynccontextmanager
+    async def hold(self, key):
+        """Exécute le bloc quand tous les tours précédents de la même session sont terminés."""
+        with self._guard:
+            queue = self._queues.setdefault(key, _Queue())
+            ticket = queue.next_ticket
+            queue.next_ticket += 1
+            queue.users += 1
+
+        try:
+            try:
+                while True:
+                    with self._guard:
+                        if queue.serving == ticket:
+                            break
+                    await asyncio.sleep(POLL_INTERVAL)
+            except BaseException:
+                # Annulé pendant l'attente : on libère sa place dans la file
+                with self._guard:
+                    if queue.serving == ticket:
+                        self._advance(queue)
+                    else:
+                        queue.abandoned.add(ticket)
+                raise
+
+            try:
+                yield
+            finally:
+                with self._guard:
+                    self._advance(queue)
+        finally:
+            with self._guard:
+                queue.users -= 1
+                if queue.users == 0:
+                    self._queues.pop(key, None)
+
+    def waiting(self, key):
+        with self._guard:
+            queue = self._queues.get(key)
+            return queue.users if queue else 0
+
+
+session_turn_locks = SessionTurnLocks()
@@ -0,0 +1,134 @@
+"""
+Réponse d'ouverture du patient, générée par anticipation.
+
+La première question de l'étudiant (« Qu'est-ce qui vous amène ? ») porte presque toujours sur le
+motif de consultation. Dès le démarrage d'une session (StartSimulationView), la présentation du
+patient est générée en arrière-plan, une fois par cas et par langue, et conservée dans le cache
+partagé entre workers (réutilisée par toutes les sessions suivantes du cas). Si le premier tour
+du médecin est une question de motif, SendMessageView la sert sans attendre le LLM.
+
+Suivi :
+- speculation_first_turns_total{outcome} : hit (servie), not_ready (génération en cours ou en
+  échec), other_intent (autre question) -> taux de succès de la spéculation ;
+- speculation_tokens_total{outcome} : tokens générés, et tokens des ouvertures servies au moins
+  une fois. Compteurs par worker (la génération et le premier usage d'une ouverture ont souvent
+  lieu dans des workers différents) : tokens gaspillés = générés - utilisés, calculé sur la somme
+  de tous les workers, ex. dans Prometheus
+  sum(speculation_tokens_total{outcome="generated"}) - sum(speculation_tokens_total{outcome="used"}).
+"""
+import re
+import json
+import asyncio
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from .text_utils import normalize_text
+from .metrics import metrics
+from .request_timing import start_request, end_request
+
+logger = logging.getLogger(__name__)
+
+# Question posée au patient pour générer l'ouverture, par langue
+OPENING_QUESTIONS = {
+    'fr': "Bonjour, qu'est-ce qui vous amène aujourd'hui ?",
+    'en': "Hello, what brings you in today?",
+}
+
+# Questions de motif de consultation (texte normalisé : minuscules, sans accents)
+CHIEF_COMPLAINT_PATTERNS = {
+    'fr': [r"\bqu ?est ce qui vous (amene|arrive)", r"\bpourquoi (etes|venez)[ -]vous", r"\bqu ?est ce qui ne va pas",
+           r"\bque se passe ?t ?il", r"\bquel est (le|votre) (probleme|souci|motif)", r"\bmotif de (consultation|votre)",
+           r"\bqu ?est ce que je peux faire pour vous", r"\bcomment puis ?je vous aider", r"\bde quoi souffrez"],
+    'en': [r"\bwhat brings you", r"\bwhat seems to be the (problem|trouble)", r"\bhow can i help",
+           r"\bwhat can i do for you", r"\bwhy are you here", r"\bwhat( s| is) (wrong|the matter|going on)"],
+}
+
+_COMPILED = {lang: re.compile("|".join(patterns)) for lang, patterns in CHIEF_COMPLAINT_PATTERNS.items()}
+
+# Au-delà, la question contient probablement autre chose que le motif
+MAX_OPENING_QUESTION_LENGTH = 80
+
+_executor = None
+
+
+def is_chief_complaint_question(message, language='fr'):
+    text = normalize_text(message)
+    if not text or len(text) > MAX_OPENING_QUESTION_LENGTH:
+        return False
+    regex = _COMPILED.get(language, _COMPILED['fr'])
+    return bool(regex.search(text))
+
+
+def opening_key(case_uuid, case_data, language):
+    """Clé de cache : l'empreinte du dossier invalide l'ouverture si le cas est resynchronisé."""
+    fingerprint = hashlib.sha1(json.dumps(case_data, sort_keys=True, default=str).encode()).hexdigest()
+    return f"speculation:opening:{case_uuid}:{language}:{fingerprint}"
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=getattr(settings, 'SPECULATIVE_WORKERS', 2),
+                                       thread_name_prefix='speculation')
+    return _executor
+
+
+def schedule_opening(case_uuid, case_data, language='fr'):
+    """Lance la génération de l'ouverture du cas si elle n'est ni en cache ni déjà en cours (tous workers)."""
+    if not getattr(settings, 'SPECULATIVE_OPENING_ENABLED', False):
+        return
+    language = language if language in OPENING_QUESTIONS else 'fr'
+    key = opening_key(case_uuid, case_data, language)
+    if cache.has_key(key):
+        return
+    # Un seul worker génère (la réservation expire si le worker meurt en route)
+    if not cache.add(f"{key}:pending", True, 120):
+        return
+    get_executor().submit(generate_opening, key, case_data, language)
+
+
+def generate_opening(key, case_data, language):
+    """Thread d'arrière-plan : appel LLM en classe 'speculative' (priorité la plus basse)."""
+    from .llm_service import build_system_instruction, build_contents, call_gemini_async
+    from .model_router import model_router
+
+    timing, token = start_request()  # Compte les tokens de cet appel
+    try:
+        question = OPENING_QUESTIONS[language]
+        _, model = model_router.select('patient', question)
+        text = asyncio.run(call_gemini_async(
+            build_contents([], question), build_system_instruction(case_data), model=model,
+            attempts=2, workload_class='speculative',
+        ))
+        if not text:
+            raise ValueError("réponse vide")
+        tokens = timing.input_tokens + timing.output_tokens
+        cache.set(key, {'text': text, 'tokens': tokens}, getattr(settings, 'SPECULATIVE_OPENING_TTL', 24 * 3600))
+        metrics.increment('speculation_openings_total', outcome='generated')
+    except Exception as e:
+        metrics.increment('speculation_openings_total', outcome='failed')
+        logger.error(f"Ouverture spéculative non générée : {e}")
+    finally:
+        # Tentatives en échec comprises : ces tokens-là sont gaspillés d'office
+        metrics.increment('speculation_tokens_total', timing.input_tokens + timing.output_tokens, outcome='generated')
+        end_request(token)
+        cache.delete(f"{key}:pending")
+
+
+async def take_opening(case_uuid, case_data, language, message):
+    """Premier tour du médecin : ouverture pré-générée si la question porte sur le motif, sinon None."""
+    if not is_chief_complaint_question(message, language):
+        metrics.increment('speculation_first_turns_total', outcome='other_intent')
+        return None
+    key = opening_key(case_uuid, case_data, language if language in OPENING_QUESTIONS else 'fr')
+    entry = await cache.aget(key)
+    if entry is None:
+        metrics.increment('speculation_first_turns_total', outcome='not_ready')
+        return None
+    metrics.increment('speculation_first_turns_total', outcome='hit')
+    # Tokens « utilisés » : comptés à la première session servie (tous workers confondus)
+    if await cache.aadd(f"{key}:used", True, getattr(settings, 'SPECULATIVE_OPENING_TTL', 24 * 3600)):
+        metrics.increment('speculation_tokens_total', entry['tokens'], outcome='used')
+    return entry['text']
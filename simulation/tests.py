@@ -1,3 +1,1074 @@
-from django.test import TestCase
+import os
+import re
+import sys
+import gzip
+import json
+import asyncio
+import tempfile
+import threading
+import subprocess
+from io import StringIO
+from datetime import timedelta
+from unittest import mock, skipIf
+import tenacity
+from asgiref.sync import async_to_sync, sync_to_async
+from google.genai import errors as genai_errors
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError
+from django.db.models import F, QuerySet
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from authentication.models import User
+from clinical_cases.models import ClinicalCase
+from simulation.admission import AdmissionController, admission_controller
+from simulation.bench_fixtures import make_case_data
+from simulation.middleware import CompressionMiddleware, RequestProfilerMiddleware, brotli, negotiate_encoding
+from simulation.models import SimulationSession, ChatMessage, IdempotentRequest, ProfileCapture, LLMBatchItem
+from profiling.quiz_bank import count_quizzes, take_quiz
+from simulation.llm_batch import LocalBatchBackend, local_responder, submit_quiz_prefill, submit_rescoring, poll_job
+from simulation.llm_dispatcher import LLMDispatcher, QueueTimeout
+from simulation.hedging import HedgePolicy, hedged_call
+from simulation.coalescing import RequestCoalescer
+from simulation.llm_cassette import Cassette, CassetteClient, CassetteMiss, request_key, wrap_client
+from simulation.llm_stub import STUB_LLM, StubClient
+from simulation.llm_service import build_contents, call_gemini_async, get_patient_response_async, patient_config
+from simulation.model_router import ModelRouter
+from simulation.llm_tutor import build_evaluation_instruction
+from simulation.speculation import opening_key, schedule_opening
+from simulation.metrics import MetricsRegistry, metrics
+from simulation.request_timing import start_request, end_request, record_llm
+from simulation.exam_engine import ExamIndex, get_exam_index, _INDEX_CACHE
+from simulation.resources import worker_resources
+from simulation.fast_path import answer_factual_question, classify_intent
+from simulation.evaluation_state import new_evaluation_state, update_state_with_turn, update_state_with_action
 
-# Create your tests here.
+
+class EvaluationStateTests(TestCase):
+
+    def topics(self, message):
+        return update_state_with_turn(new_evaluation_state(), message)["topics"]
+
+    def test_keywords_match_whole_words(self):
+        self.assertNotIn("douleur", self.topics("Votre tension est normale ?"))
+        self.assertNotIn("mode_de_vie", self.topics("Utilisez-vous un parfum particulier ?"))
+        self.assertIn("douleur", self.topics("Où avez-vous mal ?"))
+
+    def test_stems_match_word_prefixes(self):
+        self.assertIn("mode_de_vie", self.topics("Fumez-vous ?"))
+        self.assertIn("antecedents_familiaux", self.topics("Des maladies dans votre famille ?"))
+        state = update_state_with_turn(new_evaluation_state(), "Êtes-vous essoufflé au moindre effort ?")
+        self.assertEqual(state["red_flags"], ["dyspnee"])
+
+
+class FastPathTests(TestCase):
+
+    def setUp(self):
+        self.case_data = make_case_data()
+
+    def test_factual_questions_are_answered_from_case_data(self):
+        self.assertEqual(answer_factual_question(self.case_data, "Quelle est votre tension ?"),
+                         "La dernière fois qu'on me l'a prise, ma tension était à 145/90.")
+        self.assertIn("père décédé d'un infarctus",
+                      answer_factual_question(self.case_data, "Avez-vous des maladies dans votre famille ?"))
+        self.assertIn("ramipril 5mg", answer_factual_question(self.case_data, "Do you take any medications?", 'en'))
+
+    def test_compound_or_open_questions_go_to_the_llm(self):
+        self.assertIsNone(classify_intent("Avez-vous des allergies ? Et des traitements ?"))
+        self.assertIsNone(classify_intent("Avez-vous des allergies et prenez-vous des médicaments"))
+        self.assertIsNone(answer_factual_question(self.case_data, "Décrivez votre douleur"))
+
+    def test_missing_information_is_left_to_the_llm(self):
+        self.assertEqual(answer_factual_question({"allergies": [{"nom": "aucune"}]}, "Avez-vous des allergies ?"),
+                         "Non, je n'ai pas d'allergie que je connaisse.")
+        self.assertIsNone(answer_factual_question({"parametresVitaux": {"TA": "?"}}, "Quelle est votre tension ?"))
+
+
+class BuildContentsTests(SimpleTestCase):
+
+    def test_consecutive_messages_of_one_role_are_merged(self):
+        history = [
+            {'role': 'doctor', 'content': "Bonjour."}, {'role': 'doctor', 'content': "Où avez-vous mal ?"},
+            {'role': 'patient', 'content': "À la poitrine."},
+        ]
+        contents = build_contents(history, "Depuis quand ?")
+        self.assertEqual([(c.role, [p.text for p in c.parts]) for c in contents], [
+            ('user', ["Bonjour.\nOù avez-vous mal ?"]), ('model', ["À la poitrine."]), ('user', ["Depuis quand ?"]),
+        ])
+        self.assertEqual([c.role for c in build_contents([], "Bonjour")], ['user'])
+
+
+class MicrobenchCommandTests(SimpleTestCase):
+
+    def run_microbench(self, baseline, *args):
+        out = StringIO()
+        call_command('microbench', '--filter', 'score_test[15', '--repeat', '1', '--min-time', '0.001',
+                     '--baseline', baseline, *args, stdout=out)
+        return out.getvalue()
+
+    def test_baseline_is_saved_and_compared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            baseline = f'{directory}/baseline.json'
+            with open(baseline, 'w') as f:
+                json.dump({"benchmarks": {"extract_vitals": {"median_us": 1.0}}}, f)
+
+            self.run_microbench(baseline, '--save-baseline')
+            with open(baseline) as f:
+                saved = json.load(f)['benchmarks']
+            # Les benchmarks non relancés (--filter) gardent leur valeur
+            self.assertEqual(set(saved), {"extract_vitals", "score_test[15 questions]"})
+
+            with open(baseline, 'w') as f:
+                json.dump({"benchmarks": {"score_test[15 questions]": {"median_us": 1e-6}}}, f)
+            with self.assertRaisesRegex(CommandError, r"score_test\[15 questions\]"):
+                self.run_microbench(baseline, '--fail-above', '50')
+            self.assertIn("score_test[15 questions]", self.run_microbench(baseline))
+
+
+class ModelRouterTests(TestCase):
+
+    def test_only_purely_conversational_turns_use_the_light_model(self):
+        router = ModelRouter()
+        for message in ("Oui, merci !", "Non.", "D'accord madame", "Thank you"):
+            self.assertEqual(router.choose_tier('patient', message), 'light', message)
+        for message in ("Non, j'ai surtout mal la nuit ?", "Oui depuis hier soir ?", "Ok et la douleur irradie ?"):
+            self.assertEqual(router.choose_tier('patient', message), 'standard', message)
+        self.assertEqual(router.choose_tier('evaluation', "Oui"), 'standard')
+
+
+class EvaluationPromptTests(TestCase):
+
+    def test_final_diagnosis_text_reaches_the_evaluator(self):
+        state = update_state_with_turn(new_evaluation_state(), "Où avez-vous mal ?")
+        details = {"diagnosis_text": "Infarctus du myocarde antérieur", "confidence": "haute"}
+        state = update_state_with_action(state, "DIAGNOSTIC_FINAL", details)
+        instruction = build_evaluation_instruction(
+            {}, [{"role": "doctor", "content": "Où avez-vous mal ?"}],
+            [{"type": "DIAGNOSTIC_FINAL", "details": details}], state,
+        )
+        self.assertIn("DIAGNOSTIC_FINAL : diagnosis_text : Infarctus du myocarde antérieur; confidence : haute",
+                      instruction)
+        self.assertNotIn("{'diagnosis_text'", instruction)
+
+
+EXAM_CASE = {
+    "parametresVitaux": {"FC": "98", "TA": "145/90", "Temp": "", "SpO2": "97"},
+    "examens": [
+        {"nom": "ECG", "resultat": "Sus-décalage du segment ST en territoire antérieur"},
+        {"nom": "Troponine"},
+        {"nom": "Bilan hépatique", "resultat": "ASAT 40 UI/L"},
+        {"nom": "Bilan lipidique", "resultat": "LDL 1,9 g/L"},
+        {"nom": "Radiographie thoracique", "resultat": {"poumons": "normaux"}},
+    ],
+}
+
+
+class ExamEngineTests(TestCase):
+
+    def resolve(self, name):
+        return ExamIndex(EXAM_CASE).resolve(name)
+
+    def test_synonyms_resolve_to_the_case_exam(self):
+        result = self.resolve("Électrocardiogramme")
+        self.assertEqual((result['matched'], result['source']), ("ECG", "case"))
+        self.assertIn("Sus-décalage", result['result'])
+        self.assertEqual(self.resolve("radio du thorax")['result'], '{"poumons": "normaux"}')
+
+    def test_more_specific_request_matches_the_case_exam(self):
+        self.assertEqual(self.resolve("ECG 12 dérivations")['matched'], "ECG")
+
+    def test_generic_request_does_not_pick_an_arbitrary_exam(self):
+        result = self.resolve("Bilan")
+        self.assertEqual((result['matched'], result['source']), (None, "default"))
+
+    def test_vitals(self):
+        self.assertEqual(self.resolve("pouls"), {"exam_name": "pouls", "matched": "FC",
+                                                 "result": "Fréquence cardiaque : 98 bpm", "source": "vitals"})
+        # Paramètre vide au dossier : pas de valeur inventée
+        self.assertEqual(self.resolve("température")['source'], "default")
+
+    def test_exam_absent_from_the_case_is_normal(self):
+        result = self.resolve("Lipase")
+        self.assertEqual(result['source'], "default")
+        self.assertEqual(result['result'], "Lipase : résultat dans les limites de la normale.")
+
+    def test_listed_exam_without_result_is_not_presented_as_normal(self):
+        result = self.resolve("tropo")
+        self.assertEqual(result['source'], "case_missing")
+        self.assertEqual(result['result'], "Troponine : résultat non disponible au dossier.")
+
+    def test_index_is_rebuilt_when_the_case_changes(self):
+        index = get_exam_index('cas-test', EXAM_CASE)
+        self.assertIs(get_exam_index('cas-test', EXAM_CASE), index)
+        updated = {**EXAM_CASE, "examens": [{"nom": "Troponine", "resultat": "450 ng/L"}]}
+        self.assertEqual(get_exam_index('cas-test', updated).resolve("Troponine")['source'], "case")
+
+
+@override_settings(**STUB_LLM)
+class PerformActionExamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='exam@example.com', password='secret', nom='Exam')
+        case = ClinicalCase.objects.create(title="Cas", specialty="Cardiologie", case_data=EXAM_CASE)
+        cls.session = SimulationSession.objects.create(user=cls.user, clinical_case=case)
+
+    def test_exam_result_is_returned_and_logged(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('simulation.llm_service.call_gemini_async') as llm:
+            response = client.post(f"/api/v1/simulation/{self.session.uuid}/action/",
+                                   {'action_type': 'EXAMEN', 'details': {'exam_name': 'ekg'}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['exam_result'], {
+            "exam_name": "ekg", "matched": "ECG",
+            "result": "Sus-décalage du segment ST en territoire antérieur", "source": "case",
+        })
+        llm.assert_not_called()
+        action = self.session.actions.get()
+        self.assertEqual(action.details['resultat'], "Sus-décalage du segment ST en territoire antérieur")
+
+
+@override_settings(**STUB_LLM)
+class SpeculativeOpeningTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='spec@example.com', password='secret', nom='Spec')
+        cls.case = ClinicalCase.objects.create(title="Cas", specialty="Cardiologie", case_data={"sexe": "M"})
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.key = opening_key(self.case.uuid, self.case.case_data, 'fr')
+
+    def send(self, session, content):
+        async def llm_reply(*args, **kwargs):
+            return "Réponse du LLM"
+
+        with mock.patch('simulation.views.get_patient_response_async', side_effect=llm_reply) as llm:
+            response = self.client.post(f"/api/v1/simulation/{session.uuid}/message/", {'content': content},
+                                        format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['patient_message']['content'], llm.call_count
+
+    def test_cached_opening_is_served_on_the_first_turn_only(self):
+        cache.set(self.key, {'text': "J'ai mal à la poitrine depuis ce matin.", 'tokens': 120})
+        used = metrics.counter('speculation_tokens_total', outcome='used')
+        first = SimulationSession.objects.create(user=self.user, clinical_case=self.case)
+
+        self.assertEqual(self.send(first, "Bonjour, qu'est-ce qui vous amène ?"),
+                         ("J'ai mal à la poitrine depuis ce matin.", 0))
+        # Deuxième tour de la même session : le LLM répond
+        self.assertEqual(self.send(first, "Qu'est-ce qui vous amène ?"), ("Réponse du LLM", 1))
+
+        # Une autre session du cas la réutilise, mais ses tokens ne sont comptés utilisés qu'une fois
+        second = SimulationSession.objects.create(user=self.user, clinical_case=self.case)
+        self.assertEqual(self.send(second, "Qu'est-ce qui vous amène ?")[1], 0)
+        self.assertEqual(metrics.counter('speculation_tokens_total', outcome='used'), used + 120)
+
+    def test_other_first_questions_go_to_the_llm(self):
+        cache.set(self.key, {'text': "J'ai mal à la poitrine depuis ce matin.", 'tokens': 120})
+        session = SimulationSession.objects.create(user=self.user, clinical_case=self.case)
+        self.assertEqual(self.send(session, "Avez-vous voyagé récemment ?"), ("Réponse du LLM", 1))
+
+    @override_settings(SPECULATIVE_OPENING_ENABLED=True)
+    def test_pending_lease_prevents_duplicate_generation(self):
+        with mock.patch('simulation.speculation.get_executor') as executor:
+            schedule_opening(self.case.uuid, self.case.case_data, 'fr')
+            schedule_opening(self.case.uuid, self.case.case_data, 'fr')  # Autre démarrage, même cas
+            self.assertEqual(executor.return_value.submit.call_count, 1)
+
+            cache.delete(f"{self.key}:pending")
+            cache.set(self.key, {'text': "Ouverture", 'tokens': 10})
+            schedule_opening(self.case.uuid, self.case.case_data, 'fr')  # Déjà en cache
+            self.assertEqual(executor.return_value.submit.call_count, 1)
+
+    def test_disabled_by_default(self):
+        with mock.patch('simulation.speculation.get_executor') as executor:
+            response = self.client.post('/api/v1/simulation/start/', {'case_uuid': str(self.case.uuid)},
+                                        format='json')
+        self.assertEqual(response.status_code, 201)
+        executor.assert_not_called()
+
+
+@override_settings(**STUB_LLM)
+class SendMessageIdempotencyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='idem@example.com', password='secret', nom='Idem')
+        # Dossier vide : ni fast-path ni ouverture spéculative, chaque tour passe par le LLM
+        case = ClinicalCase.objects.create(title="Cas", specialty="Cardiologie", case_data={})
+        cls.session = SimulationSession.objects.create(user=cls.user, clinical_case=case)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/v1/simulation/{self.session.uuid}/message/"
+
+    def send(self, key):
+        return self.client.post(self.url, {'content': "Avez-vous voyagé récemment ?"}, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_failed_turn_is_not_stored(self):
+        with mock.patch('simulation.llm_service.call_gemini_async', side_effect=RuntimeError("LLM indisponible")):
+            response = self.send('k1')
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(IdempotentRequest.objects.filter(session=self.session, key='k1').exists())
+        self.assertFalse(ChatMessage.objects.filter(session=self.session).exists())
+
+        # Le retry avec la même clé refait le tour au lieu de rejouer l'échec
+        response = self.send('k1')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response.headers)
+        stored = IdempotentRequest.objects.get(session=self.session, key='k1').response
+        self.assertEqual(stored['patient_message']['content'], response.json()['patient_message']['content'])
+        self.assertEqual(ChatMessage.objects.filter(session=self.session).count(), 2)
+
+    def test_replay_returns_stored_response(self):
+        first = self.send('k2')
+        replayed = self.send('k2')
+        self.assertEqual(replayed.status_code, 200)
+        self.assertEqual(replayed.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(replayed.json(), first.json())
+        self.assertEqual(ChatMessage.objects.filter(session=self.session).count(), 2)
+
+    def test_turn_computed_on_stale_history_is_refused(self):
+        async def reply_while_other_worker_saves(*args, **kwargs):
+            # Un autre worker enregistre un tour pendant l'appel LLM
+            await sync_to_async(SimulationSession.objects.filter(pk=self.session.pk).update)(
+                turn_count=F('turn_count') + 1
+            )
+            return "Non, pas de voyage."
+
+        with mock.patch('simulation.views.get_patient_response_async', new=reply_while_other_worker_saves):
+            response = self.send('k3')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(ChatMessage.objects.filter(session=self.session).exists())
+        self.assertFalse(IdempotentRequest.objects.filter(session=self.session, key='k3').exists())
+
+    def test_turn_is_rolled_back_when_response_cannot_be_stored(self):
+        update = QuerySet.update
+
+        def failing_update(queryset, **kwargs):
+            if queryset.model is IdempotentRequest:
+                raise DatabaseError("disque plein")
+            return update(queryset, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', failing_update):
+            response = self.send('k5')
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(ChatMessage.objects.filter(session=self.session).exists())
+        self.assertEqual(SimulationSession.objects.get(pk=self.session.pk).turn_count, self.session.turn_count)
+        self.assertFalse(IdempotentRequest.objects.filter(session=self.session, key='k5').exists())
+
+    def test_stale_claim_without_response_is_taken_over(self):
+        claim = IdempotentRequest.objects.create(session=self.session, key='k6')
+        IdempotentRequest.objects.filter(pk=claim.pk).update(created_at=timezone.now() - timedelta(hours=1))
+
+        response = self.send('k6')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', response.headers)
+        self.assertIsNotNone(IdempotentRequest.objects.get(session=self.session, key='k6').response)
+
+    def test_action_saved_during_turn_is_kept_in_evaluation_state(self):
+        SimulationSession.objects.filter(pk=self.session.pk).update(evaluation_state=new_evaluation_state())
+
+        def save_action():
+            session = SimulationSession.objects.get(pk=self.session.pk)
+            state = update_state_with_action(session.evaluation_state, "EXAMEN", {"exam_name": "ECG"})
+            SimulationSession.objects.filter(pk=session.pk).update(evaluation_state=state)
+
+        async def reply_while_action_is_saved(*args, **kwargs):
+            await sync_to_async(save_action)()
+            return "Non, pas de voyage."
+
+        with mock.patch('simulation.views.get_patient_response_async', new=reply_while_action_is_saved):
+            response = self.send('k4')
+        self.assertEqual(response.status_code, 200)
+        state = SimulationSession.objects.get(pk=self.session.pk).evaluation_state
+        self.assertEqual(state["exams"], ["ECG"])
+        self.assertEqual(state["doctor_turns"], 1)
+        self.assertIn("voyage_contexte", state["topics"])
+
+
+class RequestProfilerMiddlewareTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(email='staff@example.com', password='secret', nom='Staff', is_staff=True)
+        cls.student = User.objects.create_user(email='etudiant@example.com', password='secret', nom='Etudiant')
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILER_ENABLED=True, PROFILER_DIR=directory.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_admin_session_triggers_profile(self):
+        self.client.force_login(self.staff)
+        response = self.client.get('/api/v1/simulation/history/?_profile=1')
+        capture = ProfileCapture.objects.get(pk=response['X-Profile-Capture'])
+        self.assertEqual(capture.user, self.staff)
+
+    def test_non_staff_session_is_not_profiled(self):
+        self.client.force_login(self.student)
+        response = self.client.get('/api/v1/simulation/history/?_profile=1')
+        self.assertNotIn('X-Profile-Capture', response)
+        self.assertFalse(ProfileCapture.objects.exists())
+
+    async def test_unflagged_request_skips_profile_checks(self):
+        with mock.patch.object(RequestProfilerMiddleware, 'wants_profile', return_value=False) as wants_profile:
+            await self.async_client.get('/api/v1/cases/')
+        wants_profile.assert_not_called()
+
+
+class RequestTimingTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='timing@example.com', password='secret', nom='Timing')
+
+    def test_server_timing_header(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/v1/simulation/history/')
+        entries = dict(re.findall(r'(?:^|, )(\w+);(dur=[\d.]+(?:;desc="[^"]*")?)', response['Server-Timing']))
+        self.assertEqual(list(entries), ['db', 'llm', 'render', 'app', 'total'])
+        self.assertRegex(entries['db'], r'^dur=[\d.]+;desc="[1-9]\d* requêtes"$')
+        self.assertIn('desc="0 appels', entries['llm'])
+
+    def test_db_queries_are_counted_per_request(self):
+        User.objects.exists()  # Requêtes hors mesure : ignorées
+        timing, token = start_request()
+        try:
+            User.objects.count()
+            list(User.objects.filter(pk=self.user.pk))
+        finally:
+            end_request(token)
+        self.assertEqual(timing.db_count, 2)
+        self.assertGreater(timing.db_seconds, 0)
+
+    def test_llm_attempts_and_tokens(self):
+        usage = mock.Mock(prompt_token_count=120, candidates_token_count=30)
+        timing, token = start_request()
+        try:
+            record_llm(0.5, ok=False)
+            record_llm(0.25, mock.Mock(usage_metadata=usage))
+        finally:
+            end_request(token)
+        self.assertEqual((timing.llm_calls, timing.llm_errors, timing.llm_seconds), (2, 1, 0.75))
+        self.assertIn('2 appels, 1 échecs, 120 in/30 out tokens', timing.server_timing())
+
+
+PROMETHEUS_LINE = re.compile(
+    r'^(# TYPE [a-zA-Z_:][a-zA-Z0-9_:]* (counter|histogram)'
+    r'|[a-zA-Z_:][a-zA-Z0-9_:]*(\{[a-zA-Z_]\w*="(\\.|[^"\\\n])*"(,[a-zA-Z_]\w*="(\\.|[^"\\\n])*")*\})? \S+)$'
+)
+
+
+class PrometheusMetricsTests(TestCase):
+
+    def test_text_format_is_well_formed(self):
+        registry = MetricsRegistry()
+        registry.increment('llm_calls_total', model='flash')
+        registry.increment('llm_calls_total_bytes', 10)
+        registry.increment('llm_calls_total', 2)
+        registry.increment('llm_errors_total', error='quota "dépassé"\nretry')
+        registry.observe('http_request_duration_seconds', 0.02, route='simu_message')
+        registry.observe('http_request_duration_seconds', 3.0, route='simu_message')
+
+        lines = registry.render_prometheus().splitlines()
+        for line in lines:
+            self.assertRegex(line, PROMETHEUS_LINE)
+        # Un # TYPE par métrique, avant ses séries, toutes contiguës
+        names = [line.split()[2] if line.startswith('#') else re.match(r'[\w:]+', line).group()
+                 for line in lines]
+        families = [re.sub(r'_(bucket|sum|count)$', '', n) if n.startswith('http_') else n for n in names]
+        groups = [f for i, f in enumerate(families) if i == 0 or f != families[i - 1]]
+        self.assertEqual(len(groups), len(set(groups)))
+        self.assertEqual(sum(line.startswith('# TYPE') for line in lines), len(set(groups)))
+
+        buckets = [line for line in lines if line.startswith('http_request_duration_seconds_bucket')]
+        counts = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+        self.assertEqual(counts, sorted(counts))  # Cumulatif
+        self.assertIn('http_request_duration_seconds_bucket{le="+Inf",route="simu_message"} 2', lines)
+        self.assertIn('http_request_duration_seconds_count{route="simu_message"} 2', lines)
+
+    def get(self, **headers):
+        return APIClient().get('/api/v1/simulation/metrics/prometheus/', **headers)
+
+    def test_endpoint_requires_the_bearer_token(self):
+        with override_settings(METRICS_TOKEN=None):
+            self.assertIn(self.get(HTTP_AUTHORIZATION='Bearer None').status_code, (401, 403))
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertIn(self.get().status_code, (401, 403))
+            self.assertIn(self.get(HTTP_AUTHORIZATION='Bearer autre').status_code, (401, 403))
+            response = self.get(HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+
+class WorkerLifespanTests(TestCase):
+
+    async def run_lifespan(self, *message_types):
+        """Envoie les messages lifespan à l'application ASGI ; retourne les réponses."""
+        from config.asgi import application
+
+        received, sent = asyncio.Queue(), []
+        for message_type in message_types:
+            received.put_nowait({'type': message_type})
+
+        async def send(message):
+            sent.append(message['type'])
+
+        await application({'type': 'lifespan'}, received.get, send)
+        return sent
+
+    async def test_startup_and_shutdown(self):
+        case = await sync_to_async(ClinicalCase.objects.create)(
+            title="Cas", specialty="Cardiologie", case_data={"examens": [{"nom": "ECG", "resultat": "Normal"}]}
+        )
+        from config.asgi import application
+
+        client = mock.Mock(aio=mock.Mock(aclose=mock.AsyncMock()))
+        received, sent = asyncio.Queue(), []
+
+        async def send(message):
+            sent.append(message['type'])
+
+        with mock.patch('simulation.llm_service.build_client', return_value=client):
+            # Le worker reste démarré jusqu'au message de fin : l'application tourne en tâche de fond
+            application_task = asyncio.ensure_future(application({'type': 'lifespan'}, received.get, send))
+            received.put_nowait({'type': 'lifespan.startup'})
+            while not sent:
+                await asyncio.sleep(0.01)
+            self.assertEqual(sent, ['lifespan.startup.complete'])
+            self.assertTrue(worker_resources.started)
+            self.assertIn(case.uuid, _INDEX_CACHE)
+
+            # Boucle du worker : client partagé ; autre boucle : None ; thread sans boucle : partagé
+            self.assertIs(worker_resources.shared_llm_client(), client)
+            self.assertIsNone(await asyncio.to_thread(asyncio.run, self.shared_client_in_new_loop()))
+            self.assertIs(await asyncio.to_thread(worker_resources.shared_llm_client), client)
+
+            received.put_nowait({'type': 'lifespan.shutdown'})
+            await application_task
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        client.aio.aclose.assert_awaited_once()
+        client.close.assert_called_once()
+        self.assertFalse(worker_resources.started)
+        self.assertIsNone(worker_resources.shared_llm_client())
+
+    @staticmethod
+    async def shared_client_in_new_loop():
+        return worker_resources.shared_llm_client()
+
+    async def test_failed_startup_is_reported(self):
+        with mock.patch('simulation.llm_service.build_client', side_effect=RuntimeError("clé invalide")), \
+                self.assertLogs('config.asgi', 'ERROR'):
+            sent = await self.run_lifespan('lifespan.startup')
+        self.assertEqual(sent, ['lifespan.startup.failed'])
+        self.assertFalse(worker_resources.started)
+
+
+class CompressionMiddlewareTests(SimpleTestCase):
+
+    BODY = ('{"messages": [' + ", ".join(['{"role": "patient", "content": "J\'ai mal"}'] * 100) + ']}').encode()
+
+    def compress(self, response, accept_encoding='gzip, br'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda r: response)(request)
+
+    def json_response(self, body=None):
+        return HttpResponse(body if body is not None else self.BODY, content_type='application/json')
+
+    def test_negotiation(self):
+        self.assertEqual(negotiate_encoding('gzip, deflate, br'), 'br')
+        self.assertEqual(negotiate_encoding('br;q=0.5, gzip'), 'gzip')
+        self.assertEqual(negotiate_encoding('*;q=0.2'), 'br')
+        self.assertIsNone(negotiate_encoding('identity'))
+        self.assertIsNone(negotiate_encoding('gzip;q=0, br;q=0'))
+        self.assertIsNone(negotiate_encoding(''))
+
+    def test_large_json_is_compressed(self):
+        response = self.compress(self.json_response(), accept_encoding='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.BODY)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @skipIf(brotli is None, "brotli non installé")
+    def test_brotli_is_preferred(self):
+        response = self.compress(self.json_response())
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.BODY)
+
+    def test_small_response_varies_but_is_not_compressed(self):
+        response = self.compress(self.json_response(b'{"ok": true}'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_streaming_and_encoded_responses_are_untouched(self):
+        stream = StreamingHttpResponse(iter([self.BODY]), content_type='application/x-ndjson')
+        self.assertIs(self.compress(stream), stream)
+        self.assertFalse(stream.has_header('Content-Encoding'))
+
+        encoded = self.json_response()
+        encoded['Content-Encoding'] = 'br'
+        self.assertEqual(self.compress(encoded).content, self.BODY)
+
+    def test_strong_etag_is_weakened(self):
+        response = self.json_response()
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.compress(response, accept_encoding='gzip')['ETag'], 'W/"abc"')
+
+
+def saturated_queue(workload_class, wait=10.0):
+    """Répartiteur dont la plus vieille demande de la classe attend depuis `wait` secondes."""
+    return mock.patch('simulation.admission.llm_dispatcher.status',
+                      return_value={'oldest_wait_seconds': {workload_class: wait}})
+
+
+@override_settings(LLM_ADMISSION_ENABLED=True, LLM_ADMISSION_TARGET=1.0, LLM_ADMISSION_INTERVAL=4.0)
+class AdmissionControllerTests(TestCase):
+
+    def test_drop_rate_rises_while_queue_stays_slow(self):
+        controller = AdmissionController()
+        now = [0.0]
+        decisions = {}
+        with saturated_queue('interactive'), mock.patch('simulation.admission.time.monotonic', lambda: now[0]):
+            for t in (0.0, 4.0, 5.0, 8.0, 9.0, 10.9, 11.0, 13.3):
+                now[0] = t
+                decisions[t] = controller.admit('interactive')[0]
+        # Entrée en rejet à t=4 puis rejets espacés de 4 / sqrt(n) : 4 s, 2,83 s, 2,31 s
+        self.assertEqual(decisions, {0.0: True, 4.0: False, 5.0: True, 8.0: False, 9.0: True,
+                                     10.9: False, 11.0: True, 13.3: False})
+
+    def test_fast_queue_leaves_dropping_state(self):
+        controller = AdmissionController()
+        with saturated_queue('interactive'), mock.patch('simulation.admission.time.monotonic', return_value=100.0):
+            controller.observe('interactive', 3.0)
+            controller.states['interactive'].first_above_time = 1.0
+            self.assertFalse(controller.admit('interactive')[0])
+        with saturated_queue('interactive', wait=0.0):
+            self.assertTrue(controller.admit('interactive')[0])
+
+
+@override_settings(LLM_ADMISSION_ENABLED=True, LLM_ADMISSION_TARGET=1.0, LLM_ADMISSION_INTERVAL=4.0, **STUB_LLM)
+class AdmissionInViewsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='admission@example.com', password='secret', nom='Admission')
+        case = ClinicalCase.objects.create(title="Cas", specialty="Cardiologie", case_data=make_case_data())
+        cls.session = SimulationSession.objects.create(user=cls.user, clinical_case=case)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = f"/api/v1/simulation/{self.session.uuid}/message/"
+        state = admission_controller.states['interactive']
+        self.addCleanup(admission_controller.states.__setitem__, 'interactive', state)
+        # Classe 'interactive' déjà en mode rejet, prochain rejet immédiat
+        admission_controller.states['interactive'] = type(state)()
+        admission_controller.states['interactive'].first_above_time = 1.0
+        admission_controller.states['interactive'].dropping = True
+
+    def test_turn_answered_without_llm_is_admitted(self):
+        with saturated_queue('interactive'):
+            response = self.client.post(self.url, {'content': "Avez-vous des allergies ?"}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(admission_controller.states['interactive'].count, 0)
+
+    def test_llm_turn_is_rejected_before_the_call(self):
+        with saturated_queue('interactive'), \
+                mock.patch('simulation.views.get_patient_response_async') as llm_call:
+            response = self.client.post(self.url, {'content': "Comment vous sentez-vous ?"}, format='json',
+                                        HTTP_IDEMPOTENCY_KEY='k1')
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        llm_call.assert_not_called()
+        self.assertFalse(IdempotentRequest.objects.filter(session=self.session).exists())
+        self.assertFalse(ChatMessage.objects.filter(session=self.session).exists())
+
+
+@override_settings(**STUB_LLM)
+class LazyLLMImportTests(TestCase):
+
+    def test_sdk_is_not_imported_at_startup(self):
+        code = ("import sys, django; django.setup(); import config.urls, simulation.llm_service, "
+                "simulation.llm_tutor, simulation.llm_cassette; "
+                "print(sorted(m for m in ('google.genai', 'tenacity') if m in sys.modules))")
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                                env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'config.settings'}, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_api_errors_are_retried_up_to_attempts(self):
+        error = genai_errors.APIError(503, {'error': {'message': "surcharge", 'status': 'UNAVAILABLE'}})
+        with mock.patch('tenacity.wait_random_exponential', return_value=tenacity.wait_none()), \
+                mock.patch('simulation.llm_service._call_gemini_once', side_effect=[error, error, "Oui."]) as once:
+            self.assertEqual(async_to_sync(call_gemini_async)([], "système", attempts=3), "Oui.")
+        self.assertEqual(once.call_count, 3)
+
+    def test_failed_tier_falls_back_with_fewer_attempts(self):
+        with mock.patch('simulation.llm_service.call_gemini_async',
+                        side_effect=[RuntimeError("niveau indisponible"), "Non, aucune."]) as call:
+            reply = async_to_sync(get_patient_response_async)({}, [], "Avez-vous voyagé récemment ?")
+        self.assertEqual(reply, "Non, aucune.")
+        first, fallback = call.call_args_list
+        self.assertEqual(first.kwargs.get('attempts', 5), 5)
+        self.assertEqual(fallback.kwargs['attempts'], 2)
+        self.assertNotEqual(fallback.kwargs['model'], first.kwargs['model'])
+
+
+@override_settings(LLM_HEDGE_INITIAL_DELAY=0.05, LLM_HEDGE_MIN_DELAY=0.01, LLM_HEDGE_BUDGET=0.05)
+class HedgingTests(TestCase):
+
+    def setUp(self):
+        self.policy = HedgePolicy()
+        self.started = []
+        self.cancelled = []
+
+    def call_factory(self, *latencies, fail=()):
+        """Appels successifs : le n-ième dure latencies[n] et échoue si n est dans `fail`."""
+        async def call(n):
+            self.started.append(n)
+            try:
+                await asyncio.sleep(latencies[n])
+            except asyncio.CancelledError:
+                self.cancelled.append(n)
+                raise
+            if n in fail:
+                raise RuntimeError(f"appel {n} en échec")
+            return f"réponse {n}"
+        return lambda: call(len(self.started))
+
+    async def test_fast_primary_is_not_hedged(self):
+        self.assertEqual(self.policy.threshold(), 0.05)
+        self.assertEqual(await hedged_call(self.call_factory(0.0), self.policy), "réponse 0")
+        await asyncio.sleep(0)
+        self.assertEqual(self.started, [0])
+        self.assertEqual(len(self.policy.samples), 1)
+
+    async def test_slow_primary_is_hedged_and_cancelled(self):
+        result = await hedged_call(self.call_factory(1.0, 0.0), self.policy)
+        await asyncio.sleep(0.01)  # Annulation du principal traitée par la boucle
+        self.assertEqual(result, "réponse 1")
+        self.assertEqual(self.cancelled, [0])
+        # Échantillon = durée de l'appel principal (borne basse), pas celle du hedge gagnant
+        self.assertGreaterEqual(self.policy.samples[0], 0.05)
+        self.assertEqual(self.policy.tokens, 4.0)  # Un jeton de hedge consommé
+
+    async def test_exhausted_budget_waits_for_primary(self):
+        self.policy.tokens = 0.0
+        self.assertEqual(await hedged_call(self.call_factory(0.1, 0.0), self.policy), "réponse 0")
+        self.assertEqual(self.started, [0])
+
+    async def test_hedge_covers_a_failing_primary(self):
+        result = await hedged_call(self.call_factory(0.1, 0.0, fail={0}), self.policy)
+        self.assertEqual(result, "réponse 1")
+
+    async def test_both_calls_failing_raise(self):
+        with self.assertRaises(RuntimeError):
+            await hedged_call(self.call_factory(0.1, 0.0, fail={0, 1}), self.policy)
+
+    async def test_cancelled_request_records_no_sample(self):
+        task = asyncio.ensure_future(hedged_call(self.call_factory(1.0), self.policy))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.cancelled, [0])
+        self.assertEqual(len(self.policy.samples), 0)
+
+
+class LeaderAborted(BaseException):
+    """Interruption du leader sync (équivalent d'un arrêt du worker pendant l'appel)."""
+
+
+class CoalescerTests(TestCase):
+
+    def setUp(self):
+        self.coalescer = RequestCoalescer()
+        self.calls = []
+
+    def start_leader(self, outcome):
+        """Leader dans un thread : appelle outcome() puis attend release ; retourne (thread, résultats)."""
+        started, self.release = threading.Event(), threading.Event()
+        results = []
+
+        def func():
+            self.calls.append(threading.get_ident())
+            started.set()
+            self.release.wait(5)
+            return outcome()
+
+        def run():
+            try:
+                results.append(self.coalescer.call('k', 'interactive', func))
+            except BaseException as e:
+                results.append(e)
+
+        leader = threading.Thread(target=run)
+        leader.start()
+        started.wait(5)
+        # Le follower rejoint l'appel en cours ; le leader termine un peu plus tard
+        threading.Timer(0.05, self.release.set).start()
+        return leader, results
+
+    def test_request_key_covers_the_system_instruction(self):
+        from google.genai import types
+
+        contents = [types.Content(role='user', parts=[types.Part(text="Bonjour")])]
+        dict_contents = [{"role": "user", "parts": [{"text": "Bonjour"}]}]
+        self.assertEqual(request_key('m', contents, patient_config("Cas A")),
+                         request_key('m', dict_contents, patient_config("Cas A")))
+        self.assertNotEqual(request_key('m', contents, patient_config("Cas A")),
+                            request_key('m', contents, patient_config("Cas B")))
+
+    def test_follower_reuses_the_leader_result(self):
+        leader, results = self.start_leader(lambda: "réponse")
+        self.assertEqual(self.coalescer.call('k', 'interactive', lambda: "jamais appelé"), "réponse")
+        leader.join()
+        self.assertEqual(results, ["réponse"])
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.coalescer.in_flight(), 0)
+
+    def test_follower_receives_the_leader_error(self):
+        def failing():
+            raise RuntimeError("appel en échec")
+
+        leader, results = self.start_leader(failing)
+        with self.assertRaises(RuntimeError):
+            self.coalescer.call('k', 'interactive', lambda: "jamais appelé")
+        leader.join()
+        self.assertIsInstance(results[0], RuntimeError)
+
+    def test_aborted_sync_leader_lets_the_follower_call(self):
+        def aborted():
+            raise LeaderAborted()
+
+        leader, results = self.start_leader(aborted)
+        self.assertEqual(self.coalescer.call('k', 'interactive', lambda: "appel du follower"), "appel du follower")
+        leader.join()
+        self.assertIsInstance(results[0], LeaderAborted)
+        self.assertEqual(self.coalescer.in_flight(), 0)
+
+    def coro_factory(self, release):
+        async def call():
+            self.calls.append(len(self.calls))
+            await release.wait()
+            return f"réponse {len(self.calls)}"
+        return call
+
+    async def test_async_follower_reuses_the_leader_result(self):
+        release = asyncio.Event()
+        leader = asyncio.ensure_future(self.coalescer.acall('k', 'interactive', self.coro_factory(release)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(self.coalescer.acall('k', 'interactive', self.coro_factory(release)))
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await asyncio.gather(leader, follower), ["réponse 1", "réponse 1"])
+        self.assertEqual(self.calls, [0])
+
+    async def test_cancelled_async_leader_lets_the_follower_call(self):
+        release = asyncio.Event()
+        leader = asyncio.ensure_future(self.coalescer.acall('k', 'interactive', self.coro_factory(release)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(self.coalescer.acall('k', 'interactive', self.coro_factory(release)))
+        await asyncio.sleep(0)
+        leader.cancel()  # Client du leader parti
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+        await asyncio.sleep(0.01)
+        release.set()
+        self.assertEqual(await follower, "réponse 2")
+        self.assertEqual(self.calls, [0, 1])
+        self.assertEqual(self.coalescer.in_flight(), 0)
+
+    async def test_cancelled_follower_does_not_cancel_the_leader(self):
+        release = asyncio.Event()
+        leader = asyncio.ensure_future(self.coalescer.acall('k', 'interactive', self.coro_factory(release)))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(self.coalescer.acall('k', 'interactive', self.coro_factory(release)))
+        await asyncio.sleep(0)
+        follower.cancel()
+        await asyncio.sleep(0.01)
+        release.set()
+        self.assertEqual(await leader, "réponse 1")
+        self.assertEqual(self.calls, [0])
+
+
+@override_settings(**STUB_LLM)
+class CassetteTests(TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.path = f"{tmp.name}/llm.jsonl.gz"
+        self.request = dict(model='m', contents="Bonjour", config={'system_instruction': "Tu es le patient."})
+
+    def replayer(self):
+        return CassetteClient(Cassette(self.path))  # Relu depuis le fichier, sans client réel
+
+    def test_record_then_replay(self):
+        recorder = CassetteClient(Cassette(self.path), StubClient())
+        recorded = recorder.models.generate_content(**self.request)
+        recorded_async = async_to_sync(recorder.aio.models.generate_content)(**{**self.request, 'contents': "Re"})
+
+        replayer = self.replayer()
+        replayed = replayer.models.generate_content(**self.request)
+        self.assertEqual(replayed.text, recorded.text)
+        self.assertEqual(replayed.usage_metadata.candidates_token_count, recorded.usage_metadata.candidates_token_count)
+        replayed_async = async_to_sync(replayer.aio.models.generate_content)(**{**self.request, 'contents': "Re"})
+        self.assertEqual(replayed_async.text, recorded_async.text)
+
+    def test_streamed_chunks_are_replayed(self):
+        recorder = CassetteClient(Cassette(self.path), StubClient())
+        recorded = [chunk.text for chunk in recorder.models.generate_content_stream(**self.request)]
+        self.assertGreater(len(recorded), 1)
+        replayed = [chunk.text for chunk in self.replayer().models.generate_content_stream(**self.request)]
+        self.assertEqual(replayed, recorded)
+
+    def test_replay_miss_raises(self):
+        with override_settings(LLM_CASSETTE_MODE='replay', LLM_CASSETTE_PATH=self.path):
+            client = wrap_client(None)
+        with self.assertRaises(CassetteMiss):
+            client.models.generate_content(**self.request)
+
+    @override_settings(LLM_CASSETTE_SPEED=1)
+    async def test_identical_in_flight_calls_share_one_recording(self):
+        cassette = Cassette(self.path)
+        key = request_key(self.request['model'], self.request['contents'], self.request['config'])
+        cassette.record(key, 'm', 0.05, "premier", {})
+        cassette.record(key, 'm', 0.05, "second", {})
+        client = CassetteClient(cassette)
+
+        # Appel principal + hedge identiques : un seul enregistrement consommé
+        pair = await asyncio.gather(client.aio.models.generate_content(**self.request),
+                                    client.aio.models.generate_content(**self.request))
+        self.assertEqual([r.text for r in pair], ["premier", "premier"])
+        self.assertEqual((await client.aio.models.generate_content(**self.request)).text, "second")
+
+
+class LLMDispatcherTests(TestCase):
+
+    def setUp(self):
+        self.dispatcher = LLMDispatcher(max_concurrency=1)
+        self.order = []
+        self.release = asyncio.Event()
+
+    async def hold_slot(self):
+        """Occupe l'unique slot jusqu'à self.release ; les demandes suivantes attendent en file."""
+        async def hold():
+            async with self.dispatcher.aslot('quiz'):
+                await self.release.wait()
+        task = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        return task
+
+    async def enqueue(self, workload_class, user_key):
+        async def call():
+            async with self.dispatcher.aslot(workload_class, user_key=user_key):
+                self.order.append((workload_class, user_key))
+        task = asyncio.ensure_future(call())
+        await asyncio.sleep(0)  # En file dans l'ordre de création
+        return task
+
+    async def test_priority_classes_then_fair_share_per_user(self):
+        holder = await self.hold_slot()
+        tasks = [await self.enqueue(*request) for request in [
+            ('quiz', 'a'), ('evaluation', 'a'),
+            ('interactive', 'a'), ('interactive', 'a'), ('interactive', 'a'), ('interactive', 'b'),
+        ]]
+        self.assertEqual(self.dispatcher.status()['queued'],
+                         {'interactive': 4, 'evaluation': 1, 'quiz': 1, 'speculative': 0})
+        self.release.set()
+        await asyncio.gather(holder, *tasks)
+        # 'b' arrive après trois demandes de 'a' mais passe dès la deuxième place
+        self.assertEqual(self.order, [('interactive', 'a'), ('interactive', 'b'), ('interactive', 'a'),
+                                      ('interactive', 'a'), ('evaluation', 'a'), ('quiz', 'a')])
+
+    @override_settings(LLM_QUEUE_DEADLINES={'interactive': 0.05})
+    async def test_queue_deadline_raises(self):
+        holder = await self.hold_slot()
+        with self.assertRaises(QueueTimeout):
+            async with self.dispatcher.aslot('interactive', user_key='a'):
+                pass
+        self.assertEqual(self.dispatcher.status()['queued']['interactive'], 0)
+        self.release.set()
+        await holder
+        self.assertEqual(self.dispatcher.in_flight, 0)
+
+    async def test_cancelled_request_gives_its_turn_away(self):
+        holder = await self.hold_slot()
+        cancelled = await self.enqueue('interactive', 'a')
+        waiting = await self.enqueue('interactive', 'b')
+        cancelled.cancel()
+        await asyncio.sleep(0.01)
+        # Pas d'étiquette orpheline : 'a' n'est pas pénalisé pour un appel non servi
+        self.assertNotIn('a', self.dispatcher.user_finish['interactive'])
+        self.release.set()
+        await asyncio.gather(holder, waiting)
+        self.assertEqual(self.order, [('interactive', 'b')])
+        self.assertEqual(self.dispatcher.in_flight, 0)
+
+
+class LLMBatchTests(TestCase):
+
+    PROFILES = [{"study_level": "M1", "specialty": "Cardiologie", "objectives": ["diagnosis"]},
+                {"study_level": "Interne", "specialty": "Pneumologie", "objectives": []}]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_quiz_prefill_fills_the_quiz_bank(self):
+        backend = LocalBatchBackend(self.directory)
+        job = submit_quiz_prefill(self.PROFILES, per_profile=2, backend=backend)
+        self.assertEqual((job.status, job.backend, job.nb_items), ('SUBMITTED', 'local', 4))
+
+        self.assertTrue(poll_job(job, backend))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.nb_succeeded, job.nb_failed), ('SUCCEEDED', 4, 0))
+        self.assertGreater(job.input_tokens, 0)
+        self.assertEqual([count_quizzes(p) for p in self.PROFILES], [2, 2])
+        self.assertTrue(take_quiz(self.PROFILES[0]))
+
+    def test_poll_waits_for_the_backend(self):
+        backend = LocalBatchBackend(self.directory, latency=60)
+        job = submit_quiz_prefill(self.PROFILES[:1], backend=backend)
+        self.assertFalse(poll_job(job, backend))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'SUBMITTED')
+        self.assertEqual(count_quizzes(self.PROFILES[0]), 0)
+
+    def test_rescoring_keeps_going_when_one_line_fails(self):
+        user = User.objects.create_user(email='batch@example.com', password='secret', nom='Batch')
+        case = ClinicalCase.objects.create(title="Cas", specialty="Cardiologie", case_data=make_case_data())
+        failing, scored = (SimulationSession.objects.create(user=user, clinical_case=case, status='TERMINEE')
+                           for _ in range(2))
+
+        def responder(request):
+            if request['metadata']['key'] == f"session-{failing.id}":
+                raise RuntimeError("ligne refusée")
+            return local_responder(request)
+
+        backend = LocalBatchBackend(self.directory, responder=responder)
+        job = submit_rescoring(SimulationSession.objects.select_related('clinical_case'), backend=backend)
+        self.assertTrue(poll_job(job, backend))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.nb_succeeded, job.nb_failed), ('SUCCEEDED', 1, 1))
+        self.assertEqual(LLMBatchItem.objects.get(session=failing).error, "ligne refusée")
+        scored.refresh_from_db()
+        self.assertEqual(scored.score_rime, 50)
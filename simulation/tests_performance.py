@@ -0,0 +1,163 @@
+"""
+Budgets de requêtes SQL et de taille de réponse pour chaque route de config/urls.py.
+
+Les données sont semées par paliers croissants (sessions, messages, cas) : un budget fixe par
+endpoint fait échouer la suite dès qu'une requête par ligne (N+1) réapparaît. Le message
+d'échec liste les requêtes exécutées.
+"""
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, URLPattern, URLResolver
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+from authentication.models import User
+from clinical_cases.models import ClinicalCase
+from profiling.models import LearnerProfile
+from simulation.bench_fixtures import make_case_data, make_chat_history
+from simulation.evaluation_state import new_evaluation_state
+from simulation.llm_stub import STUB_LLM
+from simulation.models import SimulationSession, ChatMessage, ActionLog
+
+# Paliers de données : (sessions terminées, messages par session, cas cliniques)
+DATASET_SIZES = [(1, 10, 2), (10, 40, 10), (40, 200, 30)]
+
+# Budget par route : nombre max de requêtes SQL, taille max de la réponse (octets)
+BUDGETS = {
+    'admin:index': (5, 20_000),
+    'auth_register': (3, 1_000),
+    'token_obtain_pair': (1, 1_000),
+    'token_refresh': (1, 1_000),
+    'auth_me': (1, 1_000),
+    'profile_me': (3, 2_000),
+    'profile_test_generate': (4, 20_000),
+    'profile_test_submit': (3, 1_000),
+    'profile_dashboard': (3, 2_000),
+    'case_list': (2, 20_000),          # Liste non paginée : ~130 octets par cas
+    'case_detail': (2, 20_000),
+    'simu_start': (5, 2_000),         # + langue du profil (ouverture spéculative du patient)
+    'simu_detail': (4, 100_000),       # Historique complet de la session
+    'simu_message': (9, 5_000),       # Transaction du tour : état d'évaluation relu sous verrou (+ 2 savepoints en test)
+    'simu_action': (8, 2_000),        # Idem pour l'action
+    'simu_history': (2, 20_000),       # ~160 octets par session
+    'simu_metrics': (1, 20_000),
+    'simu_metrics_prometheus': (0, 200_000),
+}
+
+# Routes de l'admin Django non couvertes individuellement (seul l'index est mesuré)
+IGNORED_NAMESPACES = {'admin'}
+
+
+def route_names(patterns=None, namespace=None):
+    """Noms (avec namespace) de toutes les routes déclarées dans config/urls.py."""
+    names = set()
+    for pattern in patterns if patterns is not None else get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver):
+            names |= route_names(pattern.url_patterns, pattern.namespace or namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            names.add(f"{namespace}:{pattern.name}" if namespace else pattern.name)
+    return names
+
+
+@override_settings(
+    METRICS_TOKEN='perf-token', PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], **STUB_LLM,
+)
+class QueryBudgetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email='perf@example.com', password='secret', nom='Perf', is_staff=True)
+        LearnerProfile.objects.create(user=cls.user, study_level='M1', specialty='Cardiologie',
+                                      objectives=['diagnosis'])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {RefreshToken.for_user(self.user).access_token}")
+        self.nb_users = 0
+
+    def seed(self, nb_sessions, nb_messages, nb_cases):
+        """Complète les données jusqu'au palier demandé."""
+        for i in range(ClinicalCase.objects.count(), nb_cases):
+            ClinicalCase.objects.create(title=f"Cas {i}", specialty="Cardiologie", case_data=make_case_data())
+        case = ClinicalCase.objects.first()
+        history = make_chat_history(nb_messages)
+        finished = SimulationSession.objects.filter(user=self.user, status='TERMINEE')
+        for _ in range(finished.count(), nb_sessions):
+            session = SimulationSession.objects.create(user=self.user, clinical_case=case, status='TERMINEE',
+                                                       score_rime=70, evaluation_state=new_evaluation_state())
+            ChatMessage.objects.bulk_create(ChatMessage(session=session, **m) for m in history)
+            ActionLog.objects.bulk_create(
+                ActionLog(session=session, action_type='EXAMEN', details={"exam_name": "ECG"}) for _ in range(5)
+            )
+        return case, finished.order_by('-start_time').first()
+
+    def scenario(self, case, session):
+        """(route, méthode, chemin, données) pour chaque endpoint ; l'ordre respecte les dépendances."""
+        self.nb_users += 1
+        refresh = str(RefreshToken.for_user(self.user))
+        return [
+            ('auth_register', 'post', '/api/v1/auth/register/',
+             {"email": f"new{self.nb_users}@example.com", "nom": "Nouveau", "password": "secret"}),
+            ('token_obtain_pair', 'post', '/api/v1/auth/login/', {"email": "perf@example.com", "password": "secret"}),
+            ('token_refresh', 'post', '/api/v1/auth/refresh/', {"refresh": refresh}),
+            ('auth_me', 'get', '/api/v1/auth/me/', None),
+            ('profile_me', 'patch', '/api/v1/profiling/me/', {"motivation": "Progresser"}),
+            ('profile_test_generate', 'get', '/api/v1/profiling/test/generate/', None),
+            ('profile_test_submit', 'post', '/api/v1/profiling/test/submit/', {"answers": {"q1": "a"}}),
+            ('profile_dashboard', 'get', '/api/v1/profiling/dashboard/', None),
+            ('case_list', 'get', '/api/v1/cases/', None),
+            ('case_detail', 'get', f'/api/v1/cases/{case.uuid}/', None),
+            ('simu_start', 'post', '/api/v1/simulation/start/', {"case_uuid": str(case.uuid)}),
+            ('simu_detail', 'get', f'/api/v1/simulation/{session.uuid}/', None),
+            ('simu_message', 'post', f'/api/v1/simulation/{session.uuid}/message/',
+             {"content": "Pouvez-vous me décrire ce que vous ressentez exactement ?"}),
+            ('simu_action', 'post', f'/api/v1/simulation/{session.uuid}/action/',
+             {"action_type": "EXAMEN", "details": {"exam_name": "ECG"}}),
+            ('simu_history', 'get', '/api/v1/simulation/history/', None),
+            ('simu_metrics', 'get', '/api/v1/simulation/metrics/', None),
+        ]
+
+    def test_prometheus_metrics_budget(self):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION="Bearer perf-token")
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get('/api/v1/simulation/metrics/prometheus/')
+        self.assert_budget('simu_metrics_prometheus', response, queries, "scrape")
+
+    def assert_budget(self, route, response, queries, size_label):
+        max_queries, max_bytes = BUDGETS[route]
+        self.assertLess(response.status_code, 400, f"{route} [{size_label}] : HTTP {response.status_code}")
+        executed = [q['sql'] for q in queries.captured_queries]
+        self.assertLessEqual(
+            len(executed), max_queries,
+            f"{route} [{size_label}] : {len(executed)} requêtes SQL pour un budget de {max_queries}\n"
+            + "\n".join(f"  {i + 1}. {sql}" for i, sql in enumerate(executed))
+        )
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        self.assertLessEqual(len(body), max_bytes,
+                             f"{route} [{size_label}] : réponse de {len(body)} octets pour un maximum de {max_bytes}")
+
+    def test_every_route_has_a_budget(self):
+        missing = {
+            name for name in route_names()
+            if name.split(':')[0] not in IGNORED_NAMESPACES and name not in BUDGETS
+        }
+        self.assertFalse(missing, f"Routes sans budget de requêtes : {sorted(missing)}")
+
+    def test_api_query_budgets(self):
+        for nb_sessions, nb_messages, nb_cases in DATASET_SIZES:
+            case, session = self.seed(nb_sessions, nb_messages, nb_cases)
+            size_label = f"{nb_sessions} sessions x {nb_messages} messages, {nb_cases} cas"
+            for route, method, path, data in self.scenario(case, session):
+                with self.subTest(route=route, dataset=size_label):
+                    with CaptureQueriesContext(connection) as queries:
+                        response = getattr(self.client, method)(path, data, format='json')
+                    self.assert_budget(route, response, queries, size_label)
+
+    def test_admin_index_budget(self):
+        self.client.force_login(self.user)
+        for nb_sessions, nb_messages, nb_cases in DATASET_SIZES:
+            self.seed(nb_sessions, nb_messages, nb_cases)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/admin/')
+            self.assert_budget('admin:index', response, queries, f"{nb_sessions} sessions")
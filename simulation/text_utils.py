@@ -0,0 +1,8 @@
+import re
+import unicodedata
+
+
+def normalize_text(text):
+    """Minuscules, sans accents ni ponctuation (comparaisons et recherches par mots-clés)."""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode()
+    return " ".join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
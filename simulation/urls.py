@@ -1,5 +1,5 @@
 from django.urls import path
-from .views import StartSimulationView, GetSimulationView, SendMessageView, PerformActionView, HistoryListView
+from .views import StartSimulationView, GetSimulationView, SendMessageView, PerformActionView, HistoryListView, MetricsView, PrometheusMetricsView
 
 urlpatterns = [
     path('start/', StartSimulationView.as_view(), name='simu_start'),
@@ -7,4 +7,6 @@ urlpatterns = [
     path('<uuid:session_uuid>/message/', SendMessageView.as_view(), name='simu_message'),
     path('<uuid:session_uuid>/action/', PerformActionView.as_view(), name='simu_action'),
     path('history/', HistoryListView.as_view(), name='simu_history'),
+    path('metrics/', MetricsView.as_view(), name='simu_metrics'),
+    path('metrics/prometheus/', PrometheusMetricsView.as_view(), name='simu_metrics_prometheus'),
 ]
\ No newline at end of file
@@ -1,19 +1,83 @@
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, BasePermission
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.conf import settings
+from django.http import HttpResponse
+from django.db import transaction, IntegrityError
+from django.db.models import F
+from rest_framework.utils.encoders import JSONEncoder
 from asgiref.sync import sync_to_async
+import asyncio
+import json
+import time
+from datetime import timedelta
 
-from .models import SimulationSession, ChatMessage, ActionLog
+from .models import SimulationSession, ChatMessage, ActionLog, IdempotentRequest
 from .serializers import SimulationSessionSerializer, SimulationDetailSerializer, ChatMessageSerializer
 from clinical_cases.models import ClinicalCase
-from .llm_service import get_patient_response_async
+from profiling.models import LearnerProfile
+from .llm_service import get_patient_response_async, PatientReplyUnavailable
 from .llm_tutor import evaluate_session
+from .exam_engine import get_exam_index
+from .fast_path import answer_factual_question
+from .speculation import schedule_opening, take_opening
+from .metrics import metrics
+from .session_lock import session_turn_locks, TurnConflict
+from .model_router import model_router
+from .llm_dispatcher import llm_dispatcher
+from .admission import admission_controller, AdmissionRejected, rejected_response
+from . import profiler
+from config.db_router import ReadReplicaMixin
+from .evaluation_state import (
+    RECENT_TURNS, new_evaluation_state, has_evaluation_state,
+    update_state_with_turn, update_state_with_action
+)
+
+# Attente max d'une réponse en cours de calcul pour une même Idempotency-Key (autre worker)
+IDEMPOTENCY_WAIT_SECONDS = 30
+# Au-delà, une clé réservée sans réponse vient d'un worker tombé en plein tour : elle est reprise
+IDEMPOTENCY_STALE_SECONDS = 120
 
 from rest_framework import generics
 
+
+class AsyncAPIView(APIView):
+    """
+    APIView dont les handlers sont des coroutines.
+    DRF ne sait pas exécuter un `async def post` : on réécrit dispatch() en async
+    et on passe l'authentification / les permissions (accès BDD) par sync_to_async.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        profiler.attach_task(asyncio.current_task())
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
 class StartSimulationView(APIView):
     """Démarre une session pour un cas donné (UUID du cas en body)"""
     permission_classes = [IsAuthenticated]
@@ -27,7 +91,8 @@ class StartSimulationView(APIView):
         
         session = SimulationSession.objects.create(
             user=request.user,
-            clinical_case=clinical_case
+            clinical_case=clinical_case,
+            evaluation_state=new_evaluation_state()
         )
         
         # Message système initial
@@ -37,22 +102,33 @@ class StartSimulationView(APIView):
             content="Le patient est entré dans la salle."
         )
 
+        # Ouverture du patient générée en arrière-plan pendant que l'étudiant lit le dossier
+        language = LearnerProfile.objects.filter(user=request.user).values_list('language', flat=True).first() or 'fr'
+        schedule_opening(clinical_case.uuid, clinical_case.case_data, language)
+
         return Response(SimulationSessionSerializer(session).data, status=status.HTTP_201_CREATED)
 
 class GetSimulationView(generics.RetrieveAPIView):
     """Récupère l'état complet d'une session (Chat + Actions)"""
     permission_classes = [IsAuthenticated]
     serializer_class = SimulationDetailSerializer
-    queryset = SimulationSession.objects.all()
+    # Cas, messages et actions chargés en 3 requêtes quelle que soit la longueur de la session
+    queryset = SimulationSession.objects.select_related('clinical_case').prefetch_related('messages', 'actions')
     lookup_field = 'uuid'
 
-class SendMessageView(APIView):
+def locked_evaluation_state(session):
+    """État d'évaluation relu sous verrou de ligne (dans transaction.atomic()) : un tour de chat et une
+    action simultanés ne s'écrasent pas leurs mises à jour."""
+    return SimulationSession.objects.select_for_update().values_list('evaluation_state', flat=True).get(pk=session.pk)
+
+
+class SendMessageView(AsyncAPIView):
     permission_classes = [] 
 
     @sync_to_async
     def get_session_and_history(self, session_uuid, user):
         """Récupère tout ce dont on a besoin en un seul appel DB (ou presque)"""
-        session = get_object_or_404(SimulationSession, uuid=session_uuid, user=user)
+        session = get_object_or_404(SimulationSession.objects.select_related('clinical_case'), uuid=session_uuid, user=user)
         
         # Force la récupération des données JSON
         case_data = session.clinical_case.case_data
@@ -61,12 +137,87 @@ class SendMessageView(APIView):
         # On exclut 'system' car on le gère via system_instruction
         msgs = session.messages.exclude(role='system').order_by('timestamp')
         history = [{'role': m.role, 'content': m.content} for m in msgs]
+
+        # Langue du profil (tables du fast-path)
+        language = LearnerProfile.objects.filter(user=user).values_list('language', flat=True).first() or 'fr'
         
-        return session, case_data, history
+        return session, case_data, history, language
 
     @sync_to_async
-    def save_message(self, session, role, content):
-        return ChatMessage.objects.create(session=session, role=role, content=content)
+    def save_turn(self, session, content, ai_response, idempotency_key=None):
+        """
+        Enregistre la question, la réponse, l'état d'évaluation et la réponse d'idempotence en une
+        transaction, puis retourne le payload de l'API.
+        """
+        with transaction.atomic():
+            fields = {'turn_count': F('turn_count') + 1}
+            if has_evaluation_state(session.evaluation_state):
+                # Mise à jour incrémentale (mots-clés), sans appel LLM
+                fields['evaluation_state'] = update_state_with_turn(locked_evaluation_state(session), content)
+            # Réserve le tour suivant : échoue si un autre worker a enregistré un tour depuis la lecture de l'historique
+            if not SimulationSession.objects.filter(pk=session.pk, turn_count=session.turn_count).update(**fields):
+                raise TurnConflict()
+            # Un seul INSERT : la question n'est jamais enregistrée sans sa réponse
+            doctor_msg, patient_msg = ChatMessage.objects.bulk_create([
+                ChatMessage(session=session, role='doctor', content=content),
+                ChatMessage(session=session, role='patient', content=ai_response),
+            ])
+            payload = {
+                "doctor_message": {
+                    "role": doctor_msg.role,
+                    "content": doctor_msg.content,
+                    "timestamp": doctor_msg.timestamp
+                },
+                "patient_message": {
+                    "role": patient_msg.role,
+                    "content": patient_msg.content,
+                    "timestamp": patient_msg.timestamp
+                }
+            }
+            # Sérialisé comme le ferait DRF pour qu'un rejeu soit identique à la réponse d'origine
+            payload = json.loads(json.dumps(payload, cls=JSONEncoder))
+            if idempotency_key:
+                # Même transaction que le tour : jamais de tour enregistré avec une clé sans réponse
+                IdempotentRequest.objects.filter(session=session, key=idempotency_key).update(response=payload)
+            return payload
+
+    @sync_to_async
+    def claim_idempotency_key(self, session, key):
+        """Réserve la clé. Retourne (True, None) si on doit traiter le tour, sinon (False, réponse stockée)."""
+        # Réservation abandonnée par un worker tombé en plein tour : sans réponse, elle bloquerait la clé
+        stale_before = timezone.now() - timedelta(seconds=IDEMPOTENCY_STALE_SECONDS)
+        IdempotentRequest.objects.filter(session=session, key=key, response__isnull=True,
+                                         created_at__lt=stale_before).delete()
+        try:
+            with transaction.atomic():
+                IdempotentRequest.objects.create(session=session, key=key)
+            return True, None
+        except IntegrityError:
+            stored = IdempotentRequest.objects.filter(session=session, key=key).values_list('response', flat=True).first()
+            return False, stored
+
+    @sync_to_async
+    def get_stored_response(self, session, key):
+        return IdempotentRequest.objects.filter(session=session, key=key).values_list('response', flat=True).first()
+
+    @sync_to_async
+    def release_idempotency_key(self, session, key):
+        # Échec du tour : le client doit pouvoir réessayer avec la même clé
+        IdempotentRequest.objects.filter(session=session, key=key, response__isnull=True).delete()
+
+    async def replay(self, session, key, stored):
+        """Renvoie la réponse déjà calculée pour cette clé (éventuellement en attendant un autre worker)."""
+        waited = 0.0
+        while stored is None and waited < IDEMPOTENCY_WAIT_SECONDS:
+            await asyncio.sleep(0.1)
+            waited += 0.1
+            stored = await self.get_stored_response(session, key)
+
+        if stored is None:
+            return Response({"error": "Ce message est déjà en cours de traitement."}, status=status.HTTP_409_CONFLICT)
+
+        metrics.increment('llm_duplicate_avoided_total', reason='idempotent_replay')
+        return Response(stored, headers={'Idempotent-Replayed': 'true'})
 
     async def post(self, request, session_uuid):
         # 1. Validation basique
@@ -74,40 +225,84 @@ class SendMessageView(APIView):
         if not content:
             return Response({"error": "Message vide"}, status=400)
 
+        # Clé fournie par le client : un retry (timeout, double-clic) ne relance pas le LLM
+        idempotency_key = request.headers.get('Idempotency-Key')
+
         try:
-            # 2. Récupération contexte (DB Sync -> Async)
-            session, case_data, history = await self.get_session_and_history(session_uuid, request.user)
+            # Un seul tour à la fois par session dans ce worker, dans l'ordre d'arrivée. Entre workers,
+            # c'est turn_count qui refuse un tour calculé sur un historique périmé (TurnConflict)
+            async with session_turn_locks.hold(str(session_uuid)):
+                # 2. Récupération contexte (DB Sync -> Async)
+                session, case_data, history, language = await self.get_session_and_history(session_uuid, request.user)
 
-            # 3. Sauvegarde message User
-            doctor_msg = await self.save_message(session, 'doctor', content)
+                claimed, stored = True, None
+                if idempotency_key:
+                    claimed, stored = await self.claim_idempotency_key(session, idempotency_key)
 
-            # 4. Appel LLM (C'est ici que la magie Async opère)
-            # On ne bloque pas le thread Django principal
-            ai_response = await get_patient_response_async(case_data, history, content)
+                if claimed:
+                    try:
+                        payload = await self.run_turn(session, case_data, history, language, content, idempotency_key)
+                    except Exception:
+                        if idempotency_key:
+                            await self.release_idempotency_key(session, idempotency_key)
+                        raise
 
-            # 5. Sauvegarde réponse IA
-            patient_msg = await self.save_message(session, 'patient', ai_response)
+            if not claimed:
+                # Hors du verrou : attendre le tour d'origine ne bloque pas les tours suivants de la session
+                return await self.replay(session, idempotency_key, stored)
 
             # 6. Réponse API
-            return Response({
-                "doctor_message": {
-                    "role": doctor_msg.role, 
-                    "content": doctor_msg.content, 
-                    "timestamp": doctor_msg.timestamp
-                },
-                "patient_message": {
-                    "role": patient_msg.role, 
-                    "content": patient_msg.content, 
-                    "timestamp": patient_msg.timestamp
-                }
-            })
+            return Response(payload)
 
+        except TurnConflict:
+            return Response({"error": "Un autre message de cette session vient d'être traité, renvoyez le vôtre."},
+                            status=status.HTTP_409_CONFLICT)
+        except AdmissionRejected as e:
+            return rejected_response(e)
+        except PatientReplyUnavailable as e:
+            # Rien n'est enregistré ni mémorisé pour la clé : le client réessaie
+            return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
         except Exception as e:
             print(f"Erreur critique View: {e}")
             return Response({"error": "Erreur serveur"}, status=500)
 
+    async def run_turn(self, session, case_data, history, language, content, idempotency_key):
+        # Même question que le tour précédent, sans clé d'idempotence : probable double envoi
+        last_doctor = next((m['content'] for m in reversed(history) if m['role'] == 'doctor'), None)
+        is_duplicate = not idempotency_key and last_doctor == content
+
+        # 3. Les messages ne sont enregistrés qu'avec la réponse du patient : un tour en échec
+        # (PatientReplyUnavailable) ne laisse rien en base et peut être renvoyé tel quel
+
+        # 4. Premier tour : ouverture pré-générée (question de motif). Sinon fast-path : question
+        # factuelle dont la réponse est dans le dossier -> pas d'appel LLM
+        start = time.perf_counter()
+        ai_response = None
+        path = 'llm'
+        if not any(m['role'] == 'doctor' for m in history):
+            ai_response = await take_opening(session.clinical_case.uuid, case_data, language, content)
+            path = 'speculative' if ai_response else path
+        if not ai_response:
+            ai_response = answer_factual_question(case_data, content, language)
+            path = 'fast' if ai_response else path
+
+        if not ai_response:
+            # File LLM saturée : 503 + Retry-After plutôt qu'une attente en file (AdmissionRejected)
+            admission_controller.check('interactive')
+            # Appel LLM (C'est ici que la magie Async opère)
+            # On ne bloque pas le thread Django principal
+            ai_response = await get_patient_response_async(case_data, history, content, user_id=session.user_id)
+            if is_duplicate:
+                metrics.increment('llm_duplicate_calls_total')
+
+        metrics.increment('patient_turns_total', path=path)
+        metrics.observe('patient_reply_seconds', time.perf_counter() - start, path=path)
+
+        # 5. Sauvegarde du tour (question + réponse), avec la réponse mémorisée pour la clé
+        return await self.save_turn(session, content, ai_response, idempotency_key)
+
     
-class HistoryListView(generics.ListAPIView):
+class HistoryListView(ReadReplicaMixin, generics.ListAPIView):
     """
     Retourne la liste des simulations terminées de l'utilisateur.
     Formaté pour le tableau 'Historique de Travail' du Front.
@@ -118,7 +313,9 @@ class HistoryListView(generics.ListAPIView):
     def get_queryset(self):
         # On ne veut que les sessions de l'utilisateur courant
         # Optionnel : filtrer seulement les 'TERMINEE'
-        return SimulationSession.objects.filter(user=self.request.user).order_by('-start_time')
+        # select_related : le titre et la spécialité du cas sans une requête par ligne
+        return (SimulationSession.objects.filter(user=self.request.user)
+                .select_related('clinical_case').order_by('-start_time'))
     
     # Si le format du Front (HistoryItem) est très différent du Serializer par défaut,
     # on peut surcharger 'list' pour formater manuellement :
@@ -144,17 +341,27 @@ class HistoryListView(generics.ListAPIView):
         return Response(data)
     
 
-class PerformActionView(APIView):
-    """Enregistre une action et déclenche l'évaluation si c'est la fin."""
+class PerformActionView(AsyncAPIView):
+    """
+    Enregistre une action et déclenche l'évaluation si c'est la fin.
+    Les examens (EXAMEN) renvoient directement leur résultat depuis le dossier, sans LLM.
+    """
     permission_classes = [IsAuthenticated]
-
     # Helpers asynchrones pour la base de données
     @sync_to_async
     def get_session_data(self, session_uuid, user):
-        session = get_object_or_404(SimulationSession, uuid=session_uuid, user=user)
+        session = get_object_or_404(SimulationSession.objects.select_related('clinical_case'), uuid=session_uuid, user=user)
         # On force le chargement des relations pour éviter les erreurs sync/async
         case_data = session.clinical_case.case_data
         
+        if has_evaluation_state(session.evaluation_state):
+            # L'état incrémental résume la session : seuls les derniers échanges sont nécessaires,
+            # l'action finale (en cours) est ajoutée telle quelle par post()
+            recent = session.messages.exclude(role='system').order_by('-timestamp')[:RECENT_TURNS]
+            chat_msgs = list(reversed(recent.values('role', 'content')))
+            return session, case_data, chat_msgs, []
+
+        # Sessions antérieures à l'état incrémental : historique complet
         # Récupération historique chat
         chat_msgs = list(session.messages.all().values('role', 'content'))
         
@@ -165,7 +372,11 @@ class PerformActionView(APIView):
 
     @sync_to_async
     def save_action(self, session, action_type, details):
-        ActionLog.objects.create(session=session, action_type=action_type, details=details)
+        with transaction.atomic():
+            ActionLog.objects.create(session=session, action_type=action_type, details=details)
+            if has_evaluation_state(session.evaluation_state):
+                session.evaluation_state = update_state_with_action(locked_evaluation_state(session), action_type, details)
+                SimulationSession.objects.filter(pk=session.pk).update(evaluation_state=session.evaluation_state)
 
     @sync_to_async
     def close_session_with_score(self, session, evaluation):
@@ -186,16 +397,31 @@ class PerformActionView(APIView):
             # 1. Récupération Session
             session, case_data, chat_history, actions_log = await self.get_session_data(session_uuid, request.user)
             
-            # 2. Sauvegarde de l'action courante
+            # 2. Résultat d'examen déterministe (index du cas, pas d'appel LLM)
+            exam_result = None
+            if action_type == 'EXAMEN':
+                details = details if isinstance(details, dict) else {"exam_name": details}
+                requested = details.get('exam_name') or details.get('name') or details.get('nom')
+                exam_result = get_exam_index(session.clinical_case.uuid, case_data).resolve(requested)
+                details = {**details, "resultat": exam_result['result']}
+
+            # Le diagnostic final appelle le Tuteur : admission vérifiée avant d'enregistrer l'action
+            # (un 503 se réessaie sans doublon). Les autres actions ne sont jamais rejetées
+            if action_type == 'DIAGNOSTIC_FINAL':
+                admission_controller.check('evaluation')
+
+            # 3. Sauvegarde de l'action courante
             await self.save_action(session, action_type, details)
             
-            # 3. Si c'est la fin, on lance le Tuteur
+            # 4. Si c'est la fin, on lance le Tuteur
             if action_type == 'DIAGNOSTIC_FINAL':
                 # On ajoute l'action courante aux logs pour l'évaluation
                 actions_log.append({'type': action_type, 'details': details})
                 
                 # APPEL AU TUTEUR (Prend ~3-5 secondes)
-                evaluation = await sync_to_async(evaluate_session)(case_data, chat_history, actions_log)
+                evaluation = await sync_to_async(evaluate_session)(
+                    case_data, chat_history, actions_log, session.evaluation_state, user_id=session.user_id
+                )
                 
                 # Sauvegarde du score
                 await self.close_session_with_score(session, evaluation)
@@ -205,8 +431,69 @@ class PerformActionView(APIView):
                     "evaluation": evaluation
                 }, status=status.HTTP_200_OK)
 
+            if exam_result:
+                return Response({"status": "Action enregistrée", "exam_result": exam_result}, status=status.HTTP_200_OK)
+
             return Response({"status": "Action enregistrée"}, status=status.HTTP_200_OK)
 
+        except AdmissionRejected as e:
+            return rejected_response(e)
         except Exception as e:
             print(f"Erreur PerformAction: {e}")
-            return Response({"error": str(e)}, status=500)
\ No newline at end of file
+            return Response({"error": str(e)}, status=500)
+
+
+class MetricsView(APIView):
+    """Métriques en mémoire du worker courant (staff uniquement)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        snapshot = metrics.snapshot()
+
+        fast = metrics.counter('patient_turns_total', path='fast')
+        llm = metrics.counter('patient_turns_total', path='llm')
+        duplicates = metrics.counter('llm_duplicate_calls_total')
+        hedge_requests = metrics.counter('llm_hedge_requests_total')
+        hedges = metrics.counter('llm_hedges_total')
+        first_turns = sum(metrics.counter('speculation_first_turns_total', outcome=outcome)
+                          for outcome in ('hit', 'not_ready', 'other_intent'))
+        coalesced = {role: sum(v for k, v in snapshot['counters'].items()
+                               if k.startswith('llm_coalesced_requests_total{') and f'role="{role}"' in k)
+                     for role in ('leader', 'follower')}
+        snapshot['derived'] = {
+            "fast_path_ratio": round(fast / (fast + llm), 3) if fast + llm else None,
+            "duplicate_llm_call_ratio": round(duplicates / llm, 3) if llm else None,
+            "hedge_rate": round(hedges / hedge_requests, 3) if hedge_requests else None,
+            "hedge_win_rate": round(metrics.counter('llm_hedge_wins_total') / hedges, 3) if hedges else None,
+            # Part des appels LLM servis par un appel identique déjà en cours
+            "llm_coalescing_ratio": round(coalesced['follower'] / sum(coalesced.values()), 3)
+                                    if sum(coalesced.values()) else None,
+            "speculation_hit_rate": round(metrics.counter('speculation_first_turns_total', outcome='hit')
+                                          / first_turns, 3) if first_turns else None,
+            # Compteurs bruts du worker : une ouverture générée ici peut être servie par un autre worker,
+            # le gaspillage (générés - utilisés) ne se calcule qu'après agrégation (cf. speculation.py)
+            "speculation_tokens": {outcome: metrics.counter('speculation_tokens_total', outcome=outcome)
+                                   for outcome in ('generated', 'used')},
+        }
+        snapshot['model_tiers'] = model_router.status()
+        snapshot['llm_dispatcher'] = llm_dispatcher.status()
+        snapshot['llm_admission'] = admission_controller.status()
+        return Response(snapshot)
+
+
+class HasMetricsToken(BasePermission):
+    """Accès du scraper Prometheus : `Authorization: Bearer <METRICS_TOKEN>` (si configuré)."""
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        return bool(token) and request.headers.get('Authorization') == f"Bearer {token}"
+
+
+class PrometheusMetricsView(APIView):
+    """Compteurs et histogrammes (BDD / LLM / rendu par route...) au format texte Prometheus."""
+    authentication_classes = []
+    permission_classes = [HasMetricsToken]
+
+    def get(self, request):
+        return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+